@@ -0,0 +1,220 @@
+import sys
+import os
+import gc
+import json
+import time
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+
+import synthetic_data
+from synthetic_data import REPO_DIR
+sys.path.insert(0, os.path.join(REPO_DIR, "dashboard"))
+import methods
+import utils
+
+
+#### Benchmark ####
+# brief: Benchmark of the hot paths of the statistics pipeline (generate_statistics/methods.py) and of the loading of the
+#        results by the dashboard (dashboard/utils.py), on synthetic data so that it runs offline without SOFA nor Tracy.
+#
+# details:
+# - Stages, each timed PR_BENCH_REPEAT times (best and median kept) then run once more to measure its peak memory with
+#   tracemalloc (allocations of Python and NumPy, not counted in the timings) :
+#   - loadCVSIntoDictionary          : parse the Tracy csv files of all the executions of a FreeMotionAnimationLoop and
+#                                      a DefaultAnimationLoop scene (see synthetic_data.py)
+#   - loadCVSIntoDictionary cached   : same from their binary cache (see generate_statistics/trace_cache.py)
+#   - processFile                    : evaluate the timers files and compute the statistics of each execution
+#   - computeSingleData              : statistics of the values of all the executions of each timer, as processScene
+#   - computeSingleData bootstrap    : same with PR_BENCH_RESAMPLES bootstrap resamples (skipped if 0)
+#   - exportToCSV                    : write a statistics file of PR_BENCH_SCENES scenes
+#   - loadCSVStatistic               : parse 100 statistics files of the synthetic old_results
+#   - loadAllResults                 : parse the synthetic old_results of PR_BENCH_COMMITS commits
+#   - loadAllResults snapshot        : same from the snapshot of the parsed files (see PR_DASHBOARD_SNAPSHOT)
+# - The report is a JSON file : {"config" : {...}, "python" : ..., "numpy" : ..., "stages" : {"<stage>" : {"best" : s,
+#   "median" : s, "peakMemory" : bytes},...}}. Saved as a baseline, the next runs are compared to it : the command
+#   fails if the best time or the peak memory of a stage grew by more than maxSlowdown (0.25 = 25% by default).
+#   Timings depend on the machine, a baseline is only meaningful on the machine which recorded it. On a shared machine,
+#   increase PR_BENCH_REPEAT or maxSlowdown to absorb the noise.
+# - env (workload, a baseline can only be compared to a run with the same workload) :
+#   - PR_BENCH_STEPS          : time steps of each execution, 400 by default (the first 50 are skipped as warm up)
+#   - PR_BENCH_ZONES_PER_STEP : Tracy zones per time step, 200 by default
+#   - PR_BENCH_TRIALS         : executions of each scene, 5 by default
+#   - PR_BENCH_COMMITS        : commits in the synthetic old_results, 1000 by default
+#   - PR_BENCH_SCENES         : scenes of each statistics file, 20 by default
+#   - PR_BENCH_RESAMPLES      : bootstrap resamples, 200 by default
+#   - PR_BENCH_REPEAT         : number of timed runs of each stage, 5 by default
+#   - PR_BENCH_DIR            : folder of the synthetic data, kept and reused between runs (a temporary folder by default)
+#
+# usage:
+# - python3 benchmark.py run [<reportFile>]     : run the stages, and save the report (e.g. as baseline)
+# - python3 benchmark.py compare <baselineFile> [<maxSlowdown>] [<reportFile>]
+#                                               : run the stages and exit 1 if one of them regressed
+###################
+
+STARTING_STEP = 50
+LOAD_CSV_STATISTIC_FILES = 100
+DEFAULT_MAX_SLOWDOWN = 0.25
+
+def readConfig():
+    config = {"steps" : 400, "zonesPerStep" : 200, "trials" : 5, "commits" : 1000, "scenes" : 20, "resamples" : 200}
+    for name in config:
+        envName = "PR_BENCH_" + "".join(('_' + c) if c.isupper() else c.upper() for c in name)
+        config[name] = int(os.environ.get(envName, config[name]))
+    return config
+
+def prepareData(dataDir : str, config : dict):
+    # Generate the synthetic data in dataDir, unless it already contains the data of the same config
+    configFile = os.path.join(dataDir, "config.json")
+    try:
+        with open(configFile) as file:
+            if(json.load(file) == config):
+                return
+    except(OSError, ValueError):
+        pass
+
+    print(f"[INFO] Generating the synthetic data in {dataDir}")
+    for layout in synthetic_data.LOOP_LAYOUTS:
+        synthetic_data.writeTrials(os.path.join(dataDir, "csv"), f"{layout}Scene", layout, config["trials"], config["steps"], config["zonesPerStep"])
+    synthetic_data.generateResultsArchive(os.path.join(dataDir, "old_results"), config["commits"], config["scenes"])
+    with open(configFile, mode="w") as file:
+        json.dump(config, file)
+
+
+def makeStages(dataDir : str, config : dict):
+    # Return { "stage" : function to measure,... }, the inputs of each stage are prepared here and not measured
+    defaultTimers = methods.loadTimerFile(os.path.join(REPO_DIR, "default.timers"))
+    lagrangianTimers = methods.loadTimerFile(os.path.join(REPO_DIR, "freemotion.timers"))
+    csvDir = os.path.join(dataDir, "csv")
+    csvFiles = [os.path.join(csvDir, f"{layout}Scene_{i+1}.csv") for layout in synthetic_data.LOOP_LAYOUTS for i in range(config["trials"])]
+    cacheDir = os.path.join(dataDir, "tracy.cache")
+    resultsDir = os.path.join(dataDir, "old_results")
+    snapshotPath = os.path.join(dataDir, "results.pkl")
+    outputFile = os.path.join(dataDir, "exported.csv")
+
+    trials = [methods.loadTrial(csvFile, STARTING_STEP, cacheDir) for csvFile in csvFiles]
+    timers = [lagrangianTimers if simulationType == "FMAL" else defaultTimers for simulationType, tracyData in trials]
+    # Values of each timer of each scene, by execution
+    scenesValues = {}
+    for csvFile, (simulationType, tracyData), trialTimers in zip(csvFiles, trials, timers):
+        sceneValues = scenesValues.setdefault(os.path.basename(csvFile).rsplit('_', 1)[0], {})
+        for timer, values in methods.evaluateTimers(tracyData, trialTimers).items():
+            sceneValues.setdefault(timer, []).append(values)
+    processedData = {}
+    for sceneId in range(config["scenes"]):
+        sceneValues = list(scenesValues.values())[sceneId % len(scenesValues)]
+        processedData[f"Scene{sceneId}"] = {timer : methods.computeSingleData(np.concatenate(values), 1000000) for timer, values in sceneValues.items()}
+    resultFiles = sorted(os.path.join(resultsDir, f) for f in os.listdir(resultsDir) if f.endswith(".csv"))[:LOAD_CSV_STATISTIC_FILES]
+    utils.loadAllResults(resultsDir, snapshotPath)
+
+    def computeAllSingleData(nbResamples):
+        for sceneValues in scenesValues.values():
+            for values in sceneValues.values():
+                methods.computeSingleData(np.concatenate(values), 1000000, [len(trialValues) for trialValues in values], nbResamples)
+
+    stages = {}
+    stages["loadCVSIntoDictionary"] = lambda : [methods.loadCVSIntoDictionary(csvFile, STARTING_STEP) for csvFile in csvFiles]
+    stages["loadCVSIntoDictionary cached"] = lambda : [methods.loadCVSIntoDictionary(csvFile, STARTING_STEP, cacheDir) for csvFile in csvFiles]
+    stages["processFile"] = lambda : [methods.processFile(tracyData, trialTimers) for (simulationType, tracyData), trialTimers in zip(trials, timers)]
+    stages["computeSingleData"] = lambda : computeAllSingleData(0)
+    if(config["resamples"] > 0):
+        stages["computeSingleData bootstrap"] = lambda : computeAllSingleData(config["resamples"])
+    stages["exportToCSV"] = lambda : methods.exportToCSV(processedData, outputFile, [defaultTimers, lagrangianTimers])
+    stages["loadCSVStatistic"] = lambda : [utils.loadCSVStatistic(resultFile) for resultFile in resultFiles]
+    stages["loadAllResults"] = lambda : utils.loadAllResults(resultsDir)
+    stages["loadAllResults snapshot"] = lambda : utils.loadAllResults(resultsDir, snapshotPath)
+    return stages
+
+def measureStage(stage, nbRepeat : int):
+    # Return {"best" : s, "median" : s, "peakMemory" : bytes}
+    durations = []
+    for i in range(nbRepeat):
+        gc.collect()
+        start = time.perf_counter()
+        stage()
+        durations.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    startMemory = tracemalloc.get_traced_memory()[0]
+    stage()
+    peakMemory = tracemalloc.get_traced_memory()[1] - startMemory
+    tracemalloc.stop()
+    return {"best" : min(durations), "median" : float(np.median(durations)), "peakMemory" : peakMemory}
+
+def runBenchmark():
+    config = readConfig()
+    nbRepeat = max(1, int(os.environ.get("PR_BENCH_REPEAT", "5")))
+    dataDir = os.environ.get("PR_BENCH_DIR")
+    temporaryDir = None
+    if(not dataDir):
+        temporaryDir = tempfile.TemporaryDirectory(prefix="sofa-benchmark-")
+        dataDir = temporaryDir.name
+    os.makedirs(dataDir, exist_ok=True)
+
+    prepareData(dataDir, config)
+    report = {"config" : config, "python" : platform.python_version(), "numpy" : np.__version__, "stages" : {}}
+    print(f"{'stage':<32}{'best':>12}{'median':>12}{'peak memory':>14}")
+    for name, stage in makeStages(dataDir, config).items():
+        report["stages"][name] = measureStage(stage, nbRepeat)
+        result = report["stages"][name]
+        print(f"{name:<32}{result['best']*1000:>9.1f} ms{result['median']*1000:>9.1f} ms{result['peakMemory']/2**20:>11.1f} MB")
+
+    if(temporaryDir is not None):
+        temporaryDir.cleanup()
+    return report
+
+def checkBaselineConfig(baseline : dict, config : dict):
+    if(baseline.get("config") != config):
+        print(f"[ERROR] checkBaselineConfig : the baseline was recorded with another workload {baseline.get('config')} than {config}, set the same PR_BENCH_ variables or record it again.")
+        exit(1)
+
+def compareReports(report : dict, baseline : dict, maxSlowdown : float):
+    # Return the list of the regressions of report compared to baseline
+    regressions = []
+    print(f"{'stage':<32}{'time':>10}{'memory':>10}   (ratio to the baseline, regression above {1 + maxSlowdown:.2f})")
+    for name, result in report["stages"].items():
+        if(name not in baseline["stages"]):
+            print(f"[WARNING] The stage {name} isn't in the baseline, it is not compared.")
+            continue
+        timeRatio = result["best"] / max(baseline["stages"][name]["best"], 1e-9)
+        memoryRatio = result["peakMemory"] / max(baseline["stages"][name]["peakMemory"], 1)
+        status = ""
+        if(timeRatio > 1 + maxSlowdown):
+            regressions.append(f"{name} is {timeRatio:.2f} times slower")
+            status += " SLOWER"
+        if(memoryRatio > 1 + maxSlowdown):
+            regressions.append(f"{name} uses {memoryRatio:.2f} times more memory")
+            status += " MORE MEMORY"
+        print(f"{name:<32}{timeRatio:>10.2f}{memoryRatio:>10.2f}{status}")
+    return regressions
+
+def saveReport(report : dict, reportFile : str):
+    with open(reportFile, mode="w") as file:
+        json.dump(report, file, indent=2)
+    print(f"[INFO] Report saved in {reportFile}")
+
+
+if __name__=="__main__":
+    if((len(sys.argv) >= 2) and (sys.argv[1] == "run")):
+        report = runBenchmark()
+        if(len(sys.argv) >= 3):
+            saveReport(report, sys.argv[2])
+    elif((len(sys.argv) >= 3) and (sys.argv[1] == "compare")):
+        with open(sys.argv[2]) as file:
+            baseline = json.load(file)
+        maxSlowdown = float(sys.argv[3]) if len(sys.argv) >= 4 else DEFAULT_MAX_SLOWDOWN
+        checkBaselineConfig(baseline, readConfig())
+        report = runBenchmark()
+        if(len(sys.argv) >= 5):
+            saveReport(report, sys.argv[4])
+        regressions = compareReports(report, baseline, maxSlowdown)
+        if(len(regressions) > 0):
+            for regression in regressions:
+                print(f"[ERROR] Performance regression : {regression} than the baseline {sys.argv[2]}")
+            exit(1)
+    else:
+        print("usage : python3 benchmark.py run [<reportFile>]")
+        print("        python3 benchmark.py compare <baselineFile> [<maxSlowdown>] [<reportFile>]")
+        exit(1)
@@ -0,0 +1,195 @@
+import sys
+import os
+import datetime
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, os.path.join(REPO_DIR, "generate_statistics"))
+from methods import STATISTICS_NAMES, loadTimerFile, exportToCSV
+
+
+#### Synthetic data ####
+# brief: Generators of the inputs of the statistics pipeline and of the dashboard, to benchmark them without SOFA nor Tracy.
+#
+# details:
+# - Tracy traces : csv files with the columns of 'tracy-csvexport -u', one row per zone occurence, grouped by zone as
+#   tracy-csvexport does. Each time step is a "Simulation::animate" zone followed by the zones of the animation loop :
+#   - "fm"      : FreeMotionAnimationLoop, the zones used by freemotion.timers ("UpdateBBox" in FreeMotionAnimationLoop.cpp)
+#   - "default" : DefaultAnimationLoop, the zones used by default.timers ("UpdateBBox" in DefaultAnimationLoop.cpp)
+#   completed by filler zones up to zonesPerStep zones per step. Durations follow a log-normal distribution per zone with
+#   rare spikes (1% of the occurences 5 to 20 times longer), as in the traces of a loaded machine. "CollisionReset" is
+#   also called once before the first step, as SOFA does.
+# - Results archive : the content of old_results for nbCommits commits, one statistics file per commit named
+#   <hash>_YYYY-MM-DD_hh-mm-ss.csv (written by exportToCSV as process_csv.py does) with its .info file, plus one release
+#   vXX.YY.csv (year and month of the commit) every 100 commits. The mean of each timer of each scene follows a random
+#   walk with a few steps (regressions and improvements) over the commits. "CollisionDetection" is missing in a third of
+#   the scenes.
+# - Everything is drawn from a seeded generator : the same parameters give the same files.
+#
+# usage:
+# - python3 synthetic_data.py trace <csvFile> <fm|default> [<steps> [<zonesPerStep> [<seed>]]]
+# - python3 synthetic_data.py trials <csvDir> <sceneName> <fm|default> <nbTrials> [<steps> [<zonesPerStep>]]
+#       writes <csvDir>/<sceneName>_1.csv ... <csvDir>/<sceneName>_<nbTrials>.csv as extract-results.sh does
+# - python3 synthetic_data.py results <resultsDir> <nbCommits> [<nbScenes>]
+########################
+
+TRACY_HEADER = "name,src_file,src_line,ns_since_start,exec_time_ns,thread"
+
+# Zones of one time step : (name, CPP file, calls per step, median duration in ns)
+LOOP_LAYOUTS = {
+    "fm" : [("CollisionBeginEvent", "FreeMotionAnimationLoop.cpp", 1, 2000),
+            ("collision", "CollisionPipeline.cpp", 1, 250000),
+            ("CollisionEndEvent", "FreeMotionAnimationLoop.cpp", 1, 2000),
+            ("FreeMotion", "FreeMotionAnimationLoop.cpp", 1, 400000),
+            ("ComputeForce", "MechanicalOperations.cpp", 2, 60000),
+            ("ComputeRHTerm", "EulerImplicitSolver.cpp", 1, 90000),
+            ("setSystemMBKMatrix", "MatrixLinearSolver.inl", 1, 120000),
+            ("SolveConstraint", "ConstraintSolverImpl.cpp", 1, 300000),
+            ("PrepareState", "ConstraintSolverImpl.cpp", 1, 20000),
+            ("BuildSystem", "ConstraintSolverImpl.cpp", 1, 150000),
+            ("SolveSystem", "ConstraintSolverImpl.cpp", 1, 100000),
+            ("ApplyCorrection", "ConstraintSolverImpl.cpp", 1, 30000),
+            ("ProjectAndPropagateDx", "ConstraintCorrection.cpp", 1, 15000),
+            ("ProjectAndPropagateXAndV", "FreeMotionAnimationLoop.cpp", 1, 25000),
+            ("UpdateBBox", "FreeMotionAnimationLoop.cpp", 1, 5000)],
+    "default" : [("collision", "CollisionPipeline.cpp", 1, 200000),
+                 ("solve", "EulerImplicitSolver.cpp", 1, 500000),
+                 ("ComputeForce", "MechanicalOperations.cpp", 2, 60000),
+                 ("ComputeRHTerm", "EulerImplicitSolver.cpp", 1, 90000),
+                 ("setSystemMBKMatrix", "MatrixLinearSolver.inl", 1, 120000),
+                 ("MBKSolve", "MatrixLinearSolver.inl", 1, 150000),
+                 ("projectPositionAndVelocity", "DefaultAnimationLoop.cpp", 1, 10000),
+                 ("propagateOnlyPositionAndVelocity", "DefaultAnimationLoop.cpp", 1, 20000),
+                 ("UpdateBBox", "DefaultAnimationLoop.cpp", 1, 5000)],
+}
+FILLER_MEDIAN_DURATION = 3000
+GAP_NS = 200
+
+def _stepLayout(layout : str, zonesPerStep : int):
+    # Return (names, files, zoneIds of the occurences of one step, median durations of the occurences)
+    if(layout not in LOOP_LAYOUTS):
+        print(f"[ERROR] synthetic_data : unknown loop layout {layout}, expected one of {list(LOOP_LAYOUTS)}")
+        exit(1)
+    names = ["Simulation::animate", "CollisionReset"]
+    files = ["Simulation.cpp", "CollisionPipeline.cpp"]
+    zoneIds = []
+    medians = []
+    for name, fileName, nbCalls, median in LOOP_LAYOUTS[layout]:
+        names.append(name)
+        files.append(fileName)
+        zoneIds += [len(names) - 1]*nbCalls
+        medians += [median]*nbCalls
+    for i in range(max(0, zonesPerStep - 1 - len(zoneIds))):
+        names.append(f"Component{i}::update")
+        files.append(f"Component{i}.cpp")
+        zoneIds.append(len(names) - 1)
+        medians.append(FILLER_MEDIAN_DURATION)
+    return names, files, np.array(zoneIds, dtype=np.int64), np.array(medians, dtype=np.float64)
+
+def generateTracyColumns(layout : str = "fm", steps : int = 400, zonesPerStep : int = 200, seed : int = 0):
+    # Same output as loadTracyColumns (generate_statistics/methods.py) :
+    # (zoneNames, zoneFiles, zoneCodes, timestamps, durations), rows sorted by timestamp
+    names, files, zoneIds, medians = _stepLayout(layout, zonesPerStep)
+    rng = np.random.default_rng(seed)
+
+    # Durations of the occurences of each step : (steps x occurences of a step)
+    durations = medians * rng.lognormal(0, 0.25, (steps, len(zoneIds)))
+    spikes = rng.random(durations.shape) < 0.01
+    durations[spikes] *= rng.uniform(5, 20, np.count_nonzero(spikes))
+    durations = np.maximum(durations.astype(np.int64), 1)
+
+    # The occurences of a step follow each other, the step starts GAP_NS before the first one and ends after the last one
+    ends = np.cumsum(durations + GAP_NS, axis=1)
+    stepDurations = ends[:, -1] + GAP_NS
+    initDuration = 1000000
+    stepStarts = initDuration + np.concatenate(([0], np.cumsum(stepDurations + 5*GAP_NS)[:-1]))
+    timestamps = stepStarts[:, None] + GAP_NS + ends - durations
+
+    zoneCodes = np.concatenate(([names.index("CollisionReset")], np.column_stack((np.zeros(steps, dtype=np.int64), np.broadcast_to(zoneIds, (steps, len(zoneIds))))).ravel()))
+    allTimestamps = np.concatenate(([initDuration//2], np.column_stack((stepStarts, timestamps)).ravel()))
+    allDurations = np.concatenate(([rng.integers(1000, 5000)], np.column_stack((stepDurations, durations)).ravel()))
+    return names, files, zoneCodes.astype(np.int32), allTimestamps, allDurations
+
+def writeTracyCSV(csvFileName : str, layout : str = "fm", steps : int = 400, zonesPerStep : int = 200, seed : int = 0):
+    zoneNames, zoneFiles, zoneCodes, timestamps, durations = generateTracyColumns(layout, steps, zonesPerStep, seed)
+    # tracy-csvexport writes all the occurences of a zone, then the ones of the next zone
+    order = np.argsort(zoneCodes, kind='stable')
+    lines = [TRACY_HEADER]
+    lines += [f"{zoneNames[code]},{zoneFiles[code]},{10 + code},{timestamp},{duration},1"
+              for code, timestamp, duration in zip(zoneCodes[order].tolist(), timestamps[order].tolist(), durations[order].tolist())]
+    with open(csvFileName, mode="w") as csvfile:
+        csvfile.write("\n".join(lines) + "\n")
+
+def writeTrials(csvDir : str, sceneName : str, layout : str = "fm", nbTrials : int = 5, steps : int = 400, zonesPerStep : int = 200, seed : int = 0):
+    # Return the list of the csv files, named as the ones of extract-results.sh
+    os.makedirs(csvDir, exist_ok=True)
+    fileNames = []
+    for i in range(nbTrials):
+        fileNames.append(os.path.join(csvDir, f"{sceneName}_{i+1}.csv"))
+        writeTracyCSV(fileNames[-1], layout, steps, zonesPerStep, seed*1000 + i)
+    return fileNames
+
+
+def _timerNames():
+    # Timers of the statistics files, as written by process_csv.py
+    defaultTimers = loadTimerFile(os.path.join(REPO_DIR, "default.timers"))
+    lagrangianTimers = loadTimerFile(os.path.join(REPO_DIR, "freemotion.timers"))
+    return defaultTimers, lagrangianTimers
+
+def _singleData(mean : np.ndarray, cardinality : int):
+    # Statistics in the order of STATISTICS_NAMES for a timer of mean 'mean' (ms)
+    std = 0.1*mean
+    return [0.7*mean, 3*mean, mean, std, mean - 0.6*std, mean - 0.1*std, mean + 0.7*std, cardinality]
+
+def generateResultsArchive(resultsDir : str, nbCommits : int = 1000, nbScenes : int = 20, seed : int = 0):
+    # Return the list of the statistics files written in resultsDir
+    os.makedirs(resultsDir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    defaultTimers, lagrangianTimers = _timerNames()
+    scenes = [(f"Scene{i}", lagrangianTimers if i % 2 == 0 else defaultTimers, i % 3 == 1) for i in range(nbScenes)]
+    timersDicts = [defaultTimers, lagrangianTimers, {"CPUUsage" : None}]
+
+    # Mean of each timer of each scene for each commit : random walk with a step every ~200 commits
+    nbTimers = len(set(defaultTimers) | set(lagrangianTimers))
+    walk = rng.normal(0, 0.005, (nbCommits, nbScenes, nbTimers))
+    steps = rng.random((nbCommits, nbScenes, 1)) < 0.005
+    walk += steps*rng.normal(0, 0.1, (nbCommits, nbScenes, 1))
+    means = rng.uniform(0.01, 2, (1, nbScenes, nbTimers)) * np.exp(np.cumsum(walk, axis=0))
+    timerIds = {timer : i for i, timer in enumerate(dict.fromkeys([*defaultTimers, *lagrangianTimers]))}
+
+    lastDate = datetime.datetime(2026, 1, 1)
+    dates = [lastDate - datetime.timedelta(hours=int(hours)) for hours in np.cumsum(rng.integers(1, 24, nbCommits))[::-1]]
+    fileNames = []
+    releaseNames = set()
+    for commitId in range(nbCommits):
+        processedData = {}
+        for sceneId, (sceneName, timers, hasNoCollision) in enumerate(scenes):
+            processedData[sceneName] = {timer : _singleData(float(means[commitId, sceneId, timerIds[timer]]), 1000)
+                                        for timer in timers if not (hasNoCollision and timer == "CollisionDetection")}
+            processedData[sceneName]["CPUUsage"] = _singleData(float(rng.uniform(95, 100)), 5)
+
+        releaseName = f"v{dates[commitId].year % 100:02d}.{dates[commitId].month:02d}"
+        if((commitId % 100 == 99) and (releaseName not in releaseNames)):
+            releaseNames.add(releaseName)
+            outputFileName = releaseName
+        else:
+            outputFileName = f"{rng.bytes(20).hex()}_{dates[commitId].strftime('%Y-%m-%d_%H-%M-%S')}"
+        exportToCSV(processedData, os.path.join(resultsDir, outputFileName + ".csv"), timersDicts, STATISTICS_NAMES)
+        with open(os.path.join(resultsDir, outputFileName.split('_')[0] + ".info"), mode="w") as infoFile:
+            infoFile.write("System:\n  Synthetic results generated by benchmarks/synthetic_data.py\n")
+        fileNames.append(os.path.join(resultsDir, outputFileName + ".csv"))
+    return fileNames
+
+
+if __name__=="__main__":
+    if((len(sys.argv) >= 4) and (sys.argv[1] == "trace")):
+        writeTracyCSV(sys.argv[2], sys.argv[3], *[int(value) for value in sys.argv[4:7]])
+    elif((len(sys.argv) >= 6) and (sys.argv[1] == "trials")):
+        writeTrials(sys.argv[2], sys.argv[3], sys.argv[4], *[int(value) for value in sys.argv[5:8]])
+    elif((len(sys.argv) >= 4) and (sys.argv[1] == "results")):
+        generateResultsArchive(sys.argv[2], *[int(value) for value in sys.argv[3:5]])
+    else:
+        print("usage : python3 synthetic_data.py trace <csvFile> <fm|default> [<steps> [<zonesPerStep> [<seed>]]]")
+        print("        python3 synthetic_data.py trials <csvDir> <sceneName> <fm|default> <nbTrials> [<steps> [<zonesPerStep>]]")
+        print("        python3 synthetic_data.py results <resultsDir> <nbCommits> [<nbScenes>]")
+        exit(1)
@@ -0,0 +1,168 @@
+import io
+import gzip
+import json
+import hashlib
+import datetime
+
+import numpy as np
+from flask import Blueprint, Response, request
+import utils
+from utils import STATISTICS_NAMES
+
+
+#### Query API ####
+# brief: Read-only HTTP API on the Flask server of the dashboard, giving the commits, scenes, timers and statistics of
+#        the loaded results to the other tools (PR bots, nightly reports) without parsing old_results themselves.
+#
+# details:
+# - Every endpoint takes the query parameters :
+#   - type     : 'commits' (default) or 'releases'
+#   - since    : ISO date, the results older than it are ignored (all by default)
+#   - until    : ISO date, the results more recent than it are ignored (none by default)
+#   - interval : one commit every interval commits, starting from the most recent one (1 by default)
+# - GET /api/v1/commits                       : {"hash" : [...], "date" : [...], "isRelease" : [...]} sorted by date
+# - GET /api/v1/scenes                        : {"scenes" : [...]} scenes with results in the commits
+# - GET /api/v1/timers?scene=<scene>          : {"timers" : [...]} timers of the scene in the commits
+# - GET /api/v1/series?scene=<scene>&timer=<timer>[&statistics=mean,std][&format=npz]
+#       the statistics (see utils.STATISTICS_NAMES, all by default) of the timer for the commits where it has been
+#       computed, by columns : {"hash" : [...], "date" : [...], "<statistic>" : [...]}. With format=npz, the same
+#       columns as numpy arrays in a npz file (np.load(io.BytesIO(response.content))).
+# - The responses have a strong ETag computed from the dataId of the results and the query : a request with the same
+#   If-None-Match gets a '304 Not Modified' without any computation as long as no result has been ingested. The
+#   responses are compressed with gzip when the client accepts it.
+# - Invalid parameters give a 400, unknown scene or timer a 404, with {"error" : "<message>"}.
+#
+# usage:
+#   server.register_blueprint(createApi(lambda : resultsWatcher.results))
+#   curl --compressed 'http://127.0.0.1:8050/api/v1/series?scene=<scene>&timer=<timer>&since=2025-01-01'
+###################
+
+API_PREFIX = "/api/v1"
+GZIP_MIN_SIZE = 512
+
+class ApiError(Exception):
+    def __init__(self, status : int, message : str):
+        super().__init__(message)
+        self.status = status
+
+
+def _parseDate(name : str, default : datetime.datetime):
+    value = request.args.get(name)
+    if(not value):
+        return default
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except(ValueError):
+        raise ApiError(400, f"{name} is not in iso format : 'YYYY-MM-DD HH:MM:SS' time is optional")
+
+def _selectCommits(results):
+    # Return the tensor of the type and the ids of the commits selected by since, until and interval, sorted by date
+    dataType = request.args.get("type", "commits")
+    if(dataType not in ("commits", "releases")):
+        raise ApiError(400, "type must be 'commits' or 'releases'")
+    try:
+        interval = int(request.args.get("interval", 1))
+    except(ValueError):
+        raise ApiError(400, "interval must be an integer")
+    since = _parseDate("since", datetime.datetime.min)
+    until = _parseDate("until", None)
+
+    tensor = results.releaseTensor if dataType == "releases" else results.commitTensor
+    return tensor, utils.computeCommitListIdInDataList(tensor, since, interval, until)
+
+def _getName(names : dict, parameter : str):
+    name = request.args.get(parameter)
+    if(name is None):
+        raise ApiError(400, f"{parameter} is required")
+    if(name not in names):
+        raise ApiError(404, f"no {parameter} named {name}")
+    return name
+
+def _toJson(columns : dict):
+    # NaN isn't valid JSON, missing statistics are null
+    for name, column in columns.items():
+        if(isinstance(column, np.ndarray) and (column.dtype.kind == 'f')):
+            columns[name] = [None if np.isnan(value) else value for value in column.tolist()]
+        elif(isinstance(column, np.ndarray)):
+            columns[name] = column.tolist()
+    return json.dumps(columns, separators=(',', ':'), allow_nan=False).encode(), "application/json"
+
+def _toNpz(columns : dict):
+    buffer = io.BytesIO()
+    np.savez(buffer, **columns)
+    return buffer.getvalue(), "application/octet-stream"
+
+
+def getCommits(results):
+    tensor, ids = _selectCommits(results)
+    commits = tensor.commits[np.asarray(ids, dtype=np.int64)]
+    return _toJson({"hash" : commits['hash'], "date" : commits['date'].astype(str), "isRelease" : commits['isRelease']})
+
+def getScenes(results):
+    tensor, ids = _selectCommits(results)
+    return _toJson({"scenes" : sorted(utils.getUniqueSetOfScenes(tensor, ids))})
+
+def getTimers(results):
+    tensor, ids = _selectCommits(results)
+    sceneName = _getName(tensor.sceneIds, "scene")
+    return _toJson({"timers" : sorted(utils.getUniqueSetOfLabels(tensor, ids, sceneName))})
+
+def getSeries(results):
+    tensor, ids = _selectCommits(results)
+    sceneName = _getName(tensor.sceneIds, "scene")
+    timerName = _getName(tensor.timerIds, "timer")
+    statistics = request.args.get("statistics")
+    statistics = statistics.split(',') if statistics else STATISTICS_NAMES
+    for statistic in statistics:
+        if(statistic not in STATISTICS_NAMES):
+            raise ApiError(400, f"unknown statistic {statistic}, available : {','.join(STATISTICS_NAMES)}")
+    outputFormat = request.args.get("format", "json")
+    if(outputFormat not in ("json", "npz")):
+        raise ApiError(400, "format must be 'json' or 'npz'")
+
+    ids = np.asarray(ids, dtype=np.int64)
+    ids = ids[tensor.present(ids, sceneName)[:, tensor.timerIds[timerName]]]
+    values = tensor.values[ids, tensor.sceneIds[sceneName], tensor.timerIds[timerName]]
+    columns = {"hash" : tensor.commits['hash'][ids], "date" : tensor.commits['date'][ids]}
+    for statistic in statistics:
+        columns[statistic] = values[:, STATISTICS_NAMES.index(statistic)]
+
+    if(outputFormat == "npz"):
+        return _toNpz(columns)
+    columns["date"] = columns["date"].astype(str)
+    return _toJson(columns)
+
+
+def _respond(getResults, compute):
+    results = getResults()
+    query = sorted(request.args.items(multi=True))
+    etag = hashlib.blake2b(repr((results.dataId, request.path, query)).encode(), digest_size=16).hexdigest()
+    useGzip = "gzip" in request.accept_encodings
+
+    # The compressed and plain representations have different strong ETags
+    matchingEtags = [tag for tag in (etag, f"{etag}-gzip") if request.if_none_match.contains(tag)]
+    if(len(matchingEtags) != 0):
+        response = Response(status=304)
+        response.set_etag(matchingEtags[-1] if useGzip else matchingEtags[0])
+    else:
+        try:
+            body, mimetype = compute(results)
+        except(ApiError) as error:
+            return Response(json.dumps({"error" : str(error)}), status=error.status, mimetype="application/json")
+        response = Response(body, mimetype=mimetype)
+        if(useGzip and (len(body) >= GZIP_MIN_SIZE)):
+            response.set_data(gzip.compress(body, compresslevel=6))
+            response.headers["Content-Encoding"] = "gzip"
+            response.set_etag(f"{etag}-gzip")
+        else:
+            response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
+
+def createApi(getResults):
+    # getResults() returns the current LoadedResults (see results_watcher.py), called once per request
+    api = Blueprint("api", __name__, url_prefix=API_PREFIX)
+    for name, compute in (("commits", getCommits), ("scenes", getScenes), ("timers", getTimers), ("series", getSeries)):
+        api.add_url_rule(f"/{name}", name, lambda compute=compute : _respond(getResults, compute), methods=["GET"])
+    return api
@@ -0,0 +1,194 @@
+import sys
+import os
+import numpy as np
+import utils
+from utils import StatTensor
+
+
+#### Change points ####
+# brief: Offline detection of the performance changes in the history of the commits, for each scene x timer.
+#
+# details:
+# - Each scene x timer is a time series of the medians of the commits sorted by date. The spread reported by each commit
+#   (interquartile range) defines the weight of its median : w = 1/spread^2, normalized to a mean of 1 in each series
+#   and bounded in [1/MAX_WEIGHT_RATIO, MAX_WEIGHT_RATIO].
+# - Change points are found by weighted binary segmentation on the mean of the series : a segment is split where the
+#   weighted sum of squared errors decreases the most. The decrease is normalized by the noise of the series (estimated
+#   from the median absolute deviation of the differences between consecutive commits), and the split is kept if it is
+#   greater than penalty*log(n) and if the relative change between both sides is greater than minRelativeChange.
+# - All the series are processed together : at each level of the segmentation, the gains of all candidate splits of all
+#   segments of all series are computed at once from cumulative sums.
+#######################
+
+# CPUUsage is a load percentage sampled on a few values, not a timer : its noise can't be estimated the same way
+IGNORED_TIMERS = ["CPUUsage"]
+# Lowest noise of a series relative to its median level, for series with a lot of identical consecutive values
+MIN_RELATIVE_NOISE = 0.005
+# Bounds of the normalized weights, so that a single commit with a tiny spread can't dominate a segment
+MAX_WEIGHT_RATIO = 10.0
+
+QUARTILE1, QUARTILE2, QUARTILE3 = (utils.STATISTICS_NAMES.index(name) for name in ("quartile1", "quartile2", "quartile3"))
+
+class ChangePoint():
+    sceneName : str
+    timerName : str
+    commitId : int        # Index in the data list of the first commit after the change
+    fullHash : str
+    before : float        # Weighted mean of the medians before the change (ms)
+    after : float         # Weighted mean of the medians after the change (ms)
+    relativeChange : float
+    score : float         # Normalized decrease of the cost, the higher the more significant
+
+    def __init__(self, sceneName:str, timerName:str, commitId:int, fullHash:str, before:float, after:float, score:float):
+        self.sceneName      = sceneName
+        self.timerName      = timerName
+        self.commitId       = commitId
+        self.fullHash       = fullHash
+        self.before         = before
+        self.after          = after
+        self.relativeChange = (after - before)/before if before != 0 else np.inf
+        self.score          = score
+
+    def isRegression(self):
+        # Timers are computation times, a regression is an increase
+        return self.after > self.before
+
+    def __repr__(self):
+        return f"ChangePoint({self.sceneName}, {self.timerName}, {self.fullHash[:7]}, {100*self.relativeChange:+.1f}%, score={self.score:.1f})"
+
+
+def buildSeriesMatrix(tensor : StatTensor, sortedIdx : list[int], timers : list[str] = None):
+    # Return (series, medians, spreads)
+    # - series  : list of (sceneName, timerName)
+    # - medians : np array (series x commits sorted by date), NaN if the commit doesn't have this scene/timer
+    # - spreads : np array of the interquartile ranges, same shape
+    timerIds = [timerId for timerId, timerName in enumerate(tensor.timerNames)
+                if((timerName not in IGNORED_TIMERS) and ((timers is None) or (timerName in timers)))]
+
+    # (commits x scenes x timers x statistics) -> (scenes x timers x commits) for each statistic
+    values = tensor.values[np.asarray(sortedIdx, dtype=np.int64)][:, :, timerIds]
+    nbScenes = values.shape[1]
+    medians = np.moveaxis(values[..., QUARTILE2], 0, -1).reshape(nbScenes*len(timerIds), len(sortedIdx))
+    spreads = np.moveaxis(values[..., QUARTILE3] - values[..., QUARTILE1], 0, -1).reshape(nbScenes*len(timerIds), len(sortedIdx))
+
+    # Only the series with at least one value
+    kept = np.flatnonzero(np.any(~np.isnan(medians), axis=1))
+    series = [(tensor.sceneNames[i//len(timerIds)], tensor.timerNames[timerIds[i%len(timerIds)]]) for i in kept.tolist()]
+
+    return series, medians[kept], spreads[kept]
+
+
+def _estimateNoise(values : np.ndarray, valid : np.ndarray):
+    # Noise of each series from the median absolute deviation of the differences between consecutive valid points
+    noise = np.ones(len(values))
+    for i in range(len(values)):
+        differences = np.diff(values[i][valid[i]])
+        if(len(differences) > 1):
+            mad = np.median(np.abs(differences - np.median(differences)))
+            noise[i] = 1.4826*mad/np.sqrt(2)
+        if(np.any(valid[i])):
+            noise[i] = max(noise[i], MIN_RELATIVE_NOISE*np.median(np.abs(values[i][valid[i]])), 1e-12)
+    return noise
+
+
+def detectChangePoints(tensor : StatTensor, sortedIdx : list[int], timers : list[str] = None,
+                       penalty : float = 3.0, minSize : int = 3, minRelativeChange : float = 0.02):
+    # Return the list of ChangePoint of all scene x timer series, ranked by decreasing score
+    series, medians, spreads = buildSeriesMatrix(tensor, sortedIdx, timers)
+    nbSeries, nbCommits = medians.shape
+    if(nbSeries == 0):
+        return []
+
+    valid = ~np.isnan(medians)
+    values = np.where(valid, medians, 0.0)
+
+    # Weights from the reported spread, normalized per series. Commits without spread get the mean weight.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.where(valid & (spreads > 0), 1/np.square(spreads), np.nan)
+        meanWeights = np.nanmean(weights, axis=1, keepdims=True)
+    meanWeights = np.where(np.isnan(meanWeights), 1.0, meanWeights)
+    weights = np.clip(np.where(np.isnan(weights), meanWeights, weights)/meanWeights, 1/MAX_WEIGHT_RATIO, MAX_WEIGHT_RATIO)
+    weights = np.where(valid, weights, 0.0)
+
+    noise = _estimateNoise(medians, valid)
+
+    # Cumulative sums used to compute the cost of any segment [a,b) : sum(w*y^2) - sum(w*y)^2/sum(w)
+    zeros = np.zeros((nbSeries, 1))
+    sumW   = np.hstack((zeros, np.cumsum(weights, axis=1)))
+    sumWY  = np.hstack((zeros, np.cumsum(weights*values, axis=1)))
+    sumWY2 = np.hstack((zeros, np.cumsum(weights*values*values, axis=1)))
+    sumN   = np.hstack((zeros, np.cumsum(valid, axis=1)))
+
+    def segmentStats(s, a, b):
+        w = sumW[s, b] - sumW[s, a]
+        wy = sumWY[s, b] - sumWY[s, a]
+        wy2 = sumWY2[s, b] - sumWY2[s, a]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cost = np.where(w > 0, wy2 - np.square(wy)/w, 0.0)
+            mean = np.where(w > 0, wy/w, np.nan)
+        return cost, mean, sumN[s, b] - sumN[s, a]
+
+    thresholds = penalty*np.log(np.maximum(sumN[:, -1], 2))
+
+    # Segments of the current level : (series, start, end)
+    segS = np.flatnonzero(sumN[:, -1] >= 2*minSize)
+    segA = np.zeros(len(segS), dtype=np.int64)
+    segB = np.full(len(segS), nbCommits, dtype=np.int64)
+
+    found = []
+    while len(segS) > 0:
+        maxLength = int(np.max(segB - segA))
+        splits = segA[:, None] + np.arange(1, max(maxLength, 2))[None, :]
+        inside = splits < segB[:, None]
+        splits = np.minimum(splits, segB[:, None])
+        s = segS[:, None]
+
+        fullCost, fullMean, fullN = segmentStats(segS, segA, segB)
+        leftCost, leftMean, leftN = segmentStats(s, segA[:, None], splits)
+        rightCost, rightMean, rightN = segmentStats(s, splits, segB[:, None])
+
+        gains = (fullCost[:, None] - leftCost - rightCost)/np.square(noise[s])
+        # A split is only possible on a valid point, with enough points on each side
+        splitOnValid = valid[s, np.minimum(splits, nbCommits - 1)] & inside
+        gains = np.where(splitOnValid & (leftN >= minSize) & (rightN >= minSize), gains, -np.inf)
+
+        best = np.argmax(gains, axis=1)
+        rows = np.arange(len(segS))
+        bestGain = gains[rows, best]
+        bestSplit = splits[rows, best]
+        before = leftMean[rows, best]
+        after = rightMean[rows, best]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative = np.abs(after - before)/np.abs(before)
+        accepted = (bestGain > thresholds[segS]) & (relative >= minRelativeChange)
+
+        for i in np.flatnonzero(accepted):
+            commitId = sortedIdx[bestSplit[i]]
+            sceneName, timerName = series[segS[i]]
+            found.append(ChangePoint(sceneName, timerName, commitId, str(tensor.commits['hash'][commitId]), float(before[i]), float(after[i]), float(bestGain[i])))
+
+        # Next level : both sides of the accepted splits
+        acc = np.flatnonzero(accepted)
+        segS = np.concatenate((segS[acc], segS[acc]))
+        segA, segB = np.concatenate((segA[acc], bestSplit[acc])), np.concatenate((bestSplit[acc], segB[acc]))
+        keep = (sumN[segS, segB] - sumN[segS, segA]) >= 2*minSize
+        segS, segA, segB = segS[keep], segA[keep], segB[keep]
+
+    found.sort(key=lambda changePoint: changePoint.score, reverse=True)
+    return found
+
+
+if __name__=="__main__":
+    resultsDir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.realpath(__file__)), "../old_results")
+    nbToPrint = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+
+    releaseData, commitData, sortedReleaseIdx, sortedCommitIdx = utils.loadAllResults(resultsDir)
+    utils.tic()
+    changePoints = detectChangePoints(StatTensor(commitData), sortedCommitIdx)
+    utils.tac()
+
+    print(f"{len(changePoints)} change points found, {nbToPrint} most significant :")
+    for changePoint in changePoints[:nbToPrint]:
+        kind = "regression " if changePoint.isRegression() else "improvement"
+        print(f"{kind} {changePoint.fullHash[:7]} {commitData[changePoint.commitId].dateTime} {changePoint.sceneName:>50} {changePoint.timerName:>20} "
+              f"{changePoint.before:10.4f} -> {changePoint.after:10.4f} ms ({100*changePoint.relativeChange:+.1f}%) score {changePoint.score:.1f}")
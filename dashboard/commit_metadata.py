@@ -0,0 +1,237 @@
+import sys
+import os
+import bisect
+import sqlite3
+import datetime
+import subprocess
+import threading
+import time
+from typing import NamedTuple
+
+
+#### Commit metadata ####
+# brief: Local persistent store of the message, author, date and url of the commits (and releases) of the results, so
+#        that the dashboard displays them without any request to GitHub when a point is clicked.
+#
+# details:
+# - The metadata are kept in a SQLite file (one line per ref, ref being the full hash of a commit or the name of a
+#   release tag as used in the results file names) and in memory, a lookup never accesses the network.
+# - The store is filled in one batch from a local clone of SOFA if there is one : refs are resolved with
+#   'git cat-file --batch-check' and read with one 'git log --no-walk --stdin'.
+# - The refs which are not in the clone (or if there is no clone) are read from the GitHub API, in a background thread.
+#   The lookup of a ref which is not in the store returns None and schedules its download for the next lookups.
+# - Only the refs reported missing by GitHub (404) are not requested again. The other errors (network, rate limit) are
+#   retried with an exponential backoff, then the ref is requested again by the next lookup or update.
+# - Several processes may share the store file : the refs written by another process are read from it before being
+#   requested. The dashboard only runs the update of all the results in one of them (see dashboard.py).
+#
+# usage:
+# - python3 commit_metadata.py <storePath> <sofaDir> <resultsDir> : fill the store from the clone for all the results
+#########################
+
+COMMIT_URL = "https://github.com/sofa-framework/sofa/commit/{}"
+
+# Retries of a request to GitHub which failed for another reason than a missing ref, waiting GITHUB_RETRY_DELAY seconds
+# doubled at each retry
+GITHUB_RETRIES = 3
+GITHUB_RETRY_DELAY = 2.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS commits (
+    ref      TEXT PRIMARY KEY,
+    fullHash TEXT NOT NULL,
+    message  TEXT NOT NULL,
+    author   TEXT NOT NULL,
+    date     TEXT NOT NULL,
+    url      TEXT NOT NULL
+);
+"""
+
+class CommitMetadata(NamedTuple):
+    fullHash : str
+    message : str      # First line of the commit message
+    author : str
+    date : str         # Author date in UTC, as given by GitHub : 'YYYY-MM-DDThh:mm:ssZ'
+    url : str
+
+
+def readFromGit(sofaDir : str, refs : list[str]):
+    # Return { ref : CommitMetadata } of the refs found in the clone, in two git calls whatever the number of refs
+    resolved = subprocess.run(["git", "-C", sofaDir, "cat-file", "--batch-check"], input="".join(f"{ref}^{{commit}}\n" for ref in refs),
+                              capture_output=True, text=True, check=True).stdout.splitlines()
+    # Each line is either '<sha> commit <size>' or '<ref>^{commit} missing'
+    fullHashes = {}
+    for ref, line in zip(refs, resolved):
+        fields = line.split(' ')
+        if((len(fields) == 3) and (fields[1] == "commit")):
+            fullHashes.setdefault(fields[0], []).append(ref)
+    if(len(fullHashes) == 0):
+        return {}
+
+    log = subprocess.run(["git", "-C", sofaDir, "log", "--no-walk=unsorted", "--stdin", "--format=%H%x00%an%x00%at%x00%s"],
+                         input="".join(f"{fullHash}\n" for fullHash in fullHashes), capture_output=True, text=True, check=True).stdout
+    metadata = {}
+    for line in log.splitlines():
+        fields = line.split('\x00')
+        if(len(fields) != 4):
+            continue
+        fullHash, author, timestamp, message = fields
+        date = datetime.datetime.fromtimestamp(int(timestamp), datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        for ref in fullHashes.get(fullHash, []):
+            metadata[ref] = CommitMetadata(fullHash, message, author, date, COMMIT_URL.format(fullHash))
+    return metadata
+
+def readFromGithub(repository, ref : str):
+    rawData = repository.get_commit(ref).raw_data
+    return CommitMetadata(rawData["sha"], rawData["commit"]["message"].split('\n')[0], rawData["commit"]["author"]["name"],
+                          rawData["commit"]["author"]["date"], rawData["html_url"])
+
+def isNotFoundError(error : Exception):
+    # UnknownObjectException of PyGithub, or any GithubException with the status 404
+    return getattr(error, "status", None) == 404
+
+
+class CommitMetadataStore():
+
+    def __init__(self, storePath : str, sofaDir : str = None, getGithubRepository = None):
+        # getGithubRepository : function returning the PyGithub repository of SOFA, only called for the first ref not
+        #                       found in the clone. None to never use GitHub.
+        self.storePath            = storePath
+        self.sofaDir              = sofaDir
+        self._getGithubRepository = getGithubRepository
+        self._githubRepository    = None
+        self._lock                = threading.Lock()
+        self._pending             = set()
+        self._notFound            = set()    # Refs reported missing by GitHub, not requested again
+        self._metadata            = {}
+
+        os.makedirs(os.path.dirname(os.path.abspath(storePath)), exist_ok=True)
+        connection = self._connect()
+        with connection:
+            connection.executescript(_SCHEMA)
+            for ref, fullHash, message, author, date, url in connection.execute("SELECT ref, fullHash, message, author, date, url FROM commits"):
+                self._metadata[ref] = CommitMetadata(fullHash, message, author, date, url)
+        connection.close()
+        self._sortedRefs = sorted(self._metadata)
+
+    def _connect(self):
+        # One connection per call, the store is used from the callbacks and from the background threads
+        return sqlite3.connect(self.storePath, timeout=10)
+
+    def __len__(self):
+        return len(self._metadata)
+
+    def __contains__(self, ref : str):
+        return ref in self._metadata
+
+    def get(self, ref : str):
+        # Return the CommitMetadata of the full hash, short hash or release name, None if it isn't known yet (it is then
+        # downloaded in background for the next calls). Never blocks on the network.
+        metadata = self._metadata.get(ref)
+        if(metadata is None):
+            sortedRefs = self._sortedRefs
+            position = bisect.bisect_left(sortedRefs, ref)
+            if((position < len(sortedRefs)) and sortedRefs[position].startswith(ref)):
+                metadata = self._metadata.get(sortedRefs[position])
+        if(metadata is None):
+            self.updateInBackground([ref])
+        return metadata
+
+    def _add(self, metadata : dict):
+        if(len(metadata) == 0):
+            return
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO commits (ref, fullHash, message, author, date, url) VALUES (?, ?, ?, ?, ?, ?)",
+                                       [(ref, *values) for ref, values in metadata.items()])
+            connection.close()
+            # Replaced at once, get is not locked
+            allMetadata = {**self._metadata, **metadata}
+            self._metadata, self._sortedRefs = allMetadata, sorted(allMetadata)
+
+    def _readStore(self, refs : list[str]):
+        # Add the metadata of the refs written in the store by another process
+        connection = self._connect()
+        found = {}
+        for ref in refs:
+            row = connection.execute("SELECT fullHash, message, author, date, url FROM commits WHERE ref = ?", (ref,)).fetchone()
+            if(row is not None):
+                found[ref] = CommitMetadata(*row)
+        connection.close()
+        if(len(found) > 0):
+            with self._lock:
+                allMetadata = {**self._metadata, **found}
+                self._metadata, self._sortedRefs = allMetadata, sorted(allMetadata)
+        return found
+
+    def _readFromGithub(self, ref : str):
+        # Return the CommitMetadata of the ref, None if GitHub doesn't know it or if all the retries failed
+        for attempt in range(GITHUB_RETRIES + 1):
+            try:
+                if(self._githubRepository is None):
+                    self._githubRepository = self._getGithubRepository()
+                return readFromGithub(self._githubRepository, ref)
+            except(Exception) as error:
+                if(isNotFoundError(error)):
+                    self._notFound.add(ref)
+                    print(f"[WARNING] The commit {ref} is not on GitHub : {error}")
+                    return None
+                if(attempt == GITHUB_RETRIES):
+                    print(f"[WARNING] Cannot read the commit {ref} from GitHub : {error}")
+                    return None
+                time.sleep(GITHUB_RETRY_DELAY * 2**attempt)
+
+    def update(self, refs : list[str]):
+        # Add the metadata of the refs which are not in the store yet : from the clone in one batch, then from GitHub
+        missing = [ref for ref in dict.fromkeys(refs) if ref not in self._metadata]
+        if(len(missing) == 0):
+            return
+        found = self._readStore(missing)
+        missing = [ref for ref in missing if ref not in found]
+        if(len(missing) == 0):
+            return
+
+        if(self.sofaDir is not None):
+            try:
+                found = readFromGit(self.sofaDir, missing)
+                self._add(found)
+                missing = [ref for ref in missing if ref not in found]
+            except(OSError, subprocess.CalledProcessError) as error:
+                print(f"[WARNING] Cannot read the commits from the SOFA clone {self.sofaDir} : {error}")
+
+        if(self._getGithubRepository is None):
+            return
+        for ref in missing:
+            metadata = self._readFromGithub(ref)
+            if(metadata is not None):
+                self._add({ref : metadata})
+
+    def updateInBackground(self, refs : list[str]):
+        with self._lock:
+            refs = [ref for ref in dict.fromkeys(refs) if (ref not in self._metadata) and (ref not in self._pending) and (ref not in self._notFound)]
+            self._pending.update(refs)
+        if(len(refs) == 0):
+            return
+
+        def run():
+            try:
+                self.update(refs)
+            finally:
+                with self._lock:
+                    self._pending.difference_update(refs)
+        threading.Thread(target=run, name="CommitMetadata", daemon=True).start()
+
+
+if __name__=="__main__":
+    if(len(sys.argv) < 4):
+        print("usage : python3 commit_metadata.py <storePath> <sofaDir> <resultsDir>")
+        exit(1)
+
+    import utils
+    releaseData, commitData, sortedReleaseIdx, sortedCommitIdx = utils.loadAllResults(sys.argv[3])
+    store = CommitMetadataStore(sys.argv[1], sys.argv[2])
+    utils.tic()
+    store.update([snap.fullHash for snap in releaseData + commitData])
+    utils.tac()
+    print(f"{len(store)} commits in {sys.argv[1]}")
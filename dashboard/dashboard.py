@@ -5,11 +5,18 @@ from sys import maxsize
 from functools import lru_cache
 
 import numpy as np
-from dash import Dash, html, dcc, callback, Output, Input, State
+from dash import Dash, html, dcc, callback, clientside_callback, Output, Input, State, ctx, no_update, Patch
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 import utils
 from utils import ERROR_TYPE, ERROR_RETURNED
+import changepoints
+from results_watcher import ResultsWatcher
+from shared_results import SharedResultsWatcher
+from commit_metadata import CommitMetadataStore
+from figure_cache import FigureCache, makeCacheBackend, DEFAULT_TTL, DEFAULT_MAX_BYTES
+from api import createApi
+import instrumentation
 import re
 import plotly.express as px
 from github import Auth
@@ -25,17 +32,43 @@ external_stylesheets = [dbc.themes.SOLAR]
 server=Flask(__name__)
 app = Dash(__name__, external_stylesheets=external_stylesheets,server=server)
 
+# Opt-in metrics (PR_METRICS=1) exposed on /metrics, see instrumentation.py. Nothing is wrapped when they are disabled.
+if(instrumentation.isEnabled()):
+    instrumentation.instrumentFunctions(utils, ["loadAllResults", "loadResultFiles", "buildResultsLists", "loadCSVStatistic",
+                                                "loadHardInfoFile", "loadSceneSamples", "computeCommitListIdInDataList",
+                                                "getUniqueSetOfScenes", "getUniqueSetOfLabels", "getDataStructureForGraph",
+                                                "downsampleMinMax", "getTimerData", "findCommitId"])
+    instrumentation.instrumentFunctions(changepoints, ["detectChangePoints"])
+    instrumentation.instrumentServer(server)
+
 # Load global datas
-releaseData, commitData, sortedReleaseIdx, sortedCommitIdx = utils.loadAllResults(os.path.join(scriptPath,"../old_results"))
+# The parsed results are saved in a snapshot so that the next start only parses the new or modified files
+# Set PR_DASHBOARD_SNAPSHOT to another path to move it, or to 0 to disable it
+snapshotPath = os.environ.get('PR_DASHBOARD_SNAPSHOT', os.path.join(scriptPath,".cache","results_snapshot.pkl"))
+if(snapshotPath == "0"):
+    snapshotPath = None
+# The results (releaseData, commitData, their sorted ids and StatTensor) are replaced at once by the watcher when new
+# results are pushed in old_results. Each callback takes resultsWatcher.results once and only uses this object.
+# With several gunicorn workers, set PR_SHARED_DATASET_DIR so that one worker parses the results and exports them to
+# memory mapped files used by all the workers (see shared_results.py) instead of one copy of the results per worker
+sharedDatasetDir = os.environ.get('PR_SHARED_DATASET_DIR')
+if(sharedDatasetDir):
+    resultsWatcher = SharedResultsWatcher(os.path.join(scriptPath,"../old_results"),snapshotPath,sharedDatasetDir)
+else:
+    resultsWatcher = ResultsWatcher(os.path.join(scriptPath,"../old_results"),snapshotPath)
+# Read-only JSON API on the same server for the other tools (see api.py)
+server.register_blueprint(createApi(lambda : resultsWatcher.results))
+# Period of the polling of old_results in seconds, 0 to disable it
+watchInterval = float(os.environ.get('PR_DASHBOARD_WATCH_INTERVAL', 30))
 
 #Create Default variables
 defaultGitDataType = 'releases'
 defaultCommitSince = '2000-12-31'
 defaultCommitInterval = 1
-defaultIds = utils.computeCommitListIdInDataList(releaseData,sortedReleaseIdx,datetime.datetime.fromisoformat(defaultCommitSince),defaultCommitInterval)
-defaultSceneNames = utils.getUniqueSetOfScenes(releaseData,defaultIds)
+defaultIds = utils.computeCommitListIdInDataList(resultsWatcher.results.releaseTensor,datetime.datetime.fromisoformat(defaultCommitSince),defaultCommitInterval)
+defaultSceneNames = utils.getUniqueSetOfScenes(resultsWatcher.results.releaseTensor,defaultIds)
 defaultSceneNames.sort()
-defaultLabels = utils.getUniqueSetOfLabels(releaseData,defaultIds,defaultSceneNames[0])
+defaultLabels = utils.getUniqueSetOfLabels(resultsWatcher.results.releaseTensor,defaultIds,defaultSceneNames[0])
 defaultLabels.sort()
 defaultDropDownLabels = [{"label" : name, "value": name} for name in defaultSceneNames]
 
@@ -46,15 +79,39 @@ g_scene_label_color_map = []
 g_overviewLabel = 'TimeStep'
 g_maxCache = 10
 g_commitInfoCache = 50
-
-# Github handler
+# Maximum number of points of each scene in the overview, longer series are downsampled (see utils.downsampleMinMax)
+# and drawn with WebGL. The visible part is drawn with the same budget when zooming, so that the details appear.
+g_overviewPointBudget = 500
+
+# Figures of the graphs, keyed by the results and the values of the inputs (see figure_cache.py)
+# Set PR_CACHE_URL to 'redis://<host>:<port>/<db>' to share them between the workers and across restarts, they are kept
+# in the memory of each worker otherwise (at most PR_CACHE_MAX_MB MB). PR_CACHE_TTL gives their lifetime in seconds.
+figureCache = FigureCache(makeCacheBackend(os.environ.get('PR_CACHE_URL'), int(float(os.environ.get('PR_CACHE_MAX_MB', DEFAULT_MAX_BYTES/(1024*1024)))*1024*1024)),
+                          float(os.environ.get('PR_CACHE_TTL', DEFAULT_TTL)))
+
+# Commit metadata (message, author, date) displayed when a point is clicked
+# They are read in one batch from a local clone of SOFA given by PR_SOFA_DIR, GitHub is only used for the commits which
+# are not in the clone and is accessed in background : the callbacks never wait for the network.
+sofaDir = os.environ.get('PR_SOFA_DIR')
 GithubToken = os.environ.get('RO_GITHUB_TOKEN')
-if(GithubToken is None):
-    print("ERROR : Please provide a read only github token through the environment variable RO_GITHUB_TOKEN")
+if((GithubToken is None) and (sofaDir is None)):
+    print("ERROR : Please provide a read only github token through the environment variable RO_GITHUB_TOKEN or a clone of SOFA through PR_SOFA_DIR")
     exit(1)
-auth = Auth.Token(GithubToken)
-git = Github(auth=auth)
-sofaRepo = git.get_repo("sofa-framework/sofa")
+
+def getSofaRepository():
+    # Only called for the first commit missing in the clone
+    auth = Auth.Token(GithubToken)
+    git = Github(auth=auth)
+    return git.get_repo("sofa-framework/sofa")
+
+def isCommitMetadataWriter():
+    # With shared results, only the worker exporting them fills the commit metadata of all the results, the other
+    # workers read them from the store (see commit_metadata.py)
+    return (not isinstance(resultsWatcher, SharedResultsWatcher)) or resultsWatcher.isWriter()
+
+commitMetadata = CommitMetadataStore(os.path.join(scriptPath,".cache","commits.db"), sofaDir, getSofaRepository if GithubToken is not None else None)
+if(isCommitMetadataWriter()):
+    commitMetadata.updateInBackground([snap.fullHash for snap in resultsWatcher.results.releaseData + resultsWatcher.results.commitData])
 
 ### CSS styles
 #### FIRST ROW
@@ -125,6 +182,11 @@ tab_overview_graph = dbc.Card([
                            value=[],
                            inline=True,
                            id='log_scale_overview',
+                           switch=True),
+            dbc.Checklist(options=[{"label":"Show change points","value":1}],
+                           value=[],
+                           inline=True,
+                           id='change_points_overview',
                            switch=True)
                 ], width= 2)
 
@@ -177,6 +239,22 @@ tab_specific_graph = dbc.Card(
 )
 
 
+tab_samples_graph = dbc.Card(
+    [dbc.Row([
+        dbc.Col(dbc.RadioItems(options=[{"label":"Violin","value":"violin"},
+                                        {"label":"ECDF","value":"ecdf"},
+                                        {"label":"Timeline","value":"timeline"}],
+                               value="violin",
+                               inline=True,
+                               id='samples_view')),
+        dbc.Col(html.P("Click on a commit in the other graphs to display its raw samples", id='samples_selection_info')),
+    ],
+    style=LABEL_CHECKLIST_STYLE),
+    dcc.Graph(figure={}, id='PlotSamples')],
+    className="mt-3",
+)
+
+
 # Right info panel tabs
 tab_commit_info = dbc.Card(
     dbc.CardBody(
@@ -244,6 +322,7 @@ app.layout = dbc.Container([
                 dbc.Tabs([
                     dbc.Tab(tab_overview_graph, label="Timestep overview"),
                     dbc.Tab(tab_specific_graph, label="Timers"),
+                    dbc.Tab(tab_samples_graph, label="Samples"),
                     ]
                 )
                 ],
@@ -268,15 +347,26 @@ app.layout = dbc.Container([
         ], align=True
          , style=FULL_THIRD_ROW_STYLE),
         html.Hr(),
+        # Commit, scene and timer of the last clicked point, used by the samples tab
+        dcc.Store(id='samples-selection'),
+        # Scenes and timers of the selected commits, computed once per change of the commit type, since and interval
+        # (see update_selection). The checklists and dropdowns are filled from it in the browser.
+        dcc.Store(id='selection'),
+        # Names of the traces of the graphs in their order, to find the scene or timer of a clicked point and to add or
+        # remove traces of the timer graph without sending the figure back
+        dcc.Store(id='overview-traces'),
+        dcc.Store(id='timer-traces'),
 ], fluid=True)
 
 
 
 ##### COMMON CALLBACK AND METHODS #####
 
+# The cached methods taking the results as first parameter are called with resultsWatcher.results, so that their
+# entries computed on previous results are never reused after new results are ingested
+
 @lru_cache(maxsize = g_maxCache)
-def get_ids_for_callback(git_data_type,commit_since,commit_interval):
-    global releaseData,sortedReleaseIdx,commitData,sortedCommitIdx
+def get_ids_for_callback(results,git_data_type,commit_since,commit_interval):
 
     try:
         commit_since_date = datetime.datetime.fromisoformat(commit_since)
@@ -284,26 +374,28 @@ def get_ids_for_callback(git_data_type,commit_since,commit_interval):
         print("Date is not in iso format : 'YYYY-MM-DD HH:MM:SS' time is optional" )
         return ERROR_RETURNED
 
+    if(commit_interval is None):
+        return ERROR_RETURNED
+
     if(git_data_type=="releases"):
-        outputIds = utils.computeCommitListIdInDataList(releaseData,sortedReleaseIdx,commit_since_date,commit_interval)
+        outputIds = utils.computeCommitListIdInDataList(results.releaseTensor,commit_since_date,commit_interval)
     else:
-        outputIds = utils.computeCommitListIdInDataList(commitData,sortedCommitIdx,commit_since_date,commit_interval)
+        outputIds = utils.computeCommitListIdInDataList(results.commitTensor,commit_since_date,commit_interval)
 
     return outputIds
 
 @lru_cache(maxsize = g_maxCache)
-def get_scenes_names_for_callback(git_data_type,commit_since,commit_interval):
-    global releaseData,sortedReleaseIdx,commitData,sortedCommitIdx
+def get_scenes_names_for_callback(results,git_data_type,commit_since,commit_interval):
 
-    ids = get_ids_for_callback(git_data_type,commit_since,commit_interval)
+    ids = get_ids_for_callback(results,git_data_type,commit_since,commit_interval)
 
     if(isinstance(ids,ERROR_TYPE)):
         return ERROR_RETURNED
 
     if(git_data_type=="releases"):
-        raw_names = utils.getUniqueSetOfScenes(releaseData,ids)
+        raw_names = utils.getUniqueSetOfScenes(results.releaseTensor,ids)
     else:
-        raw_names = utils.getUniqueSetOfScenes(commitData,ids)
+        raw_names = utils.getUniqueSetOfScenes(results.commitTensor,ids)
 
     raw_names.sort()
 
@@ -333,19 +425,20 @@ def getGlobalSceneColor(label):
 
     return px.colors.qualitative.Alphabet[idx%len(px.colors.qualitative.Alphabet)]
 
-@lru_cache(maxsize = g_commitInfoCache)
 def get_commit_info_data_for_callback(commitHash,sceneName,timerName):
-    global releaseData, commitData, sortedReleaseIdx, sortedCommitIdx
+    # The metadata are part of the key so that the information displayed before they were available isn't kept
+    return get_commit_info_data_with_metadata(commitHash,sceneName,timerName,commitMetadata.get(commitHash))
+
+@lru_cache(maxsize = g_commitInfoCache)
+def get_commit_info_data_with_metadata(commitHash,sceneName,timerName,metadata):
+    results = resultsWatcher.results
 
     isRelease = re.match("v[0-9]{2}.[0-9]{2}",commitHash) is not None
-    commit = sofaRepo.get_commit(commitHash)
-    commitRawData = commit.raw_data
 
-    #NO copy is actually done because we are using lists
     if(isRelease):
-        data = releaseData
+        data = results.releaseTensor
     else:
-        data = commitData
+        data = results.commitTensor
 
     cpuData = utils.getTimerData(data,commitHash,sceneName, "CPUUsage")
     timerData = utils.getTimerData(data,commitHash,sceneName, timerName)
@@ -355,6 +448,12 @@ def get_commit_info_data_for_callback(commitHash,sceneName,timerName):
     else:
         timerCardinality = -1
 
+    # Bootstrap confidence intervals, only available if they were computed when generating the statistics
+    confidenceIntervals = []
+    if((timerData is not None) and (timerData.meanCI is not None)):
+        confidenceIntervals = [html.P(f"Mean 95% confidence interval : [{timerData.meanCI[0]:.4f}, {timerData.meanCI[1]:.4f}] ms"),
+                               html.P(f"Median 95% confidence interval : [{timerData.medianCI[0]:.4f}, {timerData.medianCI[1]:.4f}] ms")]
+
     if(cpuData is not None):
         CpuString = f"CPU Usage : {cpuData.meanstd[0]:.2f}% ± {2*cpuData.meanstd[1]:.2f} (5% confidence)"
         if((cpuData.meanstd[0] + 2*cpuData.meanstd[1]) <= 5):
@@ -368,36 +467,39 @@ def get_commit_info_data_for_callback(commitHash,sceneName,timerName):
         CpuColor = "#BBBBBB"
 
 
+    if(metadata is not None):
+        commitDescription = [
+            html.P(["Commit message : ",html.B(f"{metadata.message}")], className="text-secondary"),
+            html.P(f"Date : {metadata.date.replace('T',' ').replace('Z',' ')}"),
+            html.P([f"Author : {metadata.author} "]),
+            html.P([f"Link : ", html.A(f"{metadata.url}",href=metadata.url)]),
+        ]
+    else:
+        commitDescription = [html.P("Commit message : not available yet, click again later", className="text-secondary")]
+
     currCommitInfo = [
         html.P(["Commit hash : ",html.B(f"{commitHash}")], className="text-secondary"),
-        html.P(["Commit message : ",html.B(f"{commitRawData["commit"]["message"].split('\n')[0]}")], className="text-secondary"),
-        html.P(f"Date : {commitRawData["commit"]["author"]["date"].replace('T',' ').replace('Z',' ')}"),
-        html.P([f"Author : {commitRawData["commit"]["author"]["name"]} "]),
-        html.P([f"Link : ", html.A(f"{commitRawData["html_url"]}",href=commitRawData["html_url"])]),
+        *commitDescription,
         html.Hr(),
-        html.P([ html.P(f"Numer of samples : {timerCardinality}"),  html.P(CpuString,style={'color':CpuColor})]),
+        html.P([ html.P(f"Numer of samples : {timerCardinality}"), *confidenceIntervals, html.P(CpuString,style={'color':CpuColor})]),
     ]
 
     return currCommitInfo
 
 @lru_cache(maxsize = g_maxCache)
 def get_hard_info_data_for_callback(commitHash):
-    global releaseData, commitData, sortedReleaseIdx, sortedCommitIdx
-
+    results = resultsWatcher.results
 
     isRelease = (re.match("v[0-9]{2}.[0-9]{2}",commitHash) is not None) or (commitHash == "master")
-    commit = sofaRepo.get_commit(commitHash)
-
-    try:
-        if(isRelease):
-            releaseId = utils.findCommitId(releaseData,commitHash)
-            hardInfo = releaseData[releaseId].hardInfo
-        else:
-            commitId = utils.findCommitId(commitData,commit.sha)
-            hardInfo = commitData[commitId].hardInfo
-    except(ValueError):
-        hardInfo = "Hardware info : not found"
 
+    # findCommitId returns -1 for an unknown hash, which must not select the last commit
+    if(isRelease):
+        dataId, data = utils.findCommitId(results.releaseTensor,commitHash), results.releaseData
+    else:
+        dataId, data = utils.findCommitId(results.commitTensor,commitHash), results.commitData
+    if(dataId < 0):
+        return [html.P("Hardware info : not found")]
+    hardInfo = data[dataId].hardInfo
 
     # Generate HTML struct from hard info file. This works only if hardinfo file has parts titles
     # starting with a char at pose 0 and part content having a space at beginning of line
@@ -421,82 +523,255 @@ def get_hard_info_data_for_callback(commitHash):
 
 ##### OVERVIEW GRAPH #####
 
-@callback(
+@lru_cache(maxsize = 1)
+def get_overview_change_points_for_callback(results):
+    # Change points of the overview timer over the whole commit history, grouped by scene
+    changePointsPerScene = {}
+    for changePoint in changepoints.detectChangePoints(results.commitTensor, results.sortedCommitIdx, [g_overviewLabel]):
+        changePointsPerScene.setdefault(changePoint.sceneName, []).append(changePoint)
+    return changePointsPerScene
 
-    Output(component_id='scenes_names', component_property='options'),
-    State(component_id='scenes_names', component_property='options'),
+@callback(
+    Output(component_id='selection', component_property='data'),
     Input(component_id='git-data-type', component_property='value'),
     Input(component_id='commit-since', component_property='value'),
     Input(component_id='commit-interval', component_property='value')
 )
-def update_scene_names_for_timers(currSceneNames,git_data_type,commit_since,commit_interval):
-    raw_names = get_scenes_names_for_callback(git_data_type,commit_since,commit_interval)
-    if(isinstance(raw_names,ERROR_TYPE)):
-        return currSceneNames
-    else:
-        return raw_names
+def update_selection(git_data_type,commit_since,commit_interval):
+    # Everything the other callbacks need to know about the selected commits, computed once per change of the inputs
+    results = resultsWatcher.results
+
+    ids = get_ids_for_callback(results,git_data_type,commit_since,commit_interval)
+    raw_names = get_scenes_names_for_callback(results,git_data_type,commit_since,commit_interval)
+    if(isinstance(ids,ERROR_TYPE) or isinstance(raw_names,ERROR_TYPE)):
+        return no_update
+
+    tensor = results.releaseTensor if git_data_type=="releases" else results.commitTensor
+    labels = {}
+    for sceneName in raw_names:
+        #CPUUsage should not be selectable but displayed on the info panel
+        labels[sceneName] = [label for label in sorted(utils.getUniqueSetOfLabels(tensor,ids,sceneName)) if label != "CPUUsage"]
+
+    return {"git_data_type" : git_data_type,
+            "commit_since" : commit_since,
+            "commit_interval" : commit_interval,
+            "scenes" : raw_names,
+            "labels" : labels}
+
+# The options of the checklists and dropdowns and the "Select all" switches are only computed from the data in the
+# browser, they don't need the server
+
+clientside_callback(
+    """
+    function(selection) {
+        if(!selection) { return window.dash_clientside.no_update; }
+        return selection.scenes;
+    }
+    """,
+    Output(component_id='scenes_names', component_property='options'),
+    Input(component_id='selection', component_property='data')
+)
 
+clientside_callback(
+    """
+    function(selection) {
+        if(!selection) { return window.dash_clientside.no_update; }
+        return selection.scenes.map(name => ({"label" : name, "value" : name}));
+    }
+    """,
+    Output(component_id='sceneName', component_property='options'),
+    Input(component_id='selection', component_property='data')
+)
 
-@callback(
+clientside_callback(
+    """
+    function(selection, sceneName) {
+        if(!selection || !selection.labels[sceneName] || selection.labels[sceneName].length == 0) {
+            return window.dash_clientside.no_update;
+        }
+        return selection.labels[sceneName];
+    }
+    """,
+    Output(component_id='labels', component_property='options'),
+    Input(component_id='selection', component_property='data'),
+    Input(component_id='sceneName', component_property='value')
+)
 
+SELECT_ALL_CLIENTSIDE = """
+    function(selectAll, options) {
+        return (selectAll.length > 0) ? options.map(option => (typeof option === "object") ? option.value : option) : [];
+    }
+    """
+
+clientside_callback(
+    SELECT_ALL_CLIENTSIDE,
     Output(component_id='scenes_names', component_property='value'),
-    State(component_id='scenes_names', component_property='options'),
     Input(component_id='select_all_scenes', component_property='value'),
+    State(component_id='scenes_names', component_property='options')
 )
-def update_scene_checked_for_timers(sceneNames,selectAll):
-    if(len(selectAll)>0):
-        return sceneNames
-    else:
-        return []
 
+# Log scale and visibility of the traces only change the figure already displayed
 
-@callback(
-    Output(component_id='PlotOverview', component_property='figure'),
+LOG_SCALE_CLIENTSIDE = """
+    function(logScale, figure) {
+        if(!figure || !figure.layout) { return window.dash_clientside.no_update; }
+        const yaxis = Object.assign({}, figure.layout.yaxis, {"type" : (logScale.length > 0) ? "log" : "linear", "autorange" : true});
+        return Object.assign({}, figure, {"layout" : Object.assign({}, figure.layout, {"yaxis" : yaxis})});
+    }
+    """
+
+clientside_callback(
+    LOG_SCALE_CLIENTSIDE,
+    Output(component_id='PlotOverview', component_property='figure',allow_duplicate=True),
+    Input(component_id='log_scale_overview', component_property='value'),
     State(component_id='PlotOverview', component_property='figure'),
-    Input(component_id='git-data-type', component_property='value'),
-    Input(component_id='commit-since', component_property='value'),
-    Input(component_id='commit-interval', component_property='value'),
+    prevent_initial_call=True
+)
+
+clientside_callback(
+    """
+    function(sceneNames, figure) {
+        if(!figure || !figure.data) { return window.dash_clientside.no_update; }
+        const visible = new Set(sceneNames);
+        const data = figure.data.map(trace => Object.assign({}, trace, {"visible" : visible.has(trace.name)}));
+        const annotations = ((figure.layout && figure.layout.annotations) || []).map(annotation => Object.assign({}, annotation, {"visible" : visible.has(annotation.name)}));
+        return Object.assign({}, figure, {"data" : data, "layout" : Object.assign({}, figure.layout, {"annotations" : annotations})});
+    }
+    """,
+    Output(component_id='PlotOverview', component_property='figure',allow_duplicate=True),
     Input(component_id='scenes_names', component_property='value'),
-    Input(component_id='log_scale_overview', component_property='value')
+    State(component_id='PlotOverview', component_property='figure'),
+    prevent_initial_call=True
 )
-def update_overview_graph(currFigure,git_data_type,commit_since,commit_interval, sceneNames,logScale):
-    global releaseData, commitData, sortedReleaseIdx, sortedCommitIdx, currLabels, g_overviewLabel
 
-    ids = get_ids_for_callback(git_data_type,commit_since,commit_interval)
-    if(isinstance(ids,ERROR_TYPE)):
-        return currFigure
 
-    sceneNames.sort()
+@callback(
+    Output(component_id='PlotOverview', component_property='figure'),
+    Output(component_id='overview-traces', component_property='data'),
+    Input(component_id='selection', component_property='data'),
+    Input(component_id='change_points_overview', component_property='value'),
+    Input(component_id='PlotOverview', component_property='relayoutData'),
+    State(component_id='scenes_names', component_property='value'),
+    State(component_id='log_scale_overview', component_property='value')
+)
+def update_overview_graph(selection,showChangePoints,relayoutData,visibleSceneNames,logScale):
+    # The figure has a trace for every scene of the selection, the checked scenes and the log scale are only applied
+    # to it in the browser when they change (see the clientside callbacks above)
+    if(selection is None):
+        return no_update, no_update
+
+    # The zoom is kept while the same commits are displayed, and reset when they change (see uirevision)
+    visibleRange = None
+    if(ctx.triggered_id != 'selection'):
+        visibleRange = get_visible_range(relayoutData)
+        if((ctx.triggered_id == 'PlotOverview') and (visibleRange == "unchanged")):
+            return no_update, no_update
+        if(visibleRange == "unchanged"):
+            visibleRange = None
+
+    # The visible range only changes the figure when its series are downsampled : the zoom is then done by the browser
+    # and the visible range is not put in the key of the cached figure
+    results = resultsWatcher.results
+    ids = get_ids_for_callback(results,selection['git_data_type'],selection['commit_since'],selection['commit_interval'])
+    if((not isinstance(ids,ERROR_TYPE)) and (len(ids) <= g_overviewPointBudget)):
+        if(ctx.triggered_id == 'PlotOverview'):
+            return no_update, no_update
+        visibleRange = None
+
+    figure = get_overview_figure_for_callback(results,selection['git_data_type'],selection['commit_since'],selection['commit_interval'],
+                                              selection['scenes'],sorted(visibleSceneNames),logScale,showChangePoints,visibleRange)
+    if(isinstance(figure,ERROR_TYPE)):
+        return no_update, no_update
+    return figure, [trace['name'] for trace in figure['data']]
+
+def get_visible_range(relayoutData):
+    # Return the [first, last] positions of the categories of the x axis visible after a zoom, None if the whole axis is
+    # visible, "unchanged" if the event doesn't change the x axis
+    if(relayoutData is None):
+        return "unchanged"
+    if(relayoutData.get('xaxis.autorange')):
+        return None
+    if('xaxis.range' in relayoutData):
+        xRange = relayoutData['xaxis.range']
+    elif('xaxis.range[0]' in relayoutData):
+        xRange = [relayoutData['xaxis.range[0]'], relayoutData.get('xaxis.range[1]')]
+    else:
+        return "unchanged"
+    try:
+        return [int(np.floor(float(xRange[0]))), int(np.ceil(float(xRange[1])))]
+    except(TypeError, ValueError):
+        return None
+
+@figureCache.cached("overview")
+def get_overview_figure_for_callback(results,git_data_type,commit_since,commit_interval, sceneNames,visibleSceneNames,logScale,showChangePoints,visibleRange):
+    global currLabels, g_overviewLabel
 
-    fig = go.Figure()
-    globalLabels = []
+    ids = get_ids_for_callback(results,git_data_type,commit_since,commit_interval)
+    if(isinstance(ids,ERROR_TYPE)):
+        return ERROR_RETURNED
+
+    sceneData = {}
+    globalLabels = set()
     for scene in sceneNames:
         if(git_data_type=="releases"):
-            xLabelList , DataStruct = utils.getDataStructureForGraph(releaseData, ids , scene, [g_overviewLabel], type = "mean" )
+            xLabelList , DataStruct = utils.getDataStructureForGraph(results.releaseTensor, ids , scene, [g_overviewLabel], type = "mean" )
         else:
-            xLabelList , DataStruct = utils.getDataStructureForGraph(commitData, ids , scene, [g_overviewLabel], type = "mean")
-
-        if(np.size(DataStruct[g_overviewLabel]) != 0):
-            for xLabel in xLabelList: #Prepare label list for label reordering (see later)
-                if xLabel not in globalLabels:
-                    globalLabels.append(xLabel)
-            fig.add_trace(go.Scatter(x=xLabelList[g_overviewLabel],
-                                     y=DataStruct[g_overviewLabel][0],
-                                     error_y=dict(type='data',visible=True,array=DataStruct[g_overviewLabel][1]),
-                                     marker_color= getGlobalSceneColor(scene),
-                                     name=scene))
+            xLabelList , DataStruct = utils.getDataStructureForGraph(results.commitTensor, ids , scene, [g_overviewLabel], type = "mean")
+        sceneData[scene] = (xLabelList, DataStruct)
+        globalLabels.update(xLabelList[g_overviewLabel]) #Prepare label list for label reordering (see later)
 
     #Reorder labels because it might be reordered because some timers might be missing in the first commits
     orderedGlobalLabels = []
-    for i in ids:
-        if(git_data_type=="releases"):
-            currLabel = releaseData[i].fullHash
-        else:
-            currLabel = commitData[i].fullHash
-        if(len(currLabel)>7):
-            currLabel = currLabel[:6]
+    # The x values are the short hashes of the commits (see getDataStructureForGraph)
+    tensor = results.releaseTensor if git_data_type=="releases" else results.commitTensor
+    for currLabel in tensor.commits['shortHash'][ids].tolist():
         if(currLabel in globalLabels):
             orderedGlobalLabels.append(currLabel)
+    labelPositions = {label : position for position, label in enumerate(orderedGlobalLabels)}
+
+    # Long series are downsampled and drawn with WebGL. All the commits stay in the category array, so that the kept
+    # points are at their position and the zoom gives the positions of the visible commits.
+    downsample = len(orderedGlobalLabels) > g_overviewPointBudget
+    Trace = go.Scattergl if downsample else go.Scatter
+
+    fig = go.Figure()
+    for scene in sceneNames:
+        xLabelList , DataStruct = sceneData[scene]
+        if(np.size(DataStruct[g_overviewLabel]) != 0):
+            xLabels = np.array(xLabelList[g_overviewLabel])
+            means , stds = DataStruct[g_overviewLabel]
+            if(downsample):
+                kept = utils.downsampleMinMax(means, g_overviewPointBudget)
+                if(visibleRange is not None):
+                    positions = np.array([labelPositions[label] for label in xLabels])
+                    visible = np.flatnonzero((positions >= visibleRange[0]) & (positions <= visibleRange[1]))
+                    kept = np.union1d(kept, visible[utils.downsampleMinMax(means[visible], g_overviewPointBudget)])
+                xLabels , means , stds = xLabels[kept] , means[kept] , stds[kept]
+            fig.add_trace(Trace(x=xLabels,
+                                y=means,
+                                error_y=dict(type='data',visible=True,array=stds),
+                                marker_color= getGlobalSceneColor(scene),
+                                name=scene,
+                                visible=scene in visibleSceneNames))
+
+            #Annotate the change points detected on master which are in the displayed commits
+            if(showChangePoints and (git_data_type!="releases")):
+                displayedIds = set(ids)
+                xPositions = {xLabel : position for position, xLabel in enumerate(xLabelList[g_overviewLabel])}
+                for changePoint in get_overview_change_points_for_callback(results).get(scene, []):
+                    if(changePoint.commitId not in displayedIds):
+                        continue
+                    shortHash = changePoint.fullHash[:7]
+                    fig.add_annotation(x=shortHash,
+                                       y=DataStruct[g_overviewLabel][0][xPositions[shortHash]],
+                                       text=f"{100*changePoint.relativeChange:+.1f}%",
+                                       hovertext=f"{scene} : {changePoint.before:.4f} ms -> {changePoint.after:.4f} ms",
+                                       showarrow=True,
+                                       arrowhead=2,
+                                       arrowcolor=getGlobalSceneColor(scene),
+                                       font=dict(color="red" if changePoint.isRegression() else "green"),
+                                       name=scene,
+                                       visible=scene in visibleSceneNames)
 
     fig.update_xaxes(categoryorder='array',
                      categoryarray= orderedGlobalLabels)
@@ -529,7 +804,8 @@ def update_overview_graph(currFigure,git_data_type,commit_since,commit_interval,
         ),
         height=725,
         boxmode='group', # group together boxes of the different traces for each value of x
-        clickmode='event+select'
+        clickmode='event+select',
+        uirevision=f"{git_data_type} {commit_since} {commit_interval}" # The zoom is kept until other commits are displayed
     )
 
     return fig
@@ -538,11 +814,10 @@ def update_overview_graph(currFigure,git_data_type,commit_since,commit_interval,
     Output(component_id='commit-info', component_property='children',allow_duplicate=True),
     State(component_id='commit-info', component_property='children'),
     Input(component_id='PlotOverview', component_property='clickData'),
-    State(component_id='scenes_names', component_property='value'),
+    State(component_id='overview-traces', component_property='data'),
     prevent_initial_call=True)
 def display_click_commit_info_data_from_overview(currCommitInfo,clickData,sceneNames):
     if(clickData is not None):
-        sceneNames.sort()
         commitName = clickData['points'][0]['x']
         sceneName = sceneNames[clickData['points'][0]['curveNumber']]
         commitInfo = get_commit_info_data_for_callback(commitName,sceneName,g_overviewLabel)
@@ -577,98 +852,88 @@ def display_click_hard_info_data_from_overview(currHardInfo,clickData):
 ##### TIMER GRAPH #####
 
 
-@callback(
-
+clientside_callback(
+    SELECT_ALL_CLIENTSIDE,
     Output(component_id='labels', component_property='value'),
-    State(component_id='labels', component_property='options'),
     Input(component_id='select_all_labels', component_property='value'),
-    config_prevent_initial_callbacks=True
-)
-def update_scene_checked_for_timers(labelNames,selectAll):
-    if(len(selectAll)>0):
-        return labelNames
-    else:
-        return []
-
-@callback(
-    Output(component_id='labels', component_property='options'),
     State(component_id='labels', component_property='options'),
-    Input(component_id='git-data-type', component_property='value'),
-    Input(component_id='commit-since', component_property='value'),
-    Input(component_id='commit-interval', component_property='value'),
-    Input(component_id='sceneName', component_property='value')
+    prevent_initial_call=True
 )
-def update_labels(currLabels,git_data_type,commit_since,commit_interval,sceneName):
-    global releaseData, commitData, sortedReleaseIdx, sortedCommitIdx
-
-    ids = get_ids_for_callback(git_data_type,commit_since,commit_interval)
-    if(isinstance(ids,ERROR_TYPE)):
-        return currLabels
-
-    if(git_data_type=="releases"):
-        raw_labels = utils.getUniqueSetOfLabels(releaseData,ids,sceneName)
-    else:
-        raw_labels = utils.getUniqueSetOfLabels(commitData,ids,sceneName)
-
-    raw_labels.sort()
-    if len(raw_labels) == 0:
-        return currLabels
-
-    raw_labels.remove("CPUUsage") #Should not be selectable but displayed on the info panel
 
-    return raw_labels
-
-@callback(
-    Output(component_id='sceneName', component_property='options'),
-    State(component_id='sceneName', component_property='options'),
-    Input(component_id='git-data-type', component_property='value'),
-    Input(component_id='commit-since', component_property='value'),
-    Input(component_id='commit-interval', component_property='value')
+clientside_callback(
+    LOG_SCALE_CLIENTSIDE,
+    Output(component_id='PlotTimerSpecific', component_property='figure',allow_duplicate=True),
+    Input(component_id='log_scale_timer', component_property='value'),
+    State(component_id='PlotTimerSpecific', component_property='figure'),
+    prevent_initial_call=True
 )
-def update_scene_names_for_timers(currDropdownLabel,git_data_type,commit_since,commit_interval):
-    raw_names = get_scenes_names_for_callback(git_data_type,commit_since,commit_interval)
-
-    if(isinstance(raw_names,ERROR_TYPE)):
-        return currDropdownLabel
-    else:
-        return [{"label" : name, "value": name} for name in raw_names]
-
 
 
 @callback(
     Output(component_id='PlotTimerSpecific', component_property='figure'),
-    State(component_id='PlotTimerSpecific', component_property='figure'),
-    Input(component_id='git-data-type', component_property='value'),
-    Input(component_id='commit-since', component_property='value'),
-    Input(component_id='commit-interval', component_property='value'),
+    Output(component_id='timer-traces', component_property='data'),
+    Input(component_id='selection', component_property='data'),
     Input(component_id='labels', component_property='value'),
     Input(component_id='sceneName', component_property='value'),
-    Input(component_id='log_scale_timer', component_property='value')
+    State(component_id='log_scale_timer', component_property='value'),
+    State(component_id='timer-traces', component_property='data')
 )
-def update_timer_graph(currFig,git_data_type,commit_since,commit_interval,labels, sceneName,logScale):
-    global releaseData, commitData, sortedReleaseIdx, sortedCommitIdx
+def update_timer_graph(selection,labels, sceneName,logScale,timerTraces):
+    if(selection is None):
+        return no_update, no_update
+    results = resultsWatcher.results
+
+    labels = sorted(labels)
+    git_data_type, commit_since, commit_interval = selection['git_data_type'], selection['commit_since'], selection['commit_interval']
+
+    # When only the checked timers change, the traces of the other timers are kept in the browser
+    graphKey = [results.dataId, git_data_type, commit_since, commit_interval, sceneName]
+    if((ctx.triggered_id == 'labels') and (timerTraces is not None) and (timerTraces['key'] == graphKey)):
+        return patch_timer_graph(results,git_data_type,commit_since,commit_interval,labels,sceneName,timerTraces)
+
+    figure = get_timer_figure_for_callback(results,git_data_type,commit_since,commit_interval,labels,sceneName,logScale)
+    if(isinstance(figure,ERROR_TYPE)):
+        return no_update, no_update
+    return figure, {"key" : graphKey, "labels" : [trace['name'] for trace in figure['data']]}
+
+def patch_timer_graph(results,git_data_type,commit_since,commit_interval,labels,sceneName,timerTraces):
+    # Partial update of the figure : remove the traces of the unchecked timers and add the ones of the checked timers
+    ids = get_ids_for_callback(results,git_data_type,commit_since,commit_interval)
+    if(isinstance(ids,ERROR_TYPE)):
+        return no_update, no_update
 
-    labels.sort()
+    figure = Patch()
+    traceNames = list(timerTraces['labels'])
+    for position in reversed(range(len(traceNames))):
+        if(traceNames[position] not in labels):
+            del figure['data'][position]
+            del traceNames[position]
 
-    ids = get_ids_for_callback(git_data_type,commit_since,commit_interval)
+    traces = get_timer_traces(results,git_data_type,ids,[label for label in labels if label not in traceNames],sceneName)[0]
+    for trace in traces:
+        figure['data'].append(trace)
+        traceNames.append(trace.name)
 
-    if(isinstance(ids,ERROR_TYPE)):
-        return currFig
+    tensor = results.releaseTensor if git_data_type=="releases" else results.commitTensor
+    timerIds = [tensor.timerIds[label] for label in traceNames]
+    present = np.any(tensor.present(ids, sceneName)[:, timerIds], axis=1)
+    figure['layout']['xaxis']['categoryarray'] = tensor.commits['shortHash'][np.asarray(ids, dtype=np.int64)[present]].tolist()
+
+    return figure, {"key" : timerTraces['key'], "labels" : traceNames}
 
+def get_timer_traces(results,git_data_type,ids,labels,sceneName):
+    # Box traces of the labels which have values for the scene, and the commits of these traces in the order of the x axis
     if(git_data_type=="releases"):
-        xLabelList, outputStruct = utils.getDataStructureForGraph(releaseData, ids , sceneName, labels, type = "quartiles" )
+        xLabelList, outputStruct = utils.getDataStructureForGraph(results.releaseTensor, ids , sceneName, labels, type = "quartiles" )
     else:
-        xLabelList, outputStruct = utils.getDataStructureForGraph(commitData, ids , sceneName, labels, type = "quartiles")
+        xLabelList, outputStruct = utils.getDataStructureForGraph(results.commitTensor, ids , sceneName, labels, type = "quartiles")
 
-    fig = go.Figure()
-
-    globalLabels = []
+    traces = []
+    globalLabels = set()
     for label in xLabelList:
         if(np.size(outputStruct[label]) != 0):
-            for xLabel in xLabelList[label]: #Prepare label list for label reordering (see later)
-                if xLabel not in globalLabels:
-                    globalLabels.append(xLabel)
-            fig.add_trace(go.Box(lowerfence=outputStruct[label][0],
+            globalLabels.update(xLabelList[label]) #Prepare label list for label reordering (see later)
+            traces.append(go.Box(lowerfence=outputStruct[label][0],
                                  q1=outputStruct[label][1],
                                  median=outputStruct[label][2],
                                  q3=outputStruct[label][3],
@@ -680,16 +945,25 @@ def update_timer_graph(currFig,git_data_type,commit_since,commit_interval,labels
 
     #Reorder labels because it might be reordered because some timers might be missing in the first commits
     orderedGlobalLabels = []
-    for i in ids:
-        if(git_data_type=="releases"):
-            currLabel = releaseData[i].fullHash
-        else:
-            currLabel = commitData[i].fullHash
-        if(len(currLabel)>7):
-            currLabel = currLabel[:6]
+    # The x values are the short hashes of the commits (see getDataStructureForGraph)
+    tensor = results.releaseTensor if git_data_type=="releases" else results.commitTensor
+    for currLabel in tensor.commits['shortHash'][ids].tolist():
         if(currLabel in globalLabels):
             orderedGlobalLabels.append(currLabel)
 
+    return traces, orderedGlobalLabels
+
+@figureCache.cached("timer")
+def get_timer_figure_for_callback(results,git_data_type,commit_since,commit_interval,labels, sceneName,logScale):
+
+    ids = get_ids_for_callback(results,git_data_type,commit_since,commit_interval)
+
+    if(isinstance(ids,ERROR_TYPE)):
+        return ERROR_RETURNED
+
+    traces, orderedGlobalLabels = get_timer_traces(results,git_data_type,ids,labels,sceneName)
+    fig = go.Figure(data=traces)
+
     fig.update_xaxes(categoryorder='array',
                      categoryarray= orderedGlobalLabels)
 
@@ -732,14 +1006,14 @@ def update_timer_graph(currFig,git_data_type,commit_since,commit_interval,labels
     Output(component_id='commit-info', component_property='children',allow_duplicate=True),
     State(component_id='commit-info', component_property='children'),
     Input(component_id='PlotTimerSpecific', component_property='clickData'),
-    State(component_id='PlotTimerSpecific', component_property='figure'),
+    State(component_id='timer-traces', component_property='data'),
     State(component_id='sceneName', component_property='value'),
     prevent_initial_call=True)
-def display_click_commit_info_data_from_timer(currCommitInfo,clickData,figure,sceneName):
+def display_click_commit_info_data_from_timer(currCommitInfo,clickData,timerTraces,sceneName):
 
     if(clickData is not None):
         commitName = clickData['points'][0]['x']
-        timerName = figure['data'][clickData['points'][0]['curveNumber']]['name']
+        timerName = timerTraces['labels'][clickData['points'][0]['curveNumber']]
 
         commitInfo = get_commit_info_data_for_callback(commitName,sceneName,timerName)
         stats = html.P([html.B("Statistics"),
@@ -771,6 +1045,133 @@ def display_click_hard_info_data(currHardInfo,clickData):
 
 
 
+
+
+##### SAMPLES GRAPH #####
+
+@lru_cache(maxsize = g_maxCache)
+def get_samples_for_callback(results,commitHash,sceneName,timerName):
+    # Raw values of each execution, loaded from the sample archive only when a point is clicked
+    isRelease = re.match("v[0-9]{2}.[0-9]{2}",commitHash) is not None
+    data = results.releaseData if isRelease else results.commitData
+    dataId = utils.findCommitId(results.releaseTensor if isRelease else results.commitTensor,commitHash)
+    if(dataId < 0):
+        return None
+    return utils.loadSceneSamples(data[dataId].samplesFile,sceneName,timerName)
+
+
+@callback(
+    Output(component_id='samples-selection', component_property='data',allow_duplicate=True),
+    Input(component_id='PlotOverview', component_property='clickData'),
+    State(component_id='overview-traces', component_property='data'),
+    prevent_initial_call=True)
+def select_samples_from_overview(clickData,sceneNames):
+    return {"commit" : clickData['points'][0]['x'],
+            "scene" : sceneNames[clickData['points'][0]['curveNumber']],
+            "timer" : g_overviewLabel}
+
+
+@callback(
+    Output(component_id='samples-selection', component_property='data',allow_duplicate=True),
+    Input(component_id='PlotTimerSpecific', component_property='clickData'),
+    State(component_id='timer-traces', component_property='data'),
+    State(component_id='sceneName', component_property='value'),
+    prevent_initial_call=True)
+def select_samples_from_timer(clickData,timerTraces,sceneName):
+    return {"commit" : clickData['points'][0]['x'],
+            "scene" : sceneName,
+            "timer" : timerTraces['labels'][clickData['points'][0]['curveNumber']]}
+
+
+@callback(
+    Output(component_id='PlotSamples', component_property='figure'),
+    Output(component_id='samples_selection_info', component_property='children'),
+    Input(component_id='samples-selection', component_property='data'),
+    Input(component_id='samples_view', component_property='value'),
+    prevent_initial_call=True)
+def update_samples_graph(selection,view):
+    if(selection is None):
+        return {}, "Click on a commit in the other graphs to display its raw samples"
+
+    selectionInfo = f"{selection['commit']} - {selection['scene']} - {selection['timer']}"
+    trials = get_samples_for_callback(resultsWatcher.results,selection['commit'],selection['scene'],selection['timer'])
+    if(trials is None):
+        return {}, f"{selectionInfo} : no raw samples archived"
+
+    fig = go.Figure()
+    for trialId, values in enumerate(trials):
+        name = f"Execution {trialId + 1}"
+        if(view == "violin"):
+            fig.add_trace(go.Violin(y=values, name=name, box_visible=True, meanline_visible=True, points=False))
+        elif(view == "ecdf"):
+            fig.add_trace(go.Scatter(x=np.sort(values), y=np.arange(1, len(values) + 1)/len(values), mode='lines', line_shape='hv', name=name))
+        else:
+            fig.add_trace(go.Scatter(y=values, mode='lines', name=name))
+
+    if(view == "violin"):
+        fig.add_trace(go.Violin(y=np.concatenate(trials), name="All executions", box_visible=True, meanline_visible=True, points=False))
+        xTitle, yTitle = "Execution", "Computation time (ms)"
+    elif(view == "ecdf"):
+        xTitle, yTitle = "Computation time (ms)", "Fraction of the samples"
+    else:
+        xTitle, yTitle = "Sample (time step)", "Computation time (ms)"
+
+    fig.update_layout(
+        title=dict(
+            text=f"Raw samples of {selection['timer']} in {selection['scene']}",
+            x=0.5,
+            font=dict(
+                size=20
+            )
+        ),
+        yaxis=dict(
+            title=dict(
+                text=yTitle)
+        ),
+        xaxis=dict(
+            title=dict(
+                text=xTitle)
+        ),
+        height=725
+    )
+
+    return fig, selectionInfo
+
+
+
+##### RESULTS INGESTION #####
+
+def invalidate_caches_for_results(results, onlyAdded):
+    # The entries of the caches taking the results as parameter can't be reused anymore, they are released
+    get_ids_for_callback.cache_clear()
+    get_scenes_names_for_callback.cache_clear()
+    get_overview_change_points_for_callback.cache_clear()
+    get_samples_for_callback.cache_clear()
+    # The hardware info of a hash which was not found yet may be in the added files
+    get_hard_info_data_for_callback.cache_clear()
+    # The information of the existing commits only changes if their files have been modified or removed
+    if(not onlyAdded):
+        get_commit_info_data_with_metadata.cache_clear()
+
+def update_commit_metadata_for_results(results, onlyAdded):
+    if(isCommitMetadataWriter()):
+        commitMetadata.updateInBackground([snap.fullHash for snap in results.releaseData + results.commitData])
+
+if(instrumentation.isEnabled()):
+    for cachedFunction in (get_ids_for_callback, get_scenes_names_for_callback, get_commit_info_data_with_metadata,
+                           get_hard_info_data_for_callback, get_overview_change_points_for_callback, get_samples_for_callback):
+        instrumentation.registerCache(cachedFunction.__name__, cachedFunction)
+    instrumentation.registerCache("figureCache", figureCache)
+    instrumentation.registerGauge("dashboard_results_generation", "Generation of the results displayed", lambda : {"" : resultsWatcher.results.generation})
+    instrumentation.registerGauge("dashboard_results_commits", "Number of commits of the results displayed",
+                                  lambda : {'type="releases"' : len(resultsWatcher.results.releaseData), 'type="commits"' : len(resultsWatcher.results.commitData)})
+
+resultsWatcher.addListener(invalidate_caches_for_results)
+resultsWatcher.addListener(update_commit_metadata_for_results)
+if(watchInterval > 0):
+    resultsWatcher.start(watchInterval)
+
+
 # Run the app
 if __name__ == '__main__':
-    app.run_server()
\ No newline at end of file
+    app.run_server()
@@ -0,0 +1,159 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+import plotly.io
+from utils import ERROR_TYPE
+
+try:
+    import redis
+except(ImportError):
+    redis = None
+
+
+#### Figure cache ####
+# brief: Cache of the figures computed by the callbacks of the dashboard, shared by all the workers and kept across
+#        restarts when it is backed by Redis, so that the usual views are served without computing them again.
+#
+# details:
+# - A cached method takes the results (see results_watcher.LoadedResults) as first parameter. Its key is built from the
+#   name of the method, the dataId of the results (digest of their statistics, the same in all the workers and after a
+#   restart for the same results) and the other parameters. Entries computed on previous results are never reused and
+#   are evicted by their TTL or by the size limit.
+# - The figures are stored serialized in JSON (plotly.io.to_json) and returned as dict, which Dash sends as is.
+#   ERROR_RETURNED (see utils.py) is returned without being cached.
+# - Two backends with the same interface get(key) -> bytes or None / set(key, payload, ttl) :
+#   - MemoryCacheBackend : in the process, least recently used entries evicted when the payloads exceed maxBytes
+#   - RedisCacheBackend  : in a Redis server, the size limit is the maxmemory of the server (see docker-compose.yaml).
+#     If the server is unreachable the callbacks compute the figures as without cache.
+#
+# usage:
+#   figureCache = FigureCache(makeCacheBackend(os.environ.get('PR_CACHE_URL')), ttl)
+#   @figureCache.cached("overview")
+#   def get_overview_figure_for_callback(results, ...):
+#       return fig
+######################
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_BYTES = 64*1024*1024
+KEY_PREFIX = "sofa-dashboard:figure:"
+
+
+class MemoryCacheBackend():
+
+    def __init__(self, maxBytes : int = DEFAULT_MAX_BYTES):
+        self.maxBytes = maxBytes
+        self.size     = 0                # Sum of the sizes of the payloads
+        self._entries = OrderedDict()    # key : (payload, expiration time), the least recently used first
+        self._lock    = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key : str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if(entry is None):
+                return None
+            payload, expiration = entry
+            if(expiration < time.monotonic()):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def set(self, key : str, payload : bytes, ttl : float):
+        if(len(payload) > self.maxBytes):
+            return
+        with self._lock:
+            if(key in self._entries):
+                self._remove(key)
+            self._entries[key] = (payload, time.monotonic() + ttl)
+            self.size += len(payload)
+            while(self.size > self.maxBytes):
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key : str):
+        payload, expiration = self._entries.pop(key)
+        self.size -= len(payload)
+
+
+class RedisCacheBackend():
+
+    def __init__(self, url : str):
+        self.url     = url
+        self._client = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+
+    def get(self, key : str):
+        try:
+            return self._client.get(KEY_PREFIX + key)
+        except(redis.RedisError) as error:
+            print(f"[WARNING] Cannot read the figure cache {self.url} : {error}")
+            return None
+
+    def set(self, key : str, payload : bytes, ttl : float):
+        try:
+            self._client.set(KEY_PREFIX + key, payload, ex=max(1, int(ttl)))
+        except(redis.RedisError) as error:
+            print(f"[WARNING] Cannot write the figure cache {self.url} : {error}")
+
+    def clear(self):
+        try:
+            keys = list(self._client.scan_iter(match=KEY_PREFIX + "*"))
+            if(len(keys) != 0):
+                self._client.delete(*keys)
+        except(redis.RedisError) as error:
+            print(f"[WARNING] Cannot clear the figure cache {self.url} : {error}")
+
+
+def makeCacheBackend(url : str = None, maxBytes : int = DEFAULT_MAX_BYTES):
+    # Return a RedisCacheBackend for a 'redis://' url, a MemoryCacheBackend otherwise (or if redis isn't installed)
+    if(url):
+        if(redis is None):
+            print(f"[WARNING] The python package redis is not installed, the figure cache is kept in memory instead of {url}")
+        else:
+            return RedisCacheBackend(url)
+    return MemoryCacheBackend(maxBytes)
+
+
+class FigureCache():
+
+    def __init__(self, backend, ttl : float = DEFAULT_TTL):
+        self.backend = backend
+        self.ttl     = ttl
+        self.hits    = 0
+        self.misses  = 0
+
+    @staticmethod
+    def makeKey(name : str, dataId : str, parameters : tuple):
+        # Digest of the JSON of the parameters, which are the values of the dash components (str, numbers, lists, None)
+        parametersDigest = hashlib.blake2b(json.dumps(parameters, default=str).encode(), digest_size=16).hexdigest()
+        return f"{name}:{dataId}:{parametersDigest}"
+
+    def cached(self, name : str):
+        def decorator(function):
+            @wraps(function)
+            def wrapper(results, *parameters):
+                key = FigureCache.makeKey(name, results.dataId, parameters)
+                payload = self.backend.get(key)
+                if(payload is not None):
+                    self.hits += 1
+                    return json.loads(payload)
+
+                self.misses += 1
+                figure = function(results, *parameters)
+                if(isinstance(figure, ERROR_TYPE)):
+                    return figure
+                payload = plotly.io.to_json(figure, validate=False).encode()
+                self.backend.set(key, payload, self.ttl)
+                return json.loads(payload)
+            return wrapper
+        return decorator
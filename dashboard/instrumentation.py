@@ -0,0 +1,173 @@
+import os
+import time
+import bisect
+import threading
+from functools import wraps
+
+from flask import Response, g, request
+
+
+#### Instrumentation ####
+# brief: Opt-in metrics of the dashboard (latency of the callbacks and of the heavy functions, sizes of the responses,
+#        hit ratios of the caches), exposed in the Prometheus text format on the route /metrics of the Flask server.
+#
+# details:
+# - Enabled by the env variable PR_METRICS=1. When it isn't set nothing is wrapped and no route is added, the dashboard
+#   runs exactly the same code as without instrumentation.
+# - Dash callbacks : all of them go through the route /_dash-update-component, the duration and the size of each
+#   response are recorded per output of the callback (e.g. 'PlotOverview.figure').
+# - Functions : instrumentFunctions replaces functions of a module by a wrapper recording their duration, so the other
+#   modules calling them as <module>.<function> (and the module itself) are measured.
+# - Caches : the functions decorated by lru_cache (cache_info) and the objects with hits and misses attributes (see
+#   figure_cache.FigureCache) are read at each scrape. lru_cache counters are reset by cache_clear, they are exported as
+#   gauges.
+# - The metrics are kept per process : with several gunicorn workers, each scrape gives the metrics of one of them.
+#
+# usage:
+#   if(instrumentation.isEnabled()):
+#       instrumentation.instrumentFunctions(utils, ["loadAllResults", ...])
+#       instrumentation.instrumentServer(server)
+#       instrumentation.registerCache("get_ids_for_callback", get_ids_for_callback)
+#########################
+
+DURATION_BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+SIZE_BUCKETS = [1e3, 1e4, 1e5, 1e6, 1e7]
+
+def isEnabled():
+    return os.environ.get('PR_METRICS', '0') not in ('', '0')
+
+
+class Histogram():
+
+    def __init__(self, name : str, help : str, labelName : str, buckets : list[float]):
+        self.name      = name
+        self.help      = help
+        self.labelName = labelName
+        self.buckets   = buckets
+        self._series   = {}    # label : [count per bucket (+Inf last), sum]
+        self._lock     = threading.Lock()
+
+    def observe(self, label : str, value : float):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if(series is None):
+                series = self._series[label] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    def export(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {label : ([*counts], total) for label, (counts, total) in self._series.items()}
+        for label, (counts, total) in sorted(series.items()):
+            labelValue = _escape(label)
+            cumulated = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulated += count
+                lines.append(f'{self.name}_bucket{{{self.labelName}="{labelValue}",le="{bound}"}} {cumulated}')
+            lines.append(f'{self.name}_sum{{{self.labelName}="{labelValue}"}} {total}')
+            lines.append(f'{self.name}_count{{{self.labelName}="{labelValue}"}} {cumulated}')
+        return lines
+
+
+def _escape(value : str):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+callbackDuration = Histogram("dashboard_callback_duration_seconds", "Duration of the Dash callbacks", "callback", DURATION_BUCKETS)
+callbackResponseSize = Histogram("dashboard_callback_response_bytes", "Size of the responses of the Dash callbacks", "callback", SIZE_BUCKETS)
+requestDuration = Histogram("dashboard_request_duration_seconds", "Duration of the other HTTP requests", "route", DURATION_BUCKETS)
+functionDuration = Histogram("dashboard_function_duration_seconds", "Duration of the instrumented functions", "function", DURATION_BUCKETS)
+_caches = {}
+_gauges = []
+
+
+def timed(name : str, function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            functionDuration.observe(name, time.perf_counter() - start)
+    if(hasattr(function, "cache_info")):
+        wrapper.cache_info = function.cache_info
+        wrapper.cache_clear = function.cache_clear
+    return wrapper
+
+def instrumentFunctions(module, names : list[str]):
+    for name in names:
+        function = getattr(module, name)
+        if(hasattr(function, "cache_info")):
+            registerCache(f"{module.__name__}.{name}", function)
+        setattr(module, name, timed(f"{module.__name__}.{name}", function))
+
+def registerCache(name : str, cache):
+    # cache : function decorated by lru_cache, or object with hits and misses attributes
+    _caches[name] = cache
+
+def registerGauge(name : str, help : str, getValues):
+    # getValues() returns { labels as 'key="value"' (or '') : value }, called at each scrape
+    _gauges.append((name, help, getValues))
+
+
+def _exportCaches():
+    lines = []
+    values = {}
+    for name, cache in sorted(_caches.items()):
+        if(hasattr(cache, "cache_info")):
+            info = cache.cache_info()
+            values[name] = (info.hits, info.misses, info.currsize)
+        else:
+            values[name] = (cache.hits, cache.misses, len(cache.backend) if hasattr(cache.backend, "__len__") else None)
+    for metric, position, help in (("dashboard_cache_hits", 0, "Hits of the caches since their last clear"),
+                                   ("dashboard_cache_misses", 1, "Misses of the caches since their last clear"),
+                                   ("dashboard_cache_entries", 2, "Number of entries of the caches")):
+        lines += [f"# HELP {metric} {help}", f"# TYPE {metric} gauge"]
+        for name, cacheValues in values.items():
+            if(cacheValues[position] is not None):
+                lines.append(f'{metric}{{cache="{_escape(name)}"}} {cacheValues[position]}')
+    lines += ["# HELP dashboard_cache_hit_ratio Hits over calls of the caches since their last clear", "# TYPE dashboard_cache_hit_ratio gauge"]
+    for name, (hits, misses, entries) in values.items():
+        if(hits + misses > 0):
+            lines.append(f'dashboard_cache_hit_ratio{{cache="{_escape(name)}"}} {hits / (hits + misses)}')
+    return lines
+
+def exportMetrics():
+    lines = []
+    for histogram in (callbackDuration, callbackResponseSize, requestDuration, functionDuration):
+        lines += histogram.export()
+    lines += _exportCaches()
+    for name, help, getValues in _gauges:
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+        for labels, value in getValues().items():
+            lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def instrumentServer(server):
+    # Measure the requests of the Flask server and add the route /metrics
+    @server.before_request
+    def startTimer():
+        g.metricsStart = time.perf_counter()
+
+    @server.after_request
+    def recordRequest(response):
+        start = g.pop("metricsStart", None)
+        if(start is None):
+            return response
+        duration = time.perf_counter() - start
+        if(request.path.endswith("/_dash-update-component")):
+            # Output of the callback, e.g. 'PlotOverview.figure' or '..PlotOverview.figure...overview-traces.data..'
+            payload = request.get_json(silent=True) or {}
+            output = payload.get("output", "unknown")
+            callbackDuration.observe(output, duration)
+            if(not response.direct_passthrough):
+                callbackResponseSize.observe(output, response.calculate_content_length() or 0)
+        elif(request.url_rule is not None):
+            requestDuration.observe(request.url_rule.rule, duration)
+        return response
+
+    @server.route("/metrics")
+    def metrics():
+        return Response(exportMetrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,233 @@
+import sys
+import os
+import sqlite3
+import datetime
+import numpy as np
+import utils
+from utils import FullStatSnap
+
+
+#### Results store ####
+# brief: Single SQLite file 'results.db' gathering all the statistics files (.csv) and hardware info files (.info) of
+#        the folder old_results, so that the dashboard loads the history in one query instead of parsing each file.
+#
+# details:
+# - Tables :
+#   - results    : one line per statistics file (commit or release), keyed by its hash ("vXX.YY" for releases)
+#   - scenes     : dictionary of the scene names
+#   - timers     : dictionary of the timer names
+#   - statistics : one line per result x scene, in the order of the statistics file, with two columnar blobs :
+#                  - timerIds   : int32 array of the ids of the timers of the scene
+#                  - statistics : float64 array (number of timers x STATISTICS_COLUMNS) of the statistics computed by
+#                                 computeSingleData (generate_statistics/methods.py), NaN if not computed
+# - Loading the whole store is a sequential read of the tables, the blobs being concatenated and converted at once by
+#   NumPy instead of converting each value. The statistics are indexed by (scene, result) and the results by date, so
+#   that getting the history of a timer of a scene since a date only reads the lines of this scene.
+# - The store is append only : adding again a result with the same hash replaces it.
+# - The sample archives (.samples.npz) stay in the results folder, only their name is stored.
+# - The store is not versioned with old_results (see .gitignore), it is built on the dashboard side : once imported,
+#   the dashboard appends the files pushed by the CI when it ingests them (see results_watcher.py).
+# - The dashboard reads from the store the files which are not in its snapshot (see utils.loadAllResults), the files
+#   which are not in the store or were modified after it are parsed.
+#
+# usage:
+# - python3 results_store.py import <resultsDir>                  : (re)build <resultsDir>/results.db from all the files of the folder
+# - python3 results_store.py append <resultsDir> <csvFile> [...]  : add the given statistics files (and their .info file) to
+#                                                                    the store, the whole folder is imported if the store doesn't exist
+#######################
+
+RESULTS_STORE_VERSION = 1
+
+STATISTICS_COLUMNS = utils.STATISTICS_NAMES
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id          INTEGER PRIMARY KEY,
+    hash        TEXT NOT NULL UNIQUE,
+    sortKey     TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    isRelease   INTEGER NOT NULL,
+    hardInfo    TEXT,
+    samplesFile TEXT
+);
+CREATE INDEX IF NOT EXISTS resultsByDate ON results (isRelease, date);
+CREATE TABLE IF NOT EXISTS scenes (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS timers (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS statistics (
+    resultId   INTEGER NOT NULL REFERENCES results(id) ON DELETE CASCADE,
+    sceneOrder INTEGER NOT NULL,
+    sceneId    INTEGER NOT NULL REFERENCES scenes(id),
+    timerIds   BLOB NOT NULL,
+    statistics BLOB NOT NULL,
+    PRIMARY KEY (resultId, sceneOrder)
+);
+CREATE INDEX IF NOT EXISTS statisticsByScene ON statistics (sceneId, resultId);
+"""
+
+
+def openResultsStore(storePath):
+    connection = sqlite3.connect(storePath)
+    connection.execute("PRAGMA foreign_keys = ON")
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if(version == 0):
+        connection.executescript(_SCHEMA)
+        connection.execute(f"PRAGMA user_version = {RESULTS_STORE_VERSION}")
+    elif(version != RESULTS_STORE_VERSION):
+        connection.close()
+        raise ValueError(f"{storePath} has version {version} instead of {RESULTS_STORE_VERSION}, it must be imported again")
+    return connection
+
+def _getNameId(connection, table, name, cache):
+    if(name not in cache):
+        connection.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+        cache[name] = connection.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()[0]
+    return cache[name]
+
+def appendResultFile(connection, csvFileName, nameCache=None, snap=None):
+    # Add (or replace) the statistics file and its hardware info file in the store
+    # snap : FullStatSnap of the file if it is already parsed, with its statistics
+    if(nameCache is None):
+        nameCache = ({}, {})
+    resultsDir, fileName = os.path.split(csvFileName)
+    fullHash, sortKey, dateTime, isRelease, infoFileName = utils.parseResultFileName(fileName)
+
+    with open(os.path.join(resultsDir, infoFileName), 'r') as file:
+        hardInfo = file.read()
+    samplesFile = fileName[:-len('.csv')] + utils.SAMPLE_ARCHIVE_EXTENSION
+    if(not os.path.isfile(os.path.join(resultsDir, samplesFile))):
+        samplesFile = None
+
+    if(snap is None):
+        snap = utils.loadCSVStatistic(csvFileName)
+
+    connection.execute("DELETE FROM results WHERE hash = ?", (fullHash,))
+    resultId = connection.execute("INSERT INTO results (hash, sortKey, date, isRelease, hardInfo, samplesFile) VALUES (?, ?, ?, ?, ?, ?)",
+                                  (fullHash, sortKey, dateTime.isoformat(), int(isRelease), hardInfo, samplesFile)).lastrowid
+
+    rows = []
+    for sceneOrder, sceneName in enumerate(snap.sceneNames):
+        sceneId = _getNameId(connection, "scenes", sceneName, nameCache[0])
+        timerIds = [_getNameId(connection, "timers", snap.timerNames[timerIndex], nameCache[1]) for timerIndex in snap.sceneTimers[sceneOrder]]
+        rows.append((resultId, sceneOrder, sceneId, np.array(timerIds, dtype=np.int32).tobytes(),
+                     np.ascontiguousarray(snap.sceneStatistics[sceneOrder], dtype=np.float64).tobytes()))
+    connection.executemany("INSERT INTO statistics VALUES (?, ?, ?, ?, ?)", rows)
+
+def importResultsDir(resultsDir, storePath=None):
+    # Build the store from all the statistics files of the folder, replacing any existing store
+    if(storePath is None):
+        storePath = os.path.join(resultsDir, utils.RESULTS_STORE_NAME)
+    tmpPath = f"{storePath}.{os.getpid()}.tmp"
+    if(os.path.exists(tmpPath)):
+        os.remove(tmpPath)
+
+    connection = openResultsStore(tmpPath)
+    nameCache = ({}, {})
+    with connection:
+        for fileName in sorted(os.listdir(resultsDir)):
+            if(os.path.isfile(os.path.join(resultsDir, fileName)) and fileName.endswith('.csv')):
+                appendResultFile(connection, os.path.join(resultsDir, fileName), nameCache)
+    connection.execute("VACUUM")
+    connection.close()
+
+    # Replace the store at once so that the dashboard never reads a partial store
+    os.replace(tmpPath, storePath)
+
+def appendResultFiles(resultsDir, csvFileNames, snaps=None):
+    # snaps : FullStatSnap of the files if they are already parsed, in the order of csvFileNames
+    storePath = os.path.join(resultsDir, utils.RESULTS_STORE_NAME)
+    if(not os.path.isfile(storePath)):
+        importResultsDir(resultsDir, storePath)
+        return
+
+    connection = openResultsStore(storePath)
+    nameCache = ({}, {})
+    with connection:
+        for csvFileName, snap in zip(csvFileNames, snaps if snaps is not None else [None]*len(csvFileNames)):
+            appendResultFile(connection, csvFileName, nameCache, snap)
+    connection.close()
+
+
+def loadResultFilesFromStore(storePath, resultsDir, fileNames):
+    # Return { "fileName" : ((size, mtime), FullStatSnap),... } as utils.loadResultFiles for the statistics files of
+    # fileNames which are in the store and were not modified after its last write, the other ones are not returned
+    storeTime = os.stat(storePath).st_mtime_ns
+    wanted = {}
+    for fileName in fileNames:
+        fileStat = os.stat(os.path.join(resultsDir, fileName))
+        if(fileStat.st_mtime_ns <= storeTime):
+            wanted[utils.parseResultFileName(fileName)[0]] = (fileName, (fileStat.st_size, fileStat.st_mtime_ns))
+    if(len(wanted) == 0):
+        return {}
+
+    connection = openResultsStore(storePath)
+    results = [row for row in connection.execute("SELECT id, hash, date, hardInfo, samplesFile FROM results ORDER BY id") if row[1] in wanted]
+    sceneNames = dict(connection.execute("SELECT id, name FROM scenes").fetchall())
+    timerNames = dict(connection.execute("SELECT id, name FROM timers").fetchall())
+    # Only the statistics of the wanted results are read
+    connection.execute("CREATE TEMP TABLE wanted (id INTEGER PRIMARY KEY)")
+    connection.executemany("INSERT INTO wanted VALUES (?)", [(row[0],) for row in results])
+    statistics = connection.execute("""SELECT resultId, sceneId, timerIds, statistics FROM statistics
+                                       WHERE resultId IN (SELECT id FROM wanted) ORDER BY resultId, sceneOrder""").fetchall()
+    connection.close()
+
+    files = {}
+    snaps = {}
+    for resultId, fullHash, date, hardInfo, samplesFile in results:
+        snap = FullStatSnap(fullHash, datetime.datetime.fromisoformat(date))
+        snap.setHardInfo(hardInfo.split('\n') if hardInfo is not None else [])
+        if(samplesFile is not None):
+            snap.setSamplesFile(os.path.join(resultsDir, samplesFile))
+        snaps[resultId] = snap
+        fileName, fileKey = wanted[fullHash]
+        files[fileName] = (fileKey, snap)
+
+    # All blobs are converted at once, then split per scene
+    if(len(statistics) > 0):
+        allTimerIds = np.frombuffer(b"".join(row[2] for row in statistics), dtype=np.int32).tolist()
+        allValues = np.frombuffer(b"".join(row[3] for row in statistics), dtype=np.float64).reshape(-1, len(STATISTICS_COLUMNS))
+
+    offset = 0
+    for resultId, sceneId, timerIds, values in statistics:
+        end = offset + len(timerIds)//4
+        snaps[resultId].addScene(sceneNames[sceneId], [timerNames[timerId] for timerId in allTimerIds[offset:end]], allValues[offset:end])
+        offset = end
+    return files
+
+
+def queryTimerHistory(storePath, sceneName, timerName, since=None, isRelease=False):
+    # History of one timer of one scene sorted by date, only reading the lines of the scene thanks to the indexes
+    # Returns (hashes, dates, statistics) with statistics a np array (number of results x len(STATISTICS_COLUMNS)), NaN if not computed
+    connection = openResultsStore(storePath)
+    timerId = connection.execute("SELECT id FROM timers WHERE name = ?", (timerName,)).fetchone()
+    rows = connection.execute("""SELECT results.hash, results.date, statistics.timerIds, statistics.statistics
+                                 FROM statistics
+                                 JOIN results ON results.id = statistics.resultId
+                                 WHERE statistics.sceneId = (SELECT id FROM scenes WHERE name = ?)
+                                   AND results.isRelease = ? AND results.date >= ?
+                                 ORDER BY results.sortKey""",
+                              (sceneName, int(isRelease), since.isoformat() if since is not None else "")).fetchall()
+    connection.close()
+
+    hashes = []
+    dates = []
+    statistics = []
+    for fullHash, date, timerIds, values in rows:
+        position = np.flatnonzero(np.frombuffer(timerIds, dtype=np.int32) == (timerId[0] if timerId is not None else -1))
+        if(len(position) > 0):
+            hashes.append(fullHash)
+            dates.append(datetime.datetime.fromisoformat(date))
+            statistics.append(np.frombuffer(values, dtype=np.float64).reshape(-1, len(STATISTICS_COLUMNS))[position[0]])
+    return hashes, dates, np.array(statistics, dtype=np.float64).reshape(len(statistics), len(STATISTICS_COLUMNS))
+
+
+if __name__=="__main__":
+    if((len(sys.argv) >= 3) and (sys.argv[1] == "import")):
+        utils.tic()
+        importResultsDir(sys.argv[2])
+        utils.tac()
+    elif((len(sys.argv) >= 4) and (sys.argv[1] == "append")):
+        appendResultFiles(sys.argv[2], sys.argv[3:])
+    else:
+        print("usage : python3 results_store.py import <resultsDir>")
+        print("        python3 results_store.py append <resultsDir> <csvFile> [<csvFile> ...]")
+        exit(1)
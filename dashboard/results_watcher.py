@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+import utils
+from utils import FullStatSnap, StatTensor
+
+
+#### Results watcher ####
+# brief: Keeps the results loaded by the dashboard up to date with the folder old_results while it is running, so that
+#        the results pushed by each CI run are displayed without restarting the dashboard.
+#
+# details:
+# - The results are held by one LoadedResults object which is never modified : each change of the folder builds a new
+#   one which replaces the previous one at once (atomic swap of the reference). A callback which took the current
+#   results at its beginning works on a coherent set until its end, even if results are ingested meanwhile.
+# - The statistics are only held by the tensors of LoadedResults, its FullStatSnap only keep a reference to their row
+#   (see FullStatSnap.withoutStatistics). The files are then tracked with the snaps of the current results, and the
+#   snapshot saves them with the tensors.
+# - The folder is polled every interval seconds from a background thread : only the statistics files (.csv) added or
+#   modified since the last poll are parsed (see utils.loadResultFiles), the others are reused. Files modified less
+#   than settleTime seconds ago are left for the next poll, they may still be written.
+# - When files are only added, the ids of the existing commits are kept and the commit StatTensor is extended instead
+#   of being built again. Otherwise (file modified or removed) both tensors are built again.
+# - The files which are not in the snapshot are read from the results store if there is one (see results_store.py),
+#   and the ingested files are appended to it. The store is only used to avoid parsing the files : the results are
+#   always the statistics files of the folder, ingested as above whether there is a store or not.
+# - The listeners are called after each swap with the new results and whether files were only added, to invalidate
+#   the caches depending on the results.
+#
+# usage:
+#   watcher = ResultsWatcher(resultsDir, snapshotPath)
+#   watcher.addListener(lambda results, onlyAdded : ...)
+#   watcher.start(interval)
+#   results = watcher.results
+#########################
+
+DEFAULT_SETTLE_TIME = 2.0
+
+class LoadedResults():
+    releaseData : list[FullStatSnap]
+    commitData : list[FullStatSnap]
+    sortedReleaseIdx : list[int]
+    sortedCommitIdx : list[int]
+    releaseTensor : StatTensor    # Dense statistics of releaseData, with the same ids
+    commitTensor : StatTensor     # Dense statistics of commitData, with the same ids
+    generation : int              # Incremented at each swap
+    # dataId : str                # Digest of the tensors, identifies the same results in other processes. Computed on first access
+
+    def __init__(self, releaseData, commitData, sortedReleaseIdx, sortedCommitIdx, releaseTensor=None, commitTensor=None, generation=0):
+        self.sortedReleaseIdx = sortedReleaseIdx
+        self.sortedCommitIdx  = sortedCommitIdx
+        self.releaseTensor    = releaseTensor if releaseTensor is not None else StatTensor(releaseData)
+        self.commitTensor     = commitTensor if commitTensor is not None else StatTensor(commitData)
+        # The statistics are only kept in the tensors, the snaps keep a reference to their row
+        self.releaseData      = [snap.withoutStatistics(self.releaseTensor, row) for row, snap in enumerate(releaseData)]
+        self.commitData       = [snap.withoutStatistics(self.commitTensor, row) for row, snap in enumerate(commitData)]
+        self.generation       = generation
+        self._dataId          = None
+
+    @property
+    def dataId(self):
+        if(self._dataId is None):
+            digest = hashlib.blake2b(digest_size=16)
+            for tensor in (self.releaseTensor, self.commitTensor):
+                digest.update(repr((tensor.values.shape, tensor.sceneNames, tensor.timerNames)).encode())
+                digest.update(memoryview(np.ascontiguousarray(tensor.values)).cast('B'))
+                digest.update(np.ascontiguousarray(tensor.commits).tobytes())
+            self._dataId = digest.hexdigest()
+        return self._dataId
+
+
+class ResultsWatcher():
+
+    def __init__(self, resultsDir : str, snapshotPath : str = None, settleTime : float = DEFAULT_SETTLE_TIME):
+        self.resultsDir   = resultsDir
+        self.snapshotPath = snapshotPath
+        self.settleTime   = settleTime
+        self._listeners   = []
+        self._thread      = None
+        self._stopEvent   = threading.Event()
+
+        snapshot = utils.loadResultsSnapshot(snapshotPath, resultsDir)
+        files = utils.loadResultFiles(resultsDir, utils.loadKnownResultFiles(resultsDir, snapshot))
+        self.results = LoadedResults(*utils.buildResultsLists(files))
+        self._files = utils.replaceResultsSnaps(files, self.results.releaseData, self.results.commitData)
+        utils.updateResultsSnapshot(snapshotPath, resultsDir, snapshot, self._files)
+        self._samplesFiles = self._getSamplesFiles()
+
+    def addListener(self, listener):
+        # listener(results : LoadedResults, onlyAdded : bool) is called from the watcher thread after each swap
+        self._listeners.append(listener)
+
+    def _getSamplesFiles(self):
+        return {f : snap.samplesFile for f, (fileKey, snap) in self._files.items()}
+
+    def poll(self):
+        # Ingest the changes of the folder since the last call, return True if the results have been replaced
+        previous = self.results
+        files = utils.loadResultFiles(self.resultsDir, self._files, self.settleTime)
+        added = [f for f in files if f not in self._files]
+        changed = [f for f in files if (f in self._files) and (files[f][0] != self._files[f][0])]
+        removed = [f for f in self._files if f not in files]
+        samplesFiles = {f : snap.samplesFile for f, (fileKey, snap) in files.items()}
+        if((len(added) == 0) and (len(changed) == 0) and (len(removed) == 0)):
+            if(samplesFiles == self._samplesFiles):
+                return False
+            # Only a sample archive appeared or disappeared : the statistics and the ids are the same, only the
+            # FullStatSnap of the files concerned have been replaced
+            self._samplesFiles = samplesFiles
+            releaseData, commitData, sortedReleaseIdx, sortedCommitIdx = utils.buildResultsLists(files)
+            results = LoadedResults(releaseData, commitData, sortedReleaseIdx, sortedCommitIdx,
+                                    previous.releaseTensor, previous.commitTensor, previous.generation + 1)
+            self._files = utils.replaceResultsSnaps(files, results.releaseData, results.commitData)
+            self._swap(results, True)
+            return True
+
+        previousFiles = self._files
+        self._samplesFiles = samplesFiles
+        self._appendToStore(added + changed, files)
+        releaseData, commitData, sortedReleaseIdx, sortedCommitIdx = utils.buildResultsLists(files)
+
+        onlyAdded = (len(changed) == 0) and (len(removed) == 0)
+        commitTensor = None
+        if(onlyAdded):
+            # The new files are after the previous ones in files, so the existing commits keep their ids
+            commitTensor = previous.commitTensor.extended(commitData[len(previous.commitData):])
+        results = LoadedResults(releaseData, commitData, sortedReleaseIdx, sortedCommitIdx, None, commitTensor, previous.generation + 1)
+        self._files = utils.replaceResultsSnaps(files, results.releaseData, results.commitData)
+        utils.updateResultsSnapshot(self.snapshotPath, self.resultsDir, previousFiles, self._files)
+        self._swap(results, onlyAdded)
+        print(f"[INFO] Results ingested : {len(added)} added, {len(changed)} modified, {len(removed)} removed")
+        return True
+
+    def _appendToStore(self, fileNames : list[str], files : dict):
+        # Add the ingested files to the results store if there is one, it is never created here (see results_store.py)
+        storePath = os.path.join(self.resultsDir, utils.RESULTS_STORE_NAME)
+        if((len(fileNames) == 0) or not os.path.isfile(storePath)):
+            return
+        import results_store
+        try:
+            # The FullStatSnap of the ingested files still have their statistics
+            results_store.appendResultFiles(self.resultsDir, [os.path.join(self.resultsDir, f) for f in fileNames], [files[f][1] for f in fileNames])
+        except(sqlite3.Error, OSError, ValueError) as error:
+            print(f"[WARNING] Cannot add the ingested files to the results store {storePath} : {error}")
+
+    def _swap(self, results : LoadedResults, onlyAdded : bool):
+        self.results = results
+        for listener in self._listeners:
+            listener(results, onlyAdded)
+
+    def _run(self, interval : float):
+        while(not self._stopEvent.wait(interval)):
+            try:
+                self.poll()
+            except(Exception) as error:
+                # The dashboard keeps the current results, the next poll will try again
+                print(f"[WARNING] Cannot ingest the new results of {self.resultsDir} : {error}")
+
+    def start(self, interval : float):
+        if(self._thread is None):
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="ResultsWatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopEvent.set()
+        if(self._thread is not None):
+            self._thread.join()
+            self._thread = None
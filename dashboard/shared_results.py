@@ -0,0 +1,196 @@
+import os
+import json
+import shutil
+import datetime
+import threading
+import numpy as np
+from utils import FullStatSnap, StatTensor
+from results_watcher import ResultsWatcher, LoadedResults
+
+try:
+    import fcntl
+except(ImportError):
+    fcntl = None
+
+
+#### Shared results ####
+# brief: Results of the dashboard exported to memory mapped files shared by all the workers of a gunicorn deployment,
+#        so that N workers use the memory of one copy of the results (the OS page cache) instead of N private copies.
+#
+# details:
+# - One worker, the writer, holds an exclusive lock on '<datasetDir>/writer.lock'. It parses old_results and ingests
+#   the new results (see results_watcher.py), and exports each version of the results in a new folder
+#   'generation-<N>' of datasetDir :
+#   - '<release|commit>.values.npy'  : values of the StatTensor (commits x scenes x timers x statistics)
+#   - '<release|commit>.commits.npy' : commit table of the StatTensor
+#   - 'meta.json' : scene and timer names of each tensor, sorted ids, and for each FullStatSnap its hash, date, hard info
+#                   file and sample archive (FullStatSnap are only kept for these, the statistics are in the tensors).
+#                   'lastRebuild' is the last generation where the ids of the commits changed (file modified or removed,
+#                   new writer), the listeners are told whether files were only added since the generation they used.
+#   The folder is written under a temporary name and renamed, then the file 'current' is replaced with its generation.
+# - All the workers (including the writer) use the arrays of the current generation mapped read-only with np.load, and
+#   check at each poll whether 'current' changed to attach to the new generation.
+# - If the writer stops, the lock is released and the next worker which polls becomes the writer.
+# - The two last generations are kept so that a worker can still attach to the previous one while the writer exports.
+#   Older ones are removed : the workers which still map them keep their mapping until they attach to the new one.
+#
+# usage: same interface as ResultsWatcher
+#   watcher = SharedResultsWatcher(resultsDir, snapshotPath, datasetDir)
+#   watcher.addListener(lambda results, onlyAdded : ...)
+#   watcher.start(interval)
+#   results = watcher.results
+########################
+
+GENERATION_PREFIX = "generation-"
+KEPT_GENERATIONS = 2
+
+def _generationDir(datasetDir : str, generation : int):
+    return os.path.join(datasetDir, f"{GENERATION_PREFIX}{generation}")
+
+def readCurrentGeneration(datasetDir : str):
+    # Return the generation of the current export, None if there is none
+    try:
+        with open(os.path.join(datasetDir, "current"), 'r') as file:
+            return int(file.read())
+    except(OSError, ValueError):
+        return None
+
+def exportResults(results : LoadedResults, datasetDir : str, lastRebuild : int = None):
+    # Write the results in a new generation of datasetDir and make it the current one, return its generation
+    # lastRebuild : see meta.json above, None if the ids of the commits changed with this generation
+    generation = (readCurrentGeneration(datasetDir) or 0) + 1
+    tmpDir = f"{_generationDir(datasetDir, generation)}.{os.getpid()}.tmp"
+    shutil.rmtree(tmpDir, ignore_errors=True)
+    os.makedirs(tmpDir)
+
+    meta = {"lastRebuild" : lastRebuild if lastRebuild is not None else generation,
+            "sortedReleaseIdx" : list(results.sortedReleaseIdx), "sortedCommitIdx" : list(results.sortedCommitIdx)}
+    for name, data, tensor in (("release", results.releaseData, results.releaseTensor), ("commit", results.commitData, results.commitTensor)):
+        np.save(os.path.join(tmpDir, f"{name}.values.npy"), tensor.values)
+        np.save(os.path.join(tmpDir, f"{name}.commits.npy"), tensor.commits)
+        meta[name] = {"sceneNames" : tensor.sceneNames,
+                      "timerNames" : tensor.timerNames,
+                      "snaps" : [[snap.fullHash, snap.dateTime.isoformat(), snap.hardInfoFile, snap.samplesFile] for snap in data]}
+    with open(os.path.join(tmpDir, "meta.json"), 'w') as file:
+        json.dump(meta, file)
+
+    os.replace(tmpDir, _generationDir(datasetDir, generation))
+    with open(os.path.join(datasetDir, f"current.{os.getpid()}.tmp"), 'w') as file:
+        file.write(str(generation))
+    os.replace(os.path.join(datasetDir, f"current.{os.getpid()}.tmp"), os.path.join(datasetDir, "current"))
+
+    # Previous generations
+    for fileName in os.listdir(datasetDir):
+        if(fileName.startswith(GENERATION_PREFIX) and fileName[len(GENERATION_PREFIX):].isdigit()
+           and (int(fileName[len(GENERATION_PREFIX):]) <= generation - KEPT_GENERATIONS)):
+            shutil.rmtree(os.path.join(datasetDir, fileName), ignore_errors=True)
+    return generation
+
+def attachResults(datasetDir : str, generation : int):
+    # Return the LoadedResults of the generation, with the arrays of the tensors mapped read-only
+    generationDir = _generationDir(datasetDir, generation)
+    with open(os.path.join(generationDir, "meta.json"), 'r') as file:
+        meta = json.load(file)
+
+    dataAndTensors = []
+    for name in ("release", "commit"):
+        data = []
+        for fullHash, dateTime, hardInfoFile, samplesFile in meta[name]["snaps"]:
+            snap = FullStatSnap(fullHash, datetime.datetime.fromisoformat(dateTime))
+            snap.setHardInfoFile(hardInfoFile)
+            snap.setSamplesFile(samplesFile)
+            data.append(snap)
+        tensor = StatTensor.fromArrays(np.load(os.path.join(generationDir, f"{name}.values.npy"), mmap_mode='r'),
+                                       np.load(os.path.join(generationDir, f"{name}.commits.npy"), mmap_mode='r'),
+                                       meta[name]["sceneNames"], meta[name]["timerNames"])
+        dataAndTensors.append((data, tensor))
+
+    (releaseData, releaseTensor), (commitData, commitTensor) = dataAndTensors
+    results = LoadedResults(releaseData, commitData, meta["sortedReleaseIdx"], meta["sortedCommitIdx"], releaseTensor, commitTensor, generation)
+    return results, meta["lastRebuild"]
+
+
+class SharedResultsWatcher():
+
+    def __init__(self, resultsDir : str, snapshotPath : str, datasetDir : str, waitInterval : float = 0.5):
+        self.resultsDir   = resultsDir
+        self.snapshotPath = snapshotPath
+        self.datasetDir   = datasetDir
+        self._listeners   = []
+        self._lockFile    = None
+        self._watcher     = None    # ResultsWatcher of the writer, None in the other workers
+        self._lastRebuild = None
+        self._thread      = None
+        self._stopEvent   = threading.Event()
+
+        os.makedirs(datasetDir, exist_ok=True)
+        self._tryToBecomeWriter()
+        # The other workers wait for the first export of the writer
+        generation = readCurrentGeneration(datasetDir)
+        while(generation is None):
+            self._stopEvent.wait(waitInterval)
+            self._tryToBecomeWriter()
+            generation = readCurrentGeneration(datasetDir)
+        self.results = attachResults(datasetDir, generation)[0]
+
+    def isWriter(self):
+        return self._watcher is not None
+
+    def _tryToBecomeWriter(self):
+        if(self._watcher is not None):
+            return
+        if(fcntl is not None):
+            lockFile = open(os.path.join(self.datasetDir, "writer.lock"), 'w')
+            try:
+                fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except(OSError):
+                lockFile.close()
+                return
+            self._lockFile = lockFile
+        print(f"[INFO] Worker {os.getpid()} exports the results to {self.datasetDir}")
+        self._watcher = ResultsWatcher(self.resultsDir, self.snapshotPath)
+        self._watcher.addListener(self._export)
+        self._lastRebuild = exportResults(self._watcher.results, self.datasetDir)
+
+    def _export(self, results : LoadedResults, onlyAdded : bool):
+        generation = exportResults(results, self.datasetDir, self._lastRebuild if onlyAdded else None)
+        if(not onlyAdded):
+            self._lastRebuild = generation
+
+    def addListener(self, listener):
+        # listener(results : LoadedResults, onlyAdded : bool) is called after each attach to a new generation
+        self._listeners.append(listener)
+
+    def poll(self):
+        # Ingest the new results if this worker is the writer, then attach to the current generation if it changed
+        self._tryToBecomeWriter()
+        if(self._watcher is not None):
+            self._watcher.poll()
+
+        generation = readCurrentGeneration(self.datasetDir)
+        if((generation is None) or (generation == self.results.generation)):
+            return False
+        previousGeneration = self.results.generation
+        self.results, lastRebuild = attachResults(self.datasetDir, generation)
+        for listener in self._listeners:
+            listener(self.results, lastRebuild <= previousGeneration)
+        return True
+
+    def _run(self, interval : float):
+        while(not self._stopEvent.wait(interval)):
+            try:
+                self.poll()
+            except(Exception) as error:
+                # The worker keeps the current results, the next poll will try again
+                print(f"[WARNING] Cannot update the shared results of {self.datasetDir} : {error}")
+
+    def start(self, interval : float):
+        if(self._thread is None):
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="SharedResultsWatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopEvent.set()
+        if(self._thread is not None):
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,5 @@
+import sys
+import os
+
+# The modules of the dashboard import each other as top level modules (see dashboard.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
@@ -0,0 +1,133 @@
+import pytest
+import plotly.graph_objects as go
+
+import figure_cache
+from figure_cache import MemoryCacheBackend, FigureCache
+from utils import ERROR_RETURNED
+
+
+#### Figure cache tests ####
+# brief: Tests of the in-process backend of the figure cache and of FigureCache.cached, which is the same with Redis.
+#            python3 -m pytest dashboard/tests
+############################
+
+class FakeClock():
+    # Replaces time.monotonic to expire the entries without waiting
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class FakeResults():
+    # Only the dataId of results_watcher.LoadedResults is used by the cache
+    def __init__(self, dataId : str):
+        self.dataId = dataId
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(figure_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_memory_backend_evicts_by_size():
+    backend = MemoryCacheBackend(maxBytes=10)
+    backend.set("a", b"1234", 60)
+    backend.set("b", b"5678", 60)
+    assert (len(backend), backend.size) == (2, 8)
+
+    backend.set("c", b"9012", 60)
+    assert backend.get("a") is None
+    assert backend.get("b") == b"5678"
+    assert backend.get("c") == b"9012"
+    assert (len(backend), backend.size) == (2, 8)
+
+def test_memory_backend_replaces_entry():
+    backend = MemoryCacheBackend(maxBytes=10)
+    backend.set("a", b"1234", 60)
+    backend.set("a", b"123456", 60)
+    assert backend.get("a") == b"123456"
+    assert (len(backend), backend.size) == (1, 6)
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(maxBytes=12)
+    backend.set("a", b"1234", 60)
+    backend.set("b", b"5678", 60)
+    backend.set("c", b"9012", 60)
+    # a becomes the most recently used, b is then the first evicted
+    assert backend.get("a") == b"1234"
+    backend.set("d", b"3456", 60)
+    assert backend.get("b") is None
+    assert [backend.get(key) for key in ("a", "c", "d")] == [b"1234", b"9012", b"3456"]
+
+def test_memory_backend_expires_entries(clock):
+    backend = MemoryCacheBackend()
+    backend.set("a", b"1234", 10)
+    backend.set("b", b"5678", 30)
+
+    clock.now += 20
+    assert backend.get("a") is None
+    assert backend.get("b") == b"5678"
+    assert (len(backend), backend.size) == (1, 4)
+
+    clock.now += 20
+    assert backend.get("b") is None
+    assert (len(backend), backend.size) == (0, 0)
+
+def test_memory_backend_ignores_oversize_payload():
+    backend = MemoryCacheBackend(maxBytes=4)
+    backend.set("a", b"1234", 60)
+    backend.set("b", b"12345", 60)
+    assert backend.get("b") is None
+    # The entries already cached are kept
+    assert backend.get("a") == b"1234"
+    assert (len(backend), backend.size) == (1, 4)
+
+
+def makeCachedFigure(cache : FigureCache, calls : list):
+    @cache.cached("figure")
+    def getFigure(results, title):
+        calls.append((results.dataId, title))
+        if(title is None):
+            return ERROR_RETURNED
+        return go.Figure(layout=dict(title=title))
+    return getFigure
+
+def test_figure_cache_key_depends_on_data_id():
+    cache = FigureCache(MemoryCacheBackend())
+    calls = []
+    getFigure = makeCachedFigure(cache, calls)
+
+    first = getFigure(FakeResults("data1"), "title")
+    assert first["layout"]["title"]["text"] == "title"
+    assert getFigure(FakeResults("data1"), "title") == first
+    assert calls == [("data1", "title")]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # New results or other parameters : computed again
+    getFigure(FakeResults("data2"), "title")
+    getFigure(FakeResults("data1"), "other")
+    assert calls == [("data1", "title"), ("data2", "title"), ("data1", "other")]
+    assert FigureCache.makeKey("figure", "data1", ("title",)) != FigureCache.makeKey("figure", "data2", ("title",))
+
+def test_figure_cache_does_not_cache_errors():
+    backend = MemoryCacheBackend()
+    cache = FigureCache(backend)
+    calls = []
+    getFigure = makeCachedFigure(cache, calls)
+
+    assert getFigure(FakeResults("data1"), None) is ERROR_RETURNED
+    assert getFigure(FakeResults("data1"), None) is ERROR_RETURNED
+    assert len(calls) == 2
+    assert (len(backend), cache.hits, cache.misses) == (0, 0, 2)
+
+def test_figure_cache_expires_figures(clock):
+    cache = FigureCache(MemoryCacheBackend(), ttl=10)
+    calls = []
+    getFigure = makeCachedFigure(cache, calls)
+
+    getFigure(FakeResults("data1"), "title")
+    clock.now += 20
+    getFigure(FakeResults("data1"), "title")
+    assert len(calls) == 2
@@ -1,11 +1,37 @@
 import csv
+import copy
+import json
+import os
+import sys
+import pickle
 import numpy as np
 from os import listdir
 from os.path import isfile, join
+from functools import lru_cache
 import re
 import time
 import datetime
 
+# The statistics files and the sample archives are written by the scripts of generate_statistics, their definitions are shared
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "generate_statistics"))
+import methods
+from sample_archive import SAMPLE_ARCHIVE_EXTENSION, SAMPLE_ARCHIVE_VERSION, decodeSamples
+
+# Statistics of each timer, in the order of the arrays of FullStatSnap.sceneStatistics
+# See method computeSingleData in generate_statistics/methods.py, the confidence intervals are NaN if not computed
+STATISTICS_NAMES = methods.STATISTICS_NAMES + methods.BOOTSTRAP_STATISTICS_NAMES
+
+# Number of hardware info files kept in memory, they are only read when displayed
+HARD_INFO_CACHE_SIZE = 32
+
+@lru_cache(maxsize = HARD_INFO_CACHE_SIZE)
+def loadHardInfoFile(hardInfoFile : str):
+    try:
+        with open(hardInfoFile, 'r') as file:
+            return file.read().split('\n')
+    except(OSError):
+        return ["Hardware info : not found"]
+
 class FullStatSnap():
 
     class DataSample():
@@ -13,61 +39,128 @@ class FullStatSnap():
         meanstd : tuple[float,float]
         quartiles : tuple[float,float,float]
         cardinality : int
+        meanCI : tuple[float,float]      # 95% confidence interval of the mean, None if not computed
+        medianCI : tuple[float,float]    # 95% confidence interval of the median, None if not computed
 
-        def __init__(self, minmax:tuple[float,float], meanstd:tuple[float,float], quartiles:tuple[float,float,float], cardinality:int):
+        def __init__(self, minmax:tuple[float,float], meanstd:tuple[float,float], quartiles:tuple[float,float,float], cardinality:int,
+                     meanCI:tuple[float,float]=None, medianCI:tuple[float,float]=None):
             self.minmax       = minmax
             self.meanstd      = meanstd
             self.quartiles    = quartiles
             self.cardinality    = cardinality
+            self.meanCI       = meanCI
+            self.medianCI     = medianCI
             pass
 
+        @staticmethod
+        def fromStatistics(v:list[float]):
+            # v is a line of a sceneStatistics array, in the order of STATISTICS_NAMES
+            hasCI = v[8] == v[8] # Not NaN
+            return FullStatSnap.DataSample((v[0], v[1]), (v[2], v[3]), (v[4], v[5], v[6]), int(v[7]),
+                                           (v[8], v[9]) if hasCI else None, (v[10], v[11]) if hasCI else None)
+
     fullHash : str                        # Either the hash or the release version
     dateTime : datetime.datetime          # Time of the commit (Day of the beginning of the month if release)
     sceneNames : list[str]                # List of all scenes run for this commit
     sceneTimers : list[list[int]]         # One list of index per scene. Each list are index of timers in the list timerNames by the order of samples
-    sceneSamples : list[list[DataSample]] # One list of sample per scene. In the same order as sceneTimers
+    sceneStatistics : list[np.ndarray]    # One array per scene (number of timers x STATISTICS_NAMES). In the same order as sceneTimers
+    # sceneSamples : list[list[DataSample]] One list of sample per scene. In the same order as sceneTimers. Built from sceneStatistics on first access
     timerNames : list[str]                # Unique list of timer names of all scenes
-    hardInfo : list[str]                  # List of lines of the hard info file
+    sceneIds : dict[str,int]              # Index of each scene name in sceneNames
+    timerIds : dict[str,int]              # Index of each timer name in timerNames
+    # hardInfo : list[str]                  List of lines of the hard info file. Read from hardInfoFile on first access
+    hardInfoFile : str                    # Path of the hard info file
+    samplesFile : str                     # Path of the archive of the raw values of the timers, None if there is none
+    # Once the StatTensor of the results is built, the snaps only keep their hash, date, hard info and sample archive (see
+    # withoutStatistics) : the scene lists are empty and the statistics are the row statRow of statTensor
+    statTensor : "StatTensor" = None
+    statRow : int = None
 
     def __init__(self, fullHash='', dateTime=None):
-        self.fullHash     = fullHash
-        self.dateTime   = dateTime
-        self.sceneNames   = []
-        self.sceneTimers  = []
-        self.sceneSamples = []
-        self.timerNames   = []
-        self.hardInfo     = []
+        self.fullHash        = fullHash
+        self.dateTime        = dateTime
+        self.sceneNames      = []
+        self.sceneTimers     = []
+        self.sceneStatistics = []
+        self.timerNames      = []
+        self.sceneIds        = {}
+        self.timerIds        = {}
+        self.hardInfoFile    = None
+        self.samplesFile     = None
+        self._sceneSamples   = None
+        self._hardInfo       = None
+
+    def __getstate__(self):
+        # The DataSample are not saved, they can be built again from sceneStatistics
+        state = self.__dict__.copy()
+        state["_sceneSamples"] = None
+        return state
+
+    @property
+    def sceneSamples(self):
+        if(self._sceneSamples is None):
+            self._sceneSamples = [[FullStatSnap.DataSample.fromStatistics(values) for values in statistics.tolist()] for statistics in self.sceneStatistics]
+        return self._sceneSamples
+
+    @property
+    def hardInfo(self):
+        if(self._hardInfo is not None):
+            return self._hardInfo
+        if(self.hardInfoFile is not None):
+            return loadHardInfoFile(self.hardInfoFile)
+        return []
 
     def setHashAndTime(self,fullHash='', dateTime=None):
         self.fullHash = fullHash
         self.dateTime = dateTime
 
     def setHardInfo(self,hardInfo:list[str]):
-        self.hardInfo = hardInfo
+        self._hardInfo = hardInfo
+
+    def setHardInfoFile(self,hardInfoFile:str):
+        self.hardInfoFile = hardInfoFile
+
+    def setSamplesFile(self,samplesFile:str):
+        self.samplesFile = samplesFile
+
+    def withoutStatistics(self, statTensor:"StatTensor", statRow:int):
+        # Return a copy of this snap without its statistics, which are the row statRow of statTensor
+        snap = FullStatSnap(self.fullHash, self.dateTime)
+        snap.hardInfoFile = self.hardInfoFile
+        snap.samplesFile  = self.samplesFile
+        snap._hardInfo    = self._hardInfo
+        snap.statTensor   = statTensor
+        snap.statRow      = statRow
+        return snap
 
     def getSceneDataSamples(self,sceneName):
-        try:
-            sceneId = self.sceneNames.index(sceneName)
-        except(ValueError):
+        if(self.statTensor is not None):
+            if(sceneName not in self.statTensor.sceneIds):
+                return None, None
+            values = self.statTensor.values[self.statRow, self.statTensor.sceneIds[sceneName]]
+            present = np.flatnonzero(~np.isnan(values[:, 0]))
+            if(len(present) == 0):
+                return None, None
+            return [self.statTensor.timerNames[i] for i in present], [FullStatSnap.DataSample.fromStatistics(v) for v in values[present].tolist()]
+        sceneId = self.sceneIds.get(sceneName)
+        if(sceneId is None):
             return None, None
         timerNames = [ self.timerNames[i] for i in self.sceneTimers[sceneId]]
         samples = self.sceneSamples[sceneId]
         return timerNames, samples
 
-    def addScene(self, sceneName:str, timerNames:list[str], sampleList:list[DataSample]):
+    def addScene(self, sceneName:str, timerNames:list[str], statistics:np.ndarray):
+        # statistics : array (len(timerNames) x STATISTICS_NAMES)
+        self.sceneIds.setdefault(sceneName, len(self.sceneNames))
         self.sceneNames.append(sceneName)
-        self.sceneTimers.append([])
-        self.sceneSamples.append(sampleList)
-        # Merge new labels with existing ones
+        self.sceneStatistics.append(statistics)
+        self._sceneSamples = None
+        # Merge new labels with existing ones, a new label gets the next ID
         for timer in timerNames:
-
-            try: # Compliance to Python's EAFP principle
-                timerId = self.timerNames.index(timer)
-                self.sceneTimers[-1].append(timerId)
-            except(ValueError): # If not found we add it and we use the new ID
+            if(timer not in self.timerIds):
+                self.timerIds[timer] = len(self.timerNames)
                 self.timerNames.append(timer)
-                self.sceneTimers[-1].append(len(self.timerNames)-1)
-                continue
+        self.sceneTimers.append([self.timerIds[timer] for timer in timerNames])
 
 
 
@@ -76,49 +169,158 @@ class FullStatSnap():
 
 def loadCSVStatistic(filename):
 
-    csvfile=open(filename,mode="r")
-    reader = csv.reader(csvfile,delimiter=',')
+    with open(filename,mode="r") as csvfile:
+        lines = csvfile.read().splitlines()
 
-    firstLine = True
-
-    # map of maps
-    # First key = scene name
-    # second key = timer label
-    # {"sceneName1" : { "timer1" : [[min,max], [mean,std], [quartile1,quartile2,quartile3]],
-    #                   "timer2" : [[min,max], [mean,std], [quartile1,quartile2,quartile3]]},
-    #  "sceneName2" : { "timer1" : [[min,max], [mean,std], [quartile1,quartile2,quartile3]],
-    #                   "timer2" : [[min,max], [mean,std], [quartile1,quartile2,quartile3]]}}
+    # One FullStatSnap with one scene per line, each scene having an array (timers x STATISTICS_NAMES) of statistics
     outputMap = FullStatSnap()
+    if(len(lines) <= 1):
+        return outputMap
+
+    # First line of CSV contains labels
+    # Labels look like label_statistic, e.g. label_min,label_max,label_mean,label_std,label_quartile1,label_quartile2,label_quartile3,label_cardinality
+    # optionally followed by label_meanCILow,label_meanCIHigh,label_medianCILow,label_medianCIHigh
+    # See method computeSingleData in generate_statistics/methods.py
+    # columns : { "label" : { "statistic" : column index,...},...}
+    header = next(csv.reader(lines[:1],delimiter=','))
+    columns = {}
+    for i in range(1,len(header)):
+        label, _, statistic = header[i].rpartition('_')
+        columns.setdefault(label,{})[statistic] = i
+    labels = list(columns)
+    # Column of each statistic of each label, 0 if missing (the first column, scene names, is replaced by NaN)
+    columnIds = np.array([[columns[label].get(statistic, 0) for statistic in STATISTICS_NAMES] for label in labels], dtype=np.int64).reshape(len(labels), len(STATISTICS_NAMES))
+
+    # All values are parsed at once : (scenes x labels x STATISTICS_NAMES)
+    values = np.loadtxt(lines[1:],delimiter=',',converters={0 : lambda sceneName : np.nan},dtype=np.float64,ndmin=2)
+    values = values.reshape(len(lines) - 1, len(header))[:, columnIds]
+    for line, sceneValues in zip(lines[1:], values):
+        # Timers with a NaN min are not computed for this scene
+        present = ~np.isnan(sceneValues[:, 0])
+        outputMap.addScene(line.split(',',1)[0],[label for label, isPresent in zip(labels, present.tolist()) if isPresent],sceneValues[present])
 
-    for row in reader:
-        sceneName = row[0]
-
-        # First line of CSV contains labels
-        if firstLine:
-            firstLine = False
-            # We expect labels to be sorted this way : label_min,label_max,label_mean,label_std,label_quartile1,label_quartile2,label_quartile3,cardinality
-            # See method computeSingleData in generate_statistics/methods.py
-            # POTENTIAL TODO: Make this parametrizable in a parameter file to avoid weak link like that.
-            labels = [row[1 + i*8].split('_')[0] for i in range(len(row)//8)]
+    return outputMap
 
-        else:
-            samples = []
-            sceneLabels = []
-            for i in range(len(row)//8):
-                if( not row[1 + i*8 + 0] == "NaN" ):
-                    sceneLabels.append(labels[i])
-                    samples.append(FullStatSnap.DataSample( (float(row[1 + i*8 + 0]),float(row[1 + i*8 + 1])),
-                                                           (float(row[1 + i*8 + 2]),float(row[1 + i*8 + 3])),
-                                                           (float(row[1 + i*8 + 4]),float(row[1 + i*8 + 5]),float(row[1 + i*8 + 6])),
-                                                            (int(row[1 + i*8 + 7]))))
-
-            outputMap.addScene(sceneName,sceneLabels,samples)
 
-    return outputMap
+# Sample archive written by generate_statistics/process_csv.py next to the statistics file, see generate_statistics/sample_archive.py
+# Single file store of all the results, see results_store.py
+RESULTS_STORE_NAME = "results.db"
 
+def loadSceneSamples(samplesFile : str, sceneName : str, timerName : str):
+    # Return the list of the raw values (ms) of the timer for each execution of the scene, None if they aren't archived
+    # Only the requested scene and timer are read and decompressed
+    if(samplesFile is None):
+        return None
+    with np.load(samplesFile) as archive:
+        meta = json.loads(archive["__meta__"].tobytes())
+        if(meta.get("version") != SAMPLE_ARCHIVE_VERSION):
+            print(f"[WARNING] loadSceneSamples : the sample archive {samplesFile} has the version {meta.get('version')} instead of {SAMPLE_ARCHIVE_VERSION}, it is ignored")
+            return None
+        try:
+            encodedSizes = meta["scenes"][sceneName][timerName]
+        except(KeyError):
+            return None
+        encodedTrials = archive[f"{sceneName}/{timerName}"]
+
+    trials = []
+    offset = 0
+    for size in encodedSizes:
+        trials.append(decodeSamples(encodedTrials[offset:offset+size], meta["quantumNs"]) / 1000000) #Nano seconds to milliseconds
+        offset += size
+    return trials
+
+def parseResultFileName(fileName):
+    # Return (fullHash, sortKey, dateTime, isRelease, infoFileName) from the name of a statistics file
+    # e.g. vXX.YY.csv or <hash>_YYYY-MM-DD_hh-mm-ss.csv, sortKey being a string sortable by date
+    isRelease = re.match("v[0-9]{2}.[0-9]{2}.csv",fileName) is not None
+
+    if(isRelease):
+        fullHash = fileName.split('.')[0]+'.'+fileName.split('.')[1]
+        formatedDateAndTime = f'20{fileName.split('.')[0][1:]}-{fileName.split('.')[1]}-01'
+        sortKey = formatedDateAndTime
+    else:
+        fullHash = fileName.split('_')[0]
+        _cdate = fileName.split('_')[1]
+        _ctime = fileName.split('_')[-1].split('.')[0]
+        sortKey = _cdate+'_'+_ctime
+        formatedDateAndTime = _cdate+'T'+_ctime.replace('-',':')
+
+    return fullHash, sortKey, datetime.datetime.fromisoformat(formatedDateAndTime), isRelease, fullHash + '.info'
+
+# Snapshot of the parsed statistics files, saved by loadAllResults so that a new start of the dashboard only parses the
+# files which changed. The FullStatSnap of the dashboard are saved with the StatTensor holding their statistics.
+# Must be incremented each time FullStatSnap or StatTensor changes.
+RESULTS_SNAPSHOT_VERSION = 3
+
+def loadResultsSnapshot(snapshotPath : str, resultsDir : str):
+    # Return { "fileName" : ((size, mtime), FullStatSnap),... }, empty if there is no valid snapshot for this folder
+    if(snapshotPath is None):
+        return {}
+    try:
+        with open(snapshotPath, 'rb') as file:
+            snapshot = pickle.load(file)
+        if((snapshot["version"] == RESULTS_SNAPSHOT_VERSION) and (snapshot["resultsDir"] == os.path.realpath(resultsDir))):
+            return snapshot["files"]
+    except(OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError, TypeError):
+        pass
+    return {}
 
+def saveResultsSnapshot(snapshotPath : str, resultsDir : str, files : dict):
+    if(snapshotPath is None):
+        return
+    snapshot = {"version" : RESULTS_SNAPSHOT_VERSION, "resultsDir" : os.path.realpath(resultsDir), "files" : files}
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(snapshotPath)), exist_ok=True)
+        # Written in a temporary file then renamed, so that a concurrent start never reads a partial snapshot
+        tmpPath = f"{snapshotPath}.{os.getpid()}.tmp"
+        with open(tmpPath, 'wb') as file:
+            pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmpPath, snapshotPath)
+    except(OSError) as error:
+        print(f"[WARNING] Cannot save the results snapshot {snapshotPath} : {error}")
+
+def loadResultFiles(resultsDir : str, previousFiles : dict = {}, settleTime : float = 0):
+    # Return { "fileName" : ((size, mtime), FullStatSnap),... } for all the statistics files of the folder, in the order
+    # of previousFiles followed by the new files, so that the ids of the data lists built from it stay the same.
+    # The FullStatSnap of previousFiles are reused for the files which didn't change since.
+    # Files modified less than settleTime seconds ago may still be written : their previous version is kept if any.
+    fileNames = listdir(resultsDir)
+    fileNamesSet = set(fileNames)
+    now = time.time_ns()
+    files = {}
+    for f in [f for f in previousFiles if f in fileNamesSet] + sorted(f for f in fileNames if f not in previousFiles):
+        if(('.csv' in f) and isfile(join(resultsDir, f))):
+            #Append the new FullStatSnap
+            fileStat = os.stat(join(resultsDir, f))
+            fileKey = (fileStat.st_size, fileStat.st_mtime_ns)
+            if((f in previousFiles) and ((previousFiles[f][0] == fileKey) or (now - fileStat.st_mtime_ns < settleTime*1e9))):
+                fileKey, snap = previousFiles[f]
+            elif(now - fileStat.st_mtime_ns < settleTime*1e9):
+                continue
+            else:
+                #define either commit of release
+                fullHash, sortKey, dateTime, isRelease, infoFileName = parseResultFileName(f)
+                snap = loadCSVStatistic(join(resultsDir, f))
+                snap.setHashAndTime(fullHash,dateTime)
+                #Hard info is read when displayed
+                snap.setHardInfoFile(join(resultsDir,infoFileName))
+
+            # The sample archive is written after the statistics file
+            if((f[:-len('.csv')] + SAMPLE_ARCHIVE_EXTENSION) in fileNamesSet):
+                samplesFile = join(resultsDir, f[:-len('.csv')] + SAMPLE_ARCHIVE_EXTENSION)
+            else:
+                samplesFile = None
+            if(snap.samplesFile != samplesFile):
+                # The FullStatSnap of previousFiles may be used by the published results, they are never modified
+                if((f in previousFiles) and (previousFiles[f][1] is snap)):
+                    snap = copy.copy(snap)
+                snap.setSamplesFile(samplesFile)
+            files[f] = (fileKey, snap)
+    return files
+
+def buildResultsLists(files : dict):
+    # Return (releaseData, commitData, releaseIdx, commitIdx) from the output of loadResultFiles
 
-def loadAllResults(resultsDir):
     # Create four lists : one for release
     #                   : one for commits
     #                   : two for dates of commits to be sorted regarding their date (one per data list)
@@ -126,138 +328,269 @@ def loadAllResults(resultsDir):
     releaseDate : list[str]          = []
     commitData  : list[FullStatSnap] = []
     commitDate  : list[str]          = []
-    for f in listdir(resultsDir):
-        if(isfile(join(resultsDir, f)) and ('.csv' in f)):
-            #define either commit of release
-            isRelease = re.match("v[0-9]{2}.[0-9]{2}.csv",f) is not None
-
-            if(isRelease):
-                releaseData.append(loadCSVStatistic(join(resultsDir, f)))
-                formatedDateAndTime = f'20{f.split('.')[0][1:]}-{f.split('.')[1]}-01'
-                releaseDate.append(formatedDateAndTime)
-                releaseData[-1].setHashAndTime(f.split('.')[0]+'.'+f.split('.')[1],datetime.datetime.fromisoformat(formatedDateAndTime))
-
-                #Add hardinfo
-                hardInfo = []
-                with open(join(resultsDir,f.split('.')[0] + '.' +f.split('.')[1]) + '.info', 'r') as file:
-                    hardInfo = file.read().split('\n')
-                releaseData[-1].setHardInfo(hardInfo)
+    for f, (fileKey, snap) in files.items():
+        #define either commit of release
+        fullHash, sortKey, dateTime, isRelease, infoFileName = parseResultFileName(f)
+        if(isRelease):
+            releaseData.append(snap)
+            releaseDate.append(sortKey)
+        else:
+            commitData.append(snap)
+            commitDate.append(sortKey)
 
-            else:
-                _cdate = f.split('_')[1]
-                _ctime = f.split('_')[-1].split('.')[0]
+    releaseIdx = np.argsort(releaseDate).tolist()
+    commitIdx = np.argsort(commitDate).tolist()
 
-                commitDate.append(_cdate+'_'+_ctime)
-                formatedDateAndTime = _cdate+'T'+_ctime.replace('-',':')
+    return addMasterHeadAsRelease(releaseData, commitData, releaseIdx, commitIdx)
+
+def replaceResultsSnaps(files : dict, releaseData : list[FullStatSnap], commitData : list[FullStatSnap]):
+    # Return files with the FullStatSnap of the data lists built from it by buildResultsLists (e.g. the ones of the
+    # LoadedResults of results_watcher.py, which only reference the rows of its tensors)
+    releaseSnaps = iter(releaseData)
+    commitSnaps = iter(commitData)
+    return {f : (fileKey, next(releaseSnaps) if parseResultFileName(f)[3] else next(commitSnaps)) for f, (fileKey, snap) in files.items()}
+
+def updateResultsSnapshot(snapshotPath : str, resultsDir : str, previousFiles : dict, files : dict):
+    # Save the snapshot if a file has been added, modified or removed since previousFiles
+    if((files.keys() != previousFiles.keys()) or any(files[f][0] != previousFiles[f][0] for f in files)):
+        saveResultsSnapshot(snapshotPath, resultsDir, files)
+
+def loadKnownResultFiles(resultsDir : str, snapshot : dict):
+    # Return snapshot (output of loadResultsSnapshot) completed with the files of the results store (see results_store.py)
+    # which are not in the snapshot or were modified since, so that loadResultFiles only parses the remaining ones
+    storePath = join(resultsDir, RESULTS_STORE_NAME)
+    if(not isfile(storePath)):
+        return snapshot
+    fileNames = []
+    for f in listdir(resultsDir):
+        if(f.endswith('.csv') and isfile(join(resultsDir, f))):
+            fileStat = os.stat(join(resultsDir, f))
+            if((f not in snapshot) or (snapshot[f][0] != (fileStat.st_size, fileStat.st_mtime_ns))):
+                fileNames.append(f)
+    if(len(fileNames) == 0):
+        return snapshot
+
+    import sqlite3
+    import results_store
+    try:
+        return {**snapshot, **results_store.loadResultFilesFromStore(storePath, resultsDir, fileNames)}
+    except(sqlite3.Error, OSError, ValueError) as error:
+        print(f"[WARNING] Cannot read the results store {storePath}, the files are parsed : {error}")
+        return snapshot
 
-                #Append the new FullStatSnap
-                commitData.append(loadCSVStatistic(join(resultsDir, f)))
-                commitData[-1].setHashAndTime(f.split('_')[0],datetime.datetime.fromisoformat(formatedDateAndTime))
+def loadAllResults(resultsDir, snapshotPath=None):
+    # If snapshotPath is given, the parsed files are saved in it and only the modified files are parsed on the next call
+    # The files which are not in the snapshot are read from the results store if there is one (see results_store.py)
 
-                #Add hardinfo
-                hardInfo = []
-                with open(join(resultsDir,f.split('_')[0])+ '.info', 'r') as file:
-                    hardInfo = file.read().split('\n')
-                commitData[-1].setHardInfo(hardInfo)
+    # Files which didn't change since the last snapshot are not parsed again
+    snapshot = loadResultsSnapshot(snapshotPath, resultsDir)
+    files = loadResultFiles(resultsDir, loadKnownResultFiles(resultsDir, snapshot))
+    updateResultsSnapshot(snapshotPath, resultsDir, snapshot, files)
 
-    #Add master head as a release
-    releaseIdx = np.argsort(releaseDate).tolist()
-    commitIdx = np.argsort(commitDate).tolist()
+    return buildResultsLists(files)
 
+def addMasterHeadAsRelease(releaseData : list[FullStatSnap], commitData : list[FullStatSnap], releaseIdx : list[int], commitIdx : list[int]):
+    #Add master head as a release
     if(len(commitIdx) != 0):
         releaseData.append(commitData[commitIdx[-1]])
         releaseIdx.append(len(releaseData) -1)
 
-
     return releaseData, commitData, releaseIdx, commitIdx
 
-def getUniqueSetOfLabels(dataStruct : list[FullStatSnap],indices : list[int], sceneName : str):
-
-    timers : list[str] = []
-    for i in indices:
-        try:
-            sceneIdx = dataStruct[i].sceneNames.index(sceneName)
-        except(ValueError):
-            print(f'[Warning] no scene named {sceneName} in {dataStruct[i].fullHash}')
-            continue
-        for timerID in dataStruct[i].sceneTimers[sceneIdx]:
-            if(dataStruct[i].timerNames[timerID] not in timers ):
-                timers.append(dataStruct[i].timerNames[timerID])
-
-    return timers
-
-def getUniqueSetOfScenes(dataStruct : list[FullStatSnap],indices : list[int]):
+#### StatTensor ####
+# brief: Dense representation of a list of FullStatSnap (as outputed by loadAllResults) used by the graphs
+#
+# details:
+# - values   : float array (commits x scenes x timers x STATISTICS_NAMES), NaN if the commit doesn't have the scene/timer
+# - commits  : table of the commits, in the same order as the FullStatSnap list so that the ids of the list can be used
+#              directly : structured array with the fields 'hash', 'shortHash' (the 7 first characters), 'date' and 'isRelease'
+# - sceneIds, timerIds : { name : index in the scenes/timers axis }, and sceneNames, timerNames the reverse lists
+# - hashIds  : { full hash : index in commits }, and a sorted copy of the hashes used to resolve the short hashes
+#              displayed on the x axis of the graphs (see findCommitId)
+# - sortedIdx, sortedDates : indices of the commits sorted by date and their dates, used to select the commits of a
+#              date interval by binary search (see computeCommitListIdInDataList)
+# - A timer is present in a scene of a commit if its min is not NaN, the extraction of the graphs is a fancy indexing
+#   of the selected commits of one scene.
+# - The statistics of a FullStatSnap are either its own arrays (file just parsed) or a row of the tensor it was built
+#   for (see FullStatSnap.withoutStatistics), which is copied : the tensors of the new results are built from the
+#   previous ones and the parsed files.
+####################
+class StatTensor():
+    values : np.ndarray
+    commits : np.ndarray
+    sceneNames : list[str]
+    sceneIds : dict[str,int]
+    timerNames : list[str]
+    timerIds : dict[str,int]
+    hashIds : dict[str,int]
+
+    COMMIT_DTYPE = np.dtype([('hash', 'U40'), ('shortHash', 'U7'), ('date', 'datetime64[s]'), ('isRelease', '?')])
+
+    def __init__(self, data : list[FullStatSnap]):
+        self.sceneIds = {}
+        self.timerIds = {}
+        commitIndices = []
+        sceneIndices = []
+        timerIndices = []
+        statistics = []
+        for commitId, snap in enumerate(data):
+            if(snap.statTensor is not None):
+                # Timers present in the row of the tensor of the snap, in the order of this tensor
+                sourceValues = snap.statTensor.values[snap.statRow]
+                sourceScenes, sourceTimers = np.nonzero(~np.isnan(sourceValues[:, :, 0]))
+                sceneMap = {sceneId : self.sceneIds.setdefault(snap.statTensor.sceneNames[sceneId], len(self.sceneIds)) for sceneId in np.unique(sourceScenes).tolist()}
+                timerMap = {timerId : self.timerIds.setdefault(snap.statTensor.timerNames[timerId], len(self.timerIds)) for timerId in np.unique(sourceTimers).tolist()}
+                commitIndices.append(np.full(len(sourceScenes), commitId, dtype=np.int64))
+                sceneIndices.append(np.array([sceneMap[sceneId] for sceneId in sourceScenes.tolist()], dtype=np.int64))
+                timerIndices.append(np.array([timerMap[timerId] for timerId in sourceTimers.tolist()], dtype=np.int64))
+                statistics.append(sourceValues[sourceScenes, sourceTimers])
+                continue
+            snapTimerIds = [self.timerIds.setdefault(timer, len(self.timerIds)) for timer in snap.timerNames]
+            for sceneId, sceneName in enumerate(snap.sceneNames):
+                timers = snap.sceneTimers[sceneId]
+                commitIndices.append(np.full(len(timers), commitId, dtype=np.int64))
+                sceneIndices.append(np.full(len(timers), self.sceneIds.setdefault(sceneName, len(self.sceneIds)), dtype=np.int64))
+                timerIndices.append(np.array([snapTimerIds[timer] for timer in timers], dtype=np.int64))
+                statistics.append(snap.sceneStatistics[sceneId])
+        self.sceneNames = list(self.sceneIds)
+        self.timerNames = list(self.timerIds)
+
+        self.values = np.full((len(data), len(self.sceneIds), len(self.timerIds), len(STATISTICS_NAMES)), np.nan)
+        if(len(statistics) > 0):
+            self.values[np.concatenate(commitIndices), np.concatenate(sceneIndices), np.concatenate(timerIndices)] = np.concatenate(statistics)
+
+        self.commits = np.zeros(len(data), dtype=StatTensor.COMMIT_DTYPE)
+        self.commits['hash'] = [snap.fullHash for snap in data]
+        self.commits['shortHash'] = self.commits['hash']
+        self.commits['date'] = [snap.dateTime for snap in data]
+        self.commits['isRelease'] = [re.match("v[0-9]{2}.[0-9]{2}$", snap.fullHash) is not None for snap in data]
+        self.buildHashIndex()
+
+    @staticmethod
+    def fromArrays(values : np.ndarray, commits : np.ndarray, sceneNames : list[str], timerNames : list[str]):
+        # StatTensor on existing arrays (e.g. memory mapped by shared_results.py), which are not copied
+        tensor = StatTensor.__new__(StatTensor)
+        tensor.values = values
+        tensor.commits = commits
+        tensor.sceneNames = list(sceneNames)
+        tensor.timerNames = list(timerNames)
+        tensor.sceneIds = {sceneName : sceneId for sceneId, sceneName in enumerate(tensor.sceneNames)}
+        tensor.timerIds = {timerName : timerId for timerId, timerName in enumerate(tensor.timerNames)}
+        tensor.buildHashIndex()
+        return tensor
+
+    def extended(self, data : list[FullStatSnap]):
+        # Return a new StatTensor with the commits of data added after the ones of this tensor, which isn't modified so
+        # that it can still be used while the new one is built. The ids of the commits, scenes and timers are kept.
+        added = StatTensor(data)
+        tensor = StatTensor.__new__(StatTensor)
+        tensor.sceneIds = dict(self.sceneIds)
+        tensor.timerIds = dict(self.timerIds)
+        sceneMap = np.array([tensor.sceneIds.setdefault(sceneName, len(tensor.sceneIds)) for sceneName in added.sceneNames], dtype=np.int64)
+        timerMap = np.array([tensor.timerIds.setdefault(timerName, len(tensor.timerIds)) for timerName in added.timerNames], dtype=np.int64)
+        tensor.sceneNames = list(tensor.sceneIds)
+        tensor.timerNames = list(tensor.timerIds)
+
+        tensor.values = np.full((len(self) + len(added), len(tensor.sceneIds), len(tensor.timerIds), len(STATISTICS_NAMES)), np.nan)
+        tensor.values[:len(self), :len(self.sceneIds), :len(self.timerIds)] = self.values
+        tensor.values[len(self):, sceneMap[:, None], timerMap] = added.values
+        tensor.commits = np.concatenate((self.commits, added.commits))
+        tensor.buildHashIndex()
+        return tensor
+
+    def buildHashIndex(self):
+        # Build the hash and date indexes, must be called each time commits changes. The first commit is kept if a hash is present twice (master head in releases)
+        self.hashIds = {}
+        for commitId, fullHash in enumerate(self.commits['hash'].tolist()):
+            self.hashIds.setdefault(fullHash, commitId)
+        self._sortedHashIds = np.argsort(self.commits['hash'], kind='stable')
+        self._sortedHashes = self.commits['hash'][self._sortedHashIds]
+        self.sortedIdx = np.argsort(self.commits['date'], kind='stable')
+        self.sortedDates = self.commits['date'][self.sortedIdx]
+
+    def findCommit(self, hash : str):
+        # Index of the commit of this full hash or hash prefix, -1 if not found
+        commitId = self.hashIds.get(hash)
+        if(commitId is not None):
+            return commitId
+        # The hashes starting with the prefix are contiguous in the sorted hashes
+        start, end = np.searchsorted(self._sortedHashes, [hash, hash + chr(0x10FFFF)])
+        if(start == end):
+            return -1
+        return int(self._sortedHashIds[start:end].min())
+
+    def __len__(self):
+        return len(self.commits)
+
+    def present(self, ids : list[int], sceneName : str):
+        # Boolean array (ids x timers), True if the timer has been computed for this scene and commit
+        if(sceneName not in self.sceneIds):
+            return np.zeros((len(ids), len(self.timerIds)), dtype=bool)
+        return ~np.isnan(self.values[np.asarray(ids, dtype=np.int64), self.sceneIds[sceneName], :, STATISTICS_NAMES.index("min")])
+
+
+def getUniqueSetOfLabels(tensor : StatTensor, indices : list[int], sceneName : str):
+    if(sceneName not in tensor.sceneIds):
+        print(f'[Warning] no scene named {sceneName}')
+        return []
+    present = np.any(tensor.present(indices, sceneName), axis=0)
+    return [tensor.timerNames[timerId] for timerId in np.flatnonzero(present)]
 
-    sceneNames : list[str] = []
-    for i in indices:
-        for name in dataStruct[i].sceneNames:
-            if(name not in sceneNames ):
-                sceneNames.append(name)
+def getUniqueSetOfScenes(tensor : StatTensor, indices : list[int]):
+    present = np.any(~np.isnan(tensor.values[np.asarray(indices, dtype=np.int64), :, :, STATISTICS_NAMES.index("min")]), axis=(0, 2))
+    return [tensor.sceneNames[sceneId] for sceneId in np.flatnonzero(present)]
 
-    return sceneNames
 
 
+def _toDatetime64(date : datetime.datetime):
+    # Dates of the commits are naive, an aware date is converted to UTC first
+    if(date.tzinfo is not None):
+        date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return np.datetime64(date, 's')
 
-# sortedIdx : should be a list of index ordering the data in term of date
-# return id in the sortedIdx of the first FullStatSnap which date is more recent than given date
-def findFirstAvailableIdOlderThanDate(data : list[FullStatSnap], sortedIdx : list[int], date : datetime.datetime ):
-    if((len(data) < 1) or (date>data[sortedIdx[-1]].dateTime)):
+# return id in tensor.sortedIdx of the first commit which date is more recent than or equal to given date, None if there is none
+def findFirstAvailableIdOlderThanDate(tensor : StatTensor, date : datetime.datetime ):
+    firstCommit = int(np.searchsorted(tensor.sortedDates, _toDatetime64(date), side='left'))
+    if(firstCommit == len(tensor)):
         return None
-
-    #Findout if we start from tail or head
-    sartFromTail = abs(date - data[sortedIdx[0]].dateTime) > abs(date - data[sortedIdx[-1]].dateTime)
-
-    if(sartFromTail):
-        for i in range(len(data)):
-            if(data[sortedIdx[-1 -i]].dateTime<date):
-                return len(data) - i
-    else:
-        for i in range(len(data)):
-            if(data[sortedIdx[i]].dateTime>date):
-                return i
-
-
-def computeCommitListIdInDataList(data : list[FullStatSnap], sortedIdx : list[int], date : datetime.datetime, commit_interval :int):
-    firstCommit = findFirstAvailableIdOlderThanDate(data,sortedIdx,date)
-    i = len(data) -1
-    idxInData = []
-
-    if firstCommit is None:
+    return firstCommit
+
+# return the ids in the data list of the commits in [since, until] (until being optional), sorted by date, taking one
+# commit every commit_interval commits starting from the most recent one of the interval
+def computeCommitListIdInDataList(tensor : StatTensor, since : datetime.datetime, commit_interval : int, until : datetime.datetime = None):
+    start = np.searchsorted(tensor.sortedDates, _toDatetime64(since), side='left')
+    end = np.searchsorted(tensor.sortedDates, _toDatetime64(until), side='right') if until is not None else len(tensor)
+    if(start >= end):
         return []
+    return tensor.sortedIdx[start:end][::-1][::max(int(commit_interval), 1)][::-1].tolist()
 
-    while i >= firstCommit:
-        idxInData.append(i)
-        i-=commit_interval
-
-    idxInData.reverse()
-    return [sortedIdx[i] for i in idxInData]
-
-def findCommitId(data : list[FullStatSnap], hash:str):
+def findCommitId(data : list[FullStatSnap] | StatTensor, hash:str):
+    if(isinstance(data, StatTensor)):
+        return data.findCommit(hash)
     for i in range(len(data)):
         if(data[i].fullHash[:len(hash)] == hash):
             return i
     return -1
 
 
-def getTimerData(data : list[FullStatSnap], hash:str, sceneName:str, timerName:str):
-
-    try:
-        releaseId = findCommitId(data,hash)
-        sceneIndex = data[releaseId].sceneNames.index(sceneName)
-        dataIndex = data[releaseId].timerNames.index(timerName)
-        dataIndexInSamples = data[releaseId].sceneTimers[sceneIndex].index(dataIndex)
-        dataStruct = data[releaseId].sceneSamples[sceneIndex][dataIndexInSamples]
-
-    except(ValueError):
+def getTimerData(tensor : StatTensor, hash:str, sceneName:str, timerName:str):
+    commitId = findCommitId(tensor, hash)
+    if((commitId < 0) or (sceneName not in tensor.sceneIds) or (timerName not in tensor.timerIds)):
+        return None
+    values = tensor.values[commitId, tensor.sceneIds[sceneName], tensor.timerIds[timerName]]
+    if(np.isnan(values[0])):
         return None
+    return FullStatSnap.DataSample.fromStatistics(values.tolist())
 
-    return dataStruct
+# Statistics of each type of graph, in the order of the lines of the matrices outputed by getDataStructureForGraph
+GRAPH_STATISTICS = {"quartiles" : [STATISTICS_NAMES.index(name) for name in ["min", "quartile1", "quartile2", "quartile3", "max"]],
+                    "mean"      : [STATISTICS_NAMES.index(name) for name in ["mean", "std"]]}
 
 # Method: getDataStructureForGraph
 # Here the idea is to sort data to be used in box plots.
 #
 # the inputs are
-# 1. data: the FullStatSnap list as outputed by loadAllResults
+# 1. tensor: the StatTensor of the FullStatSnap list as outputed by loadAllResults
 # 2. ids: ids of the data to extract in the data list
 # 3. sceneName: filter for this scene
 # 4. labels: Labels to filter
@@ -270,56 +603,56 @@ def getTimerData(data : list[FullStatSnap], hash:str, sceneName:str, timerName:s
 # 2. Dictionnary
 #    - key is the tag label (to be used as the name parameter)
 #    - value is a np array with columns being in order : [min, q1, q2, q3, max] (for quartiles modes) and [mean, std] and lines are the values.
-def getDataStructureForGraph(data : list[FullStatSnap], ids : list[int], sceneName : str, labels : list[str], type = "quartiles" ):
+def getDataStructureForGraph(tensor : StatTensor, ids : list[int], sceneName : str, labels : list[str], type = "quartiles" ):
     xLabelList = {}
     outputStruct = {}
 
+    ids = np.asarray(ids, dtype=np.int64)
+    statistics = GRAPH_STATISTICS.get(type, [])
     for label in labels :
-        xLabelList[label] = []
-        labelIdInSceneLabelList = []
-        sceneIdInData = []
-        excludeId = []
-        for id in ids:
-            try:
-                currLabelIdInCommitData = data[id].timerNames.index(label)
-                currSceneIdInData = data[id].sceneNames.index(sceneName)
-                currLabelIdInSceneLabelList = data[id].sceneTimers[currSceneIdInData].index(currLabelIdInCommitData)
-            except(ValueError):
-                excludeId.append(id) #The scene exists but here doesn't include the right timer or The scene isn't in the commit id
-                continue
+        if((sceneName not in tensor.sceneIds) or (label not in tensor.timerIds)):
+            xLabelList[label] = []
+            outputStruct[label] = np.zeros((len(statistics), 0)) if type in GRAPH_STATISTICS else np.array([])
+            continue
 
-            currfullHash = data[id].fullHash
-            if(len(currfullHash)>7):
-                currfullHash = currfullHash[:7]
-
-            xLabelList[label].append(currfullHash)
-            labelIdInSceneLabelList.append(currLabelIdInSceneLabelList)
-            sceneIdInData.append(currSceneIdInData)
-
-        dataMatrix = np.array([])
-        currId = 0
-        if(type == "quartiles"):
-            dataMatrix = np.zeros((5,len(labelIdInSceneLabelList)))
-            for id in ids:
-                if id not in excludeId:
-                    dataMatrix[0][currId] = data[id].sceneSamples[sceneIdInData[currId]][labelIdInSceneLabelList[currId]].minmax[0]
-                    dataMatrix[1][currId] = data[id].sceneSamples[sceneIdInData[currId]][labelIdInSceneLabelList[currId]].quartiles[0]
-                    dataMatrix[2][currId] = data[id].sceneSamples[sceneIdInData[currId]][labelIdInSceneLabelList[currId]].quartiles[1]
-                    dataMatrix[3][currId] = data[id].sceneSamples[sceneIdInData[currId]][labelIdInSceneLabelList[currId]].quartiles[2]
-                    dataMatrix[4][currId] = data[id].sceneSamples[sceneIdInData[currId]][labelIdInSceneLabelList[currId]].minmax[1]
-                    currId += 1
-        if(type == "mean"):
-            dataMatrix =np.zeros((2,len(labelIdInSceneLabelList)))
-            for id in ids:
-                if id not in excludeId:
-                    dataMatrix[0][currId] = data[id].sceneSamples[sceneIdInData[currId]][labelIdInSceneLabelList[currId]].meanstd[0]
-                    dataMatrix[1][currId] = data[id].sceneSamples[sceneIdInData[currId]][labelIdInSceneLabelList[currId]].meanstd[1]
-                    currId += 1
-
-        outputStruct[label] = dataMatrix
+        # (ids x STATISTICS_NAMES) values of the timer, the commits where the scene doesn't include the timer are excluded
+        values = tensor.values[ids, tensor.sceneIds[sceneName], tensor.timerIds[label]]
+        present = ~np.isnan(values[:, 0])
+        xLabelList[label] = tensor.commits['shortHash'][ids[present]].tolist()
+        outputStruct[label] = values[present][:, statistics].T if type in GRAPH_STATISTICS else np.array([])
 
     return xLabelList, outputStruct
 
+# Method: downsampleMinMax
+# Select at most budget points of a series to draw it without losing its peaks : the series is split in buckets of
+# consecutive points and the minimum and the maximum of each bucket are kept, with the first and last points.
+#
+# the inputs are
+# 1. values: values of the series, in the order of the x axis
+# 2. budget: maximum number of points kept (at least 4)
+#
+# The output is the sorted array of the indices of the kept points, all of them if there are less than budget
+def downsampleMinMax(values : np.ndarray, budget : int):
+    count = len(values)
+    if(count <= budget):
+        return np.arange(count)
+
+    # Buckets of the inner points [1, count-1)
+    bucketCount = max((budget - 2) // 2, 1)
+    starts = np.linspace(1, count - 1, bucketCount + 1).astype(np.int64)[:-1]
+    starts = np.unique(starts)
+    inner = np.asarray(values[1:count-1], dtype=np.float64)
+    bucketIds = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, count - 1)))
+
+    selected = [np.array([0, count - 1])]
+    for reduce in (np.minimum, np.maximum):
+        extremes = reduce.reduceat(inner, starts - 1)
+        # First point of each bucket equal to its extreme
+        matching = np.flatnonzero(inner == extremes[bucketIds])
+        firstIds = np.unique(bucketIds[matching], return_index=True)[1]
+        selected.append(matching[firstIds] + 1)
+    return np.unique(np.concatenate(selected))
+
 class ERROR_TYPE():
     def __init__(self):
         pass
@@ -341,10 +674,14 @@ if __name__=="__main__":
     releaseData, commitData, sortedReleaseIdx, sortedCommitIdx = loadAllResults("/home/paul/dev/build/PerformanceRegression/PerformanceRegression/old_results/")
     tac()
     tic()
-    timers = getUniqueSetOfLabels(releaseData,[0,1,2], "fallingBeamLagrangianCollision")
+    releaseTensor = StatTensor(releaseData)
+    tac()
+    tic()
+    timers = getUniqueSetOfLabels(releaseTensor,[0,1,2], "fallingBeamLagrangianCollision")
     tac()
-    print(findFirstAvailableIdOlderThanDate(commitData,sortedCommitIdx, datetime.datetime.fromisoformat("2025-05-10T10:50:20")))
-    print(findFirstAvailableIdOlderThanDate(commitData,sortedCommitIdx, datetime.datetime.fromisoformat("2024-05-10T10:30:20")))
-    print(findFirstAvailableIdOlderThanDate(commitData,sortedCommitIdx, datetime.datetime.fromisoformat("2024-05-09T10:50:20")))
-    print(findFirstAvailableIdOlderThanDate(commitData,sortedCommitIdx, datetime.datetime.fromisoformat("2024-04-09T10:50:20")))
+    commitTensor = StatTensor(commitData)
+    print(findFirstAvailableIdOlderThanDate(commitTensor, datetime.datetime.fromisoformat("2025-05-10T10:50:20")))
+    print(findFirstAvailableIdOlderThanDate(commitTensor, datetime.datetime.fromisoformat("2024-05-10T10:30:20")))
+    print(findFirstAvailableIdOlderThanDate(commitTensor, datetime.datetime.fromisoformat("2024-05-09T10:50:20")))
+    print(findFirstAvailableIdOlderThanDate(commitTensor, datetime.datetime.fromisoformat("2024-04-09T10:50:20")))
     print(timers)
\ No newline at end of file
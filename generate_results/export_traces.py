@@ -0,0 +1,82 @@
+import sys
+import os
+import shlex
+import subprocess
+import multiprocessing
+import concurrent.futures
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "generate_statistics"))
+from methods import loadTracyColumns
+from trace_cache import loadCachedTracyColumns
+
+
+#### Export traces ####
+# brief: Export of the Tracy captures to csv files and their parsing into the binary trace cache, run by a pool of
+#        worker processes while the next executions of the scenes are running (see run_scenes.py). The timers are
+#        still evaluated by process_csv.py.
+#
+# details:
+# - run_scenes.py submits an execution as soon as its tracy-capture process has exited, the capture being complete
+#   on disk at that time : no polling of the file.
+# - For each execution :
+#   1. <exportCommand> > <csvDir>/<SceneName>_<i>.csv 2>&1, as extract-results.sh does ("tracy-csvexport -u {input}"
+#      by default, PR_RUN_SCENES_EXPORT_COMMAND). The csv file is written under a temporary name and renamed once
+#      complete, so that an existing csv file is always a complete one.
+#   2. The csv file is parsed into the trace cache <csvDir>/../tracy.cache (see generate_statistics/trace_cache.py),
+#      process_csv.py then only reads the binary caches. Skipped with PR_TRACE_CACHE=0.
+# - The workers run with the lowest priority (nice 19) and on the CPUs which are not used by the slots of run_scenes.py
+#   when there are some, to disturb the running executions as little as possible.
+#
+# usage:
+#   exporter = TraceExporter(csvDir, cacheDir, "tracy-csvexport -u {input}", nbWorkers, cpus)
+#   task = exporter.submit("SceneName", 1, "tracy.raw/SceneName_1.tracy")
+#   error = task.result()    # None or the error message
+#   exporter.shutdown()
+#######################
+
+DEFAULT_EXPORT_COMMAND = "tracy-csvexport -u {input}"
+
+def _initWorker(cpus : list[int]):
+    os.nice(19)
+    if(cpus):
+        os.sched_setaffinity(0, cpus)
+
+def exportTrial(exportCommand : list[str], csvFile : str, cacheDir : str):
+    # Return None if the capture has been exported and parsed, the error message otherwise
+    tmpFile = f"{csvFile}.{os.getpid()}.tmp"
+    with open(tmpFile, mode="w") as output:
+        result = subprocess.run(exportCommand, stdout=output, stderr=subprocess.STDOUT)
+    if(result.returncode != 0):
+        return f"'{shlex.join(exportCommand)}' failed with the exit code {result.returncode}, see {tmpFile}"
+    os.replace(tmpFile, csvFile)
+
+    if(cacheDir is not None):
+        try:
+            loadCachedTracyColumns(csvFile, cacheDir, loadTracyColumns)
+        except(SystemExit):
+            # loadTracyColumns has printed the error
+            return f"{csvFile} cannot be parsed"
+    return None
+
+
+class TraceExporter():
+
+    def __init__(self, csvDir : str, cacheDir : str, exportCommand : str = DEFAULT_EXPORT_COMMAND, nbWorkers : int = 1, cpus : list[int] = None):
+        self.csvDir        = csvDir
+        self.cacheDir      = cacheDir           # None to only export the csv files
+        self.exportCommand = exportCommand
+        # The worker processes are started by a fork server, the pool being used from the threads of run_scenes.py
+        self._executor     = concurrent.futures.ProcessPoolExecutor(max_workers=nbWorkers, mp_context=multiprocessing.get_context("forkserver"),
+                                                                    initializer=_initWorker, initargs=(cpus,))
+        os.makedirs(csvDir, exist_ok=True)
+
+    def getCsvFile(self, sceneName : str, trialId : int):
+        return os.path.join(self.csvDir, f"{sceneName}_{trialId}.csv")
+
+    def submit(self, sceneName : str, trialId : int, tracyFile : str):
+        # Return a future of the output of exportTrial
+        command = [argument.format(input=tracyFile) for argument in shlex.split(self.exportCommand)]
+        return self._executor.submit(exportTrial, command, self.getCsvFile(sceneName, trialId), self.cacheDir)
+
+    def shutdown(self):
+        self._executor.shutdown()
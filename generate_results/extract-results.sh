@@ -4,6 +4,8 @@ set -o errexit # Exit on error
 #### Extract results ####
 # Script used to extract timer info into csv file from tracy raw data :
 # 1. Use tracy-csvexport to dump csv files in ${WORK_DIR}/output/tracy.csv/
+# The captures already exported by run_scenes.py during the run (PR_RUN_SCENES_EXPORT_WORKERS > 0) are skipped.
+# run_scenes.py only returns once all the tracy-capture processes have exited, every capture is on disk at this point.
 #########################
 usage() {
     echo "Usage: extract-results.sh <workdir> <outputdir> <tracyoutputdir> <perf.scenes-file> "
@@ -21,11 +23,9 @@ else
 fi
 
 
-mkdir $CSV_DIR
+mkdir -p $CSV_DIR
 cd $CSV_DIR
 
-nbTrialsToWaitForTracy=5
-
 echo "Extracting all tracy files to $CSV_DIR..."
 while IFS= read -r line; do
 
@@ -45,18 +45,14 @@ while IFS= read -r line; do
     for i in $(seq $NB_TRIALS)
     do 
         file=$TRACY_RAW_DIR/${SCENE_NAME}_$i.tracy
-        tests=0
-        #The dump of the file on the disk might take more time than changing script, this might break the execution here so we enable waiting
-        while [ ! -f "$file" ] && (( $tests < $nbTrialsToWaitForTracy )); do
-            ((++tests))
-            echo "File $file hasn't already been poduced. Waiting 2s for tracy to produce it..."
-            sleep 2
-        done
-        if [ -f "$file" ];then
+        if [ -f "${SCENE_NAME}_$i.csv" ]; then
+            # Already exported during the run
+            continue
+        elif [ -f "$file" ];then
             # echo "Extracting $file to $SCENE_NAME_$i.csv"
             tracy-csvexport -u  $file  > ${SCENE_NAME}_$i.csv 2>&1
         else
-           echo "File $file hasn't been poduced in time."
+           echo "File $file hasn't been poduced."
            exit 1 
         fi
     done
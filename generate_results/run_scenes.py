@@ -0,0 +1,345 @@
+import sys
+import os
+import glob
+import time
+import queue
+import shlex
+import shutil
+import signal
+import threading
+import subprocess
+import concurrent.futures
+from export_traces import DEFAULT_EXPORT_COMMAND, TraceExporter
+
+
+#### Run scenes ####
+# brief: Run all the scenes of perf.scenes and record their time trace with Tracy, several executions at once on
+#        disjoint sets of CPUs.
+#
+# inputs:
+# - workdir: work directory, the outputs are written in <workdir>/output
+# - builddir: build directory of SOFA (SOFA_ROOT)
+# - sofasourcesdir: directory containing SOFA sources, the scene paths of perf.scenes are relative to it
+# - perffile: path to the perffile 'perf.scenes' : "<scene path> <starting step> <number of steps> <number of executions> [<timeout in s>]"
+#
+# outputs (the same as the previous run-scenes.sh) :
+# - <workdir>/output/tracy.raw/<SceneName>_<i>.tracy : Tracy capture of the i-th execution of the scene
+# - <workdir>/output/<SceneName>_<i>.log : output of runSofa
+# - <workdir>/output/<SceneName>_<i>_OS_info.log : processes running on the machine before the execution
+# - <workdir>/output/<SceneName>_<i>_total_CPU_usage.log : CPU usage of the machine before the execution
+# - <workdir>/output/tracy.csv/<SceneName>_<i>.csv : export of the Tracy capture, as extract-results.sh does
+# - <workdir>/output/tracy.cache/<SceneName>_<i>.trace : the same parsed, read by process_csv.py
+#
+# details:
+# - The executions are run by PR_RUN_SCENES_SLOTS slots (1 by default, meaning one execution after the other as
+#   before). Each slot has its own set of PR_RUN_SCENES_CPUS_PER_SLOT CPUs (all the CPUs divided by the number of slots
+#   by default) on which runSofa and tracy-capture are pinned, and its own Tracy port (PR_RUN_SCENES_TRACY_PORT + slot
+#   id, given to runSofa by the variable TRACY_PORT) so that the captures don't mix. The executions are given to the
+#   slots in the order of perf.scenes, as soon as one is free.
+# - With several slots, the executions running at the same time compete for the memory bandwidth, the shared caches
+#   (L3) and the turbo frequency, and the CPU usage recorded before each execution (_total_CPU_usage.log, CPUUsage in
+#   the statistics) includes the other slots : the results are not comparable with the previous results, measured one
+#   execution after the other.
+# - The CPUs of a slot are taken in a single NUMA node when possible, sibling hyperthreads together, and the memory of
+#   the processes is allocated on this node ('numactl --physcpubind=<cpus> --localalloc'). Without numactl the processes
+#   are only pinned with taskset, the default policy of Linux then allocates the memory on the node of the CPU anyway.
+#   PR_RUN_SCENES_CPUS (e.g. "2-15") restricts the CPUs given to the slots, to keep some of them for the system.
+# - Each execution is stopped after the timeout of its scene (5th column of perf.scenes, PR_RUN_SCENES_TIMEOUT=600s by
+#   default) : runSofa gets a SIGTERM, and a SIGKILL PR_RUN_SCENES_KILL_DELAY=60s later. tracy-capture is then given
+#   the same delay to save the capture.
+# - The commands are templates, to run the scenes with another program (e.g. a fake runSofa for tests) :
+#   - PR_RUN_SCENES_RUNNER  : "{builddir}/bin/runSofa {scene} -g batch -n {steps}" by default
+#   - PR_RUN_SCENES_CAPTURE : "tracy-capture -o {output} -p {port}" by default
+#   where {scene} is the path of the scene, {steps} its number of steps, {output} the .tracy file and {port} the port
+#   of the slot.
+# - As with 'set -o errexit' in the shell version, a failing execution (non zero exit code or timeout) stops the
+#   scheduling of the next ones : the running executions are finished and the script exits with 1.
+# - The CPU usage is measured before each execution, executions of the other slots running at the same time are
+#   included in it.
+# - As soon as the tracy-capture of an execution has exited, its capture is exported to csv and parsed into the trace
+#   cache by PR_RUN_SCENES_EXPORT_WORKERS worker processes while the next executions are running, see export_traces.py.
+#   Disabled by default (0, the export is left to extract-results.sh) : the exports run during the measured
+#   executions, which then no longer run alone on the machine as in the previous results. When enabled, the workers
+#   run on the CPUs which are not in a slot : by default one CPU is left out of the slots for them. The script returns
+#   once all the exports are done.
+#
+####################
+
+DEFAULT_TIMEOUT = 600
+DEFAULT_KILL_DELAY = 60
+DEFAULT_TRACY_PORT = 8086
+DEFAULT_RUNNER = "{builddir}/bin/runSofa {scene} -g batch -n {steps}"
+DEFAULT_CAPTURE = "tracy-capture -o {output} -p {port}"
+
+OS_INFO_COMMAND = "ps aux --sort=-pcpu"
+CPU_USAGE_COMMAND = "top -bn1 | grep '%Cpu' | tail -1 | awk '{print $2}'"
+
+def parseCpuList(cpuList : str):
+    # "0-3,8,10-11" -> [0, 1, 2, 3, 8, 10, 11]
+    cpus = []
+    for part in cpuList.strip().split(','):
+        if(len(part) == 0):
+            continue
+        first, _, last = part.partition('-')
+        cpus += range(int(first), int(last or first) + 1)
+    return cpus
+
+def formatCpuList(cpus : list[int]):
+    return ",".join(str(cpu) for cpu in cpus)
+
+def readCpuTopology(cpus : list[int]):
+    # Return { NUMA node : [cpus of the node],... } restricted to cpus, the CPUs of a same core being next to each other
+    # All the cpus are in the node None if the topology isn't available
+    def readInt(path, default):
+        try:
+            with open(path) as file:
+                return int(file.read())
+        except(OSError, ValueError):
+            return default
+
+    nodes = {}
+    for nodeDir in sorted(glob.glob("/sys/devices/system/node/node[0-9]*")):
+        try:
+            with open(os.path.join(nodeDir, "cpulist")) as file:
+                nodeCpus = set(parseCpuList(file.read()))
+        except(OSError, ValueError):
+            continue
+        nodes[int(os.path.basename(nodeDir)[len("node"):])] = [cpu for cpu in cpus if cpu in nodeCpus]
+    if(sum(len(nodeCpus) for nodeCpus in nodes.values()) != len(cpus)):
+        nodes = {None : [*cpus]}
+
+    for node in nodes:
+        nodes[node].sort(key=lambda cpu : (readInt(f"/sys/devices/system/cpu/cpu{cpu}/topology/physical_package_id", 0),
+                                           readInt(f"/sys/devices/system/cpu/cpu{cpu}/topology/core_id", cpu), cpu))
+    return {node : nodeCpus for node, nodeCpus in nodes.items() if len(nodeCpus) > 0}
+
+def makeCpuSlots(nbSlots : int, cpusPerSlot : int, nodes : dict):
+    # Return [(cpus, NUMA node or None),...] : nbSlots disjoint sets of cpusPerSlot CPUs of nodes (see readCpuTopology)
+    # A slot is taken in a single node when possible, the slots being spread over the nodes
+    slots = []
+    remainingCpus = {node : [*nodeCpus] for node, nodeCpus in nodes.items()}
+    while(len(slots) < nbSlots):
+        candidates = [node for node in remainingCpus if len(remainingCpus[node]) >= cpusPerSlot]
+        if(len(candidates) == 0):
+            break
+        node = max(candidates, key=lambda node : len(remainingCpus[node]))
+        slots.append((remainingCpus[node][:cpusPerSlot], node))
+        remainingCpus[node] = remainingCpus[node][cpusPerSlot:]
+
+    # Slots which don't fit in a node are made of the remaining CPUs of several nodes
+    leftCpus = [cpu for nodeCpus in remainingCpus.values() for cpu in nodeCpus]
+    while((len(slots) < nbSlots) and (len(leftCpus) >= cpusPerSlot)):
+        slots.append((leftCpus[:cpusPerSlot], None))
+        leftCpus = leftCpus[cpusPerSlot:]
+
+    if(len(slots) < nbSlots):
+        print(f"[ERROR] makeCpuSlots : cannot make {nbSlots} slots of {cpusPerSlot} CPUs with the {sum(len(nodeCpus) for nodeCpus in nodes.values())} available CPUs.")
+        exit(1)
+    return [(sorted(cpus), node) for cpus, node in slots]
+
+def readPerfScenes(perfFile : str, sourceDir : str, defaultTimeout : float):
+    # Return [(scene name, scene path, number of steps, number of executions, timeout),...] of the existing scenes
+    scenes = []
+    with open(perfFile) as file:
+        lines = [line.split() for line in file if len(line.strip()) > 0]
+    for line in lines:
+        scenePath = os.path.join(sourceDir, line[0])
+        if(not os.path.isfile(scenePath)):
+            print("[WARNING] Skipping scene " + scenePath + " because it doesn't exist")
+            print("- If the scene " + scenePath + " has been renamed since this version of SOFA, think about adding the renaming in the patch")
+            print()
+            continue
+        sceneName = line[0].split('/')[-1].split('.')[0]
+        timeout = float(line[4]) if len(line) > 4 else defaultTimeout
+        scenes.append((sceneName, scenePath, int(line[2]), int(line[3]), timeout))
+    return scenes
+
+
+class ScenesRunner():
+
+    def __init__(self, outputDir : str, buildDir : str, slots : list[tuple], runnerCommand : str = DEFAULT_RUNNER,
+                 captureCommand : str = DEFAULT_CAPTURE, tracyPort : int = DEFAULT_TRACY_PORT, killDelay : float = DEFAULT_KILL_DELAY,
+                 exporter : TraceExporter = None):
+        self.outputDir      = outputDir
+        self.tracyDir       = os.path.join(outputDir, "tracy.raw")
+        self.buildDir       = buildDir
+        self.slots          = slots           # [(cpus, NUMA node or None),...], see makeCpuSlots
+        self.runnerCommand  = runnerCommand
+        self.captureCommand = captureCommand
+        self.tracyPort      = tracyPort
+        self.killDelay      = killDelay
+        self.exporter       = exporter        # Exports the captures during the run if given, see export_traces.py
+        self.pinTool        = next((tool for tool in ("numactl", "taskset") if shutil.which(tool) is not None), None)
+        self._failed        = threading.Event()
+        self._exportTasks   = []              # [(scene name, execution id, future of exportTrial),...]
+        if((self.pinTool is None) and (len(slots) > 1)):
+            print("[WARNING] Neither numactl nor taskset are installed, the executions of the slots are not pinned to their CPUs")
+
+    def _pin(self, command : list[str], slotId : int):
+        cpus, node = self.slots[slotId]
+        if(self.pinTool == "numactl"):
+            return ["numactl", f"--physcpubind={formatCpuList(cpus)}", *(["--localalloc"] if node is not None else []), *command]
+        elif(self.pinTool == "taskset"):
+            return ["taskset", "--cpu-list", formatCpuList(cpus), *command]
+        return command
+
+    def _command(self, template : str, slotId : int, **values):
+        return self._pin([argument.format(**values) for argument in shlex.split(template)], slotId)
+
+    def _stop(self, process : subprocess.Popen):
+        # SIGTERM then SIGKILL after killDelay to the process and its children (it leads its own process group)
+        if(process.poll() is not None):
+            return
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(self.killDelay)
+        except(subprocess.TimeoutExpired):
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+        except(ProcessLookupError):
+            process.wait()
+
+    def runTrial(self, slotId : int, sceneName : str, scenePath : str, nbSteps : int, trialId : int, timeout : float):
+        # Run one execution of the scene on the slot, return True if it succeeded
+        prefix = os.path.join(self.outputDir, f"{sceneName}_{trialId}")
+        with open(prefix + "_OS_info.log", mode="w") as logFile:
+            subprocess.run(OS_INFO_COMMAND, shell=True, stdout=logFile, stderr=subprocess.STDOUT)
+        with open(prefix + "_total_CPU_usage.log", mode="w") as logFile:
+            subprocess.run(CPU_USAGE_COMMAND, shell=True, stdout=logFile, stderr=subprocess.STDOUT)
+
+        port = self.tracyPort + slotId
+        environment = {**os.environ, "SOFA_ROOT" : self.buildDir, "TRACY_PORT" : str(port)}
+        tracyFile = os.path.join(self.tracyDir, f"{sceneName}_{trialId}.tracy")
+        deadline = time.monotonic() + timeout
+        capture = None
+        try:
+            capture = subprocess.Popen(self._command(self.captureCommand, slotId, output=tracyFile, port=port),
+                                       stdout=subprocess.DEVNULL, env=environment, start_new_session=True)
+            with open(prefix + ".log", mode="w") as logFile:
+                runner = subprocess.Popen(self._command(self.runnerCommand, slotId, builddir=self.buildDir, scene=scenePath, steps=nbSteps),
+                                          stdout=logFile, stderr=subprocess.STDOUT, env=environment, start_new_session=True)
+        except(OSError) as error:
+            if(capture is not None):
+                self._stop(capture)
+            print(f"[ERROR] runTrial : cannot start the execution {trialId} of {sceneName} : {error}")
+            return False
+
+        timedOut = False
+        try:
+            runner.wait(max(0, deadline - time.monotonic()))
+        except(subprocess.TimeoutExpired):
+            timedOut = True
+            self._stop(runner)
+        # tracy-capture saves the capture and exits once runSofa is disconnected
+        try:
+            capture.wait(max(self.killDelay, deadline - time.monotonic()))
+        except(subprocess.TimeoutExpired):
+            timedOut = True
+            self._stop(capture)
+
+        if(timedOut):
+            print(f"[ERROR] runTrial : the execution {trialId} of {sceneName} has been stopped after its timeout of {timeout}s")
+        elif(runner.returncode != 0):
+            print(f"[ERROR] runTrial : the execution {trialId} of {sceneName} failed with the exit code {runner.returncode}, see {prefix}.log")
+        elif(capture.returncode != 0):
+            print(f"[ERROR] runTrial : the capture of the execution {trialId} of {sceneName} failed with the exit code {capture.returncode}")
+        return not timedOut and runner.returncode == 0 and capture.returncode == 0
+
+    def _runOnFreeSlot(self, freeSlots : queue.Queue, *trial):
+        if(self._failed.is_set()):
+            return False
+        slotId = freeSlots.get()
+        try:
+            # A failure stops the executions which are not started yet
+            if(self._failed.is_set()):
+                return False
+            if(not self.runTrial(slotId, *trial)):
+                self._failed.set()
+                return False
+            # tracy-capture has exited, the capture is complete
+            if(self.exporter is not None):
+                sceneName, scenePath, nbSteps, trialId, timeout = trial
+                tracyFile = os.path.join(self.tracyDir, f"{sceneName}_{trialId}.tracy")
+                self._exportTasks.append((sceneName, trialId, self.exporter.submit(sceneName, trialId, tracyFile)))
+            return True
+        finally:
+            freeSlots.put(slotId)
+
+    def run(self, scenes : list[tuple]):
+        # scenes is the output of readPerfScenes, return True if all the executions succeeded
+        os.makedirs(self.tracyDir, exist_ok=True)
+        freeSlots = queue.Queue()
+        for slotId in range(len(self.slots)):
+            freeSlots.put(slotId)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(self.slots)) as executor:
+            sceneTasks = []
+            for sceneName, scenePath, nbSteps, nbTrials, timeout in scenes:
+                sceneTasks.append([executor.submit(self._runOnFreeSlot, freeSlots, sceneName, scenePath, nbSteps, trialId, timeout)
+                                   for trialId in range(1, nbTrials + 1)])
+            for (sceneName, scenePath, nbSteps, nbTrials, timeout), tasks in zip(scenes, sceneTasks):
+                if(all(task.result() for task in tasks)):
+                    print(f"Scene {sceneName} done !")
+
+        for sceneName, trialId, task in self._exportTasks:
+            try:
+                error = task.result()
+            except(Exception) as exception:
+                error = str(exception)
+            if(error is not None):
+                print(f"[ERROR] run : the export of the execution {trialId} of {sceneName} failed : {error}")
+                self._failed.set()
+        return not self._failed.is_set()
+
+
+if __name__=="__main__":
+    if(len(sys.argv) == 5):
+        workDir = sys.argv[1]
+        buildDir = sys.argv[2]
+        sourceDir = sys.argv[3]
+        perfFile = sys.argv[4]
+    else:
+        print("usage : python3 run_scenes.py <workdir> <builddir> <sofasourcesdir> <perf.scenes-file>")
+        exit(1)
+
+    cpus = parseCpuList(os.environ["PR_RUN_SCENES_CPUS"]) if os.environ.get("PR_RUN_SCENES_CPUS") else sorted(os.sched_getaffinity(0))
+    nbSlots = max(1, int(os.environ.get("PR_RUN_SCENES_SLOTS", "1")))
+    nbExportWorkers = max(0, int(os.environ.get("PR_RUN_SCENES_EXPORT_WORKERS", "0")))
+    # One CPU is kept for the exports if possible
+    nbSlotsCpus = len(cpus) - 1 if (nbExportWorkers > 0) and (len(cpus) > nbSlots) else len(cpus)
+    cpusPerSlot = max(1, int(os.environ.get("PR_RUN_SCENES_CPUS_PER_SLOT", str(max(1, nbSlotsCpus//nbSlots)))))
+    slots = makeCpuSlots(nbSlots, cpusPerSlot, readCpuTopology(cpus))
+
+    exporter = None
+    if(nbExportWorkers > 0):
+        outputDir = os.path.join(workDir, "output")
+        freeCpus = [cpu for cpu in cpus if all(cpu not in slotCpus for slotCpus, node in slots)]
+        # Same cache folder as process_csv.py
+        cacheDir = os.path.join(outputDir, "tracy.cache") if os.environ.get("PR_TRACE_CACHE", "1") != "0" else None
+        exporter = TraceExporter(os.path.join(outputDir, "tracy.csv"), cacheDir, os.environ.get("PR_RUN_SCENES_EXPORT_COMMAND", DEFAULT_EXPORT_COMMAND),
+                                 nbExportWorkers, freeCpus)
+
+    runner = ScenesRunner(os.path.join(workDir, "output"), buildDir, slots,
+                          os.environ.get("PR_RUN_SCENES_RUNNER", DEFAULT_RUNNER),
+                          os.environ.get("PR_RUN_SCENES_CAPTURE", DEFAULT_CAPTURE),
+                          int(os.environ.get("PR_RUN_SCENES_TRACY_PORT", str(DEFAULT_TRACY_PORT))),
+                          float(os.environ.get("PR_RUN_SCENES_KILL_DELAY", str(DEFAULT_KILL_DELAY))), exporter)
+    scenes = readPerfScenes(perfFile, sourceDir, float(os.environ.get("PR_RUN_SCENES_TIMEOUT", str(DEFAULT_TIMEOUT))))
+
+    print(f"Running all scenes from file {perfFile} on {nbSlots} slots.")
+    for slotId, (slotCpus, node) in enumerate(slots):
+        print(f"- slot {slotId} : CPUs {formatCpuList(slotCpus)}" + (f" of the NUMA node {node}" if node is not None else "") + f", Tracy port {runner.tracyPort + slotId}")
+    for sceneName, scenePath, nbSteps, nbTrials, timeout in scenes:
+        print(f"Running {nbTrials} times the scene {scenePath} for {nbSteps} steps (timeout {timeout}s)...")
+    print(f"Tracy profiling files are outputed here : {runner.tracyDir}/<SceneName>_i.tracy")
+    print(f"Logs can be found here : {runner.outputDir}/<SceneName>_i.log")
+    if(exporter is not None):
+        print(f"Tracy profiling files are exported during the run here : {exporter.csvDir}/<SceneName>_i.csv" + (f", on the CPUs {formatCpuList(freeCpus)}" if freeCpus else ""))
+    print()
+
+    success = runner.run(scenes)
+    if(exporter is not None):
+        exporter.shutdown()
+    if(not success):
+        exit(1)
+    print("All scenes have been executed !")
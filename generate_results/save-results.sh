@@ -3,6 +3,7 @@ set -o errexit # Exit on error
 
 #### Save results ####
 # Script used to copy all files in the ${WORK_DIR}/output with prefix being the fullhash in the folder old_results in the repository
+# The results store old_results/results.db is not versioned, the dashboard appends the new runs to it (see dashboard/results_store.py)
 ######################
 usage() {
     echo "Usage: publish.sh <workdir> <scriptdir> <outputfolder> <commithash>"
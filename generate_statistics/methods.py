@@ -1,62 +1,138 @@
 import csv
 import sys
 import os
+import itertools
+import tempfile
+import concurrent.futures
+import multiprocessing
 import numpy as np 
+from trace_cache import loadCachedTracyColumns, loadCachedTracyColumnsByChunks
+from timer_expressions import TimerExpressionError, compileTimerExpression, evaluateTimerPlan, isEvaluatedPerStep
+from streaming_statistics import StreamingStatistic
+from sample_archive import encodeSamples, encodeTimersSamples
 
 
-def loadCVSIntoDictionary(csvFileName,startingStep=1):
+# Column labels written on the first line of the csv files generated by 'tracy-csvexport -u'
+TRACY_NAME_COLUMN      = "name"
+TRACY_FILE_COLUMN      = "src_file"
+TRACY_TIMESTAMP_COLUMN = "ns_since_start"
+TRACY_DURATION_COLUMN  = "exec_time_ns"
+
+# Number of rows of a csv file parsed at once
+TRACY_CHUNK_ROWS = 1 << 18
+
+def loadTracyColumnsByChunks(csvFileName,chunkRows=TRACY_CHUNK_ROWS):
+    # Read a Tracy csv file by chunks of chunkRows rows and yield each of them in the same columnar form as loadTracyColumns :
+    # (zoneNames, zoneFiles, zoneCodes, timestamps, durations)
+    # - zoneNames, zoneFiles : timers found since the begining of the file, codes are the same for all chunks
+    # - zoneCodes, timestamps, durations : arrays of the rows of the chunk
+    with open(csvFileName,mode="r") as csvfile:
+        # First line of Tracy CSV conatins column labels, use it to locate the columns we need
+        header = next(csv.reader([csvfile.readline()],delimiter=','),[])
+        try:
+            nameColumn      = header.index(TRACY_NAME_COLUMN)
+            fileColumn      = header.index(TRACY_FILE_COLUMN)
+            timestampColumn = header.index(TRACY_TIMESTAMP_COLUMN)
+            durationColumn  = header.index(TRACY_DURATION_COLUMN)
+        except(ValueError) as e:
+            print(f"[ERROR] loadTracyColumns, while reading the file " + csvFileName + f" : the header doesn't contain the expected column labels ({e}).")
+            exit(1)
+
+        # The four columns are parsed in one pass, in the order of the fields of rowType
+        columns = (nameColumn,fileColumn,timestampColumn,durationColumn)
+        rowType = np.dtype([("name",object),("file",object),("timestamp",np.int64),("duration",np.int64)])
+
+        # Dictionary encoding of the timer names, codes are given by order of first appearance
+        codes = {}
+        zoneFiles = []
+        while(True):
+            rows = [line.rstrip("\r\n") for line in itertools.islice(csvfile,chunkRows)]
+            if(len(rows) == 0):
+                break
+
+            try:
+                table = np.loadtxt(rows,delimiter=',',quotechar='"',usecols=columns,dtype=rowType,ndmin=1)
+            except(ValueError):
+                # Lines not having the full set of columns are ignored (e.g. messages of tracy-csvexport redirected in the file)
+                nbRows = len(rows)
+                rows = [row for row in rows if row.count(',') >= len(header) - 1]
+                print(f"[WARNING] loadTracyColumns, while reading the file {csvFileName} : {nbRows - len(rows)} lines not having the {len(header)} columns are ignored.")
+                if(len(rows) == 0):
+                    continue
+                table = np.loadtxt(rows,delimiter=',',quotechar='"',usecols=columns,dtype=rowType,ndmin=1)
+
+            zoneCodes = np.array([codes.setdefault(name,len(codes)) for name in table["name"].tolist()],dtype=np.int32)
+            newRows = np.flatnonzero(zoneCodes >= len(zoneFiles))
+            _, firstRows = np.unique(zoneCodes[newRows],return_index=True)
+            zoneFiles += [table["file"][row] for row in newRows[firstRows].tolist()]
+
+            yield list(codes), list(zoneFiles), zoneCodes, np.ascontiguousarray(table["timestamp"]), np.ascontiguousarray(table["duration"])
+
+def loadTracyColumns(csvFileName):
+    # Read a Tracy csv file and return it in a columnar form :
+    # (zoneNames, zoneFiles, zoneCodes, timestamps, durations)
+    # - zoneNames  : list of the unique timer names, in order of first appearance in the file
+    # - zoneFiles  : list of the CPP file names containing each timer of zoneNames
+    # - zoneCodes  : np.int32 array, index in zoneNames of the timer of each row
+    # - timestamps : np.int64 array, elapsed time since the begining of the simulation of each row (ns)
+    # - durations  : np.int64 array, time spent in the timer of each row (ns)
+    zoneNames, zoneFiles = [], []
+    chunks = []
+    for zoneNames, zoneFiles, *columns in loadTracyColumnsByChunks(csvFileName):
+        chunks.append(columns)
+    if(len(chunks) == 0):
+        return [], [], np.zeros(0,dtype=np.int32), np.zeros(0,dtype=np.int64), np.zeros(0,dtype=np.int64)
+
+    return zoneNames, zoneFiles, *[np.concatenate(column) for column in zip(*chunks)]
+
+def loadCVSIntoDictionary(csvFileName,startingStep=1,cacheDir=None):
     # outputDict is a dictionary which key is the timer name as in the csv file
-    # The elements in the dictionnary are a tuple of size 3 :
-    # (CPP file name containing the timer (used to define if it is a FreeMotionAnimaitonLoop or not), [list of elaped time], [list of timestamp])
-    csvfile=open(csvFileName,mode="r")
-    reader = csv.reader(csvfile,delimiter=',')
-    outputDict={}
-    
-    firstLine = True
+    # The elements in the dictionnary are a tuple of size 4 :
+    # (CPP file name containing the timer (used to define if it is a FreeMotionAnimaitonLoop or not), np.int64 array of elaped time, np.int64 array of timestamp,
+    #  np.int64 array of time step index)
+    # The time step index of an occurence is the index of the "Simulation::animate" interval containing its timestamp, starting at 0 for the startingStep'th time step
+    # If cacheDir is given, the columns are read from the binary cache of the file (see trace_cache.py) which is built if needed
+    if(cacheDir is None):
+        zoneNames, zoneFiles, zoneCodes, timestamps, durations = loadTracyColumns(csvFileName)
+    else:
+        zoneNames, zoneFiles, zoneCodes, timestamps, durations = loadCachedTracyColumns(csvFileName,cacheDir,loadTracyColumns)
 
     # Look for the timestemp of the startingStep'th time step of the simulation 
     # WARNING : This can be considerated weak as it depends on the timer "Simulation::animate"
     # This is necessary because we don't know how many time a timer will be called every timestep (except for this one), 
     # so we cannot simply remove the startingStep'th first occurence of every timer
+    if("Simulation::animate" in zoneNames):
+        animateTimestamps = timestamps[zoneCodes == zoneNames.index("Simulation::animate")]
+    else:
+        animateTimestamps = []
 
-    id = 0
-    startTimeStep = None
-    for row in reader:
-        if(row[0] == "Simulation::animate"):
-            id += 1 
-            if(id == startingStep):
-                startTimeStep = int(row[3])
-                break
-    if(startTimeStep is None):
-        if(id == 0):
+    if(len(animateTimestamps) < startingStep):
+        if(len(animateTimestamps) == 0):
             print(f"[ERROR] loadCVSIntoDictionary, while reading the file " +csvFileName+ f" : the timer \"Simulation::animate\" was not exported, the timestamp of the {startingStep}th timestep cannot be found.")
         else:
             print(f"[ERROR] loadCVSIntoDictionary, while reading the file " +csvFileName+ f" : the starting step {startingStep} is certainly greater thant the number of steps.")
         exit(1)
+    startTimeStep = animateTimestamps[startingStep-1]
 
-    # We need to restart the reader 
-    csvfile.close()
-    csvfile=open(csvFileName,mode="r")
-    reader = csv.reader(csvfile,delimiter=',')
-
-    for row in reader:
-
-        # First line of Tracy CSV conatins column labels
-        if firstLine:
-            firstLine = False
-            continue
-        
-        # row[0] containes the timer name
-        # row[4] containes the time spent in the timer. 
-        # row[3] containes the elapsed time since the begining of the simulation
-        # We might want to make it more robust by finding out the column number thank's to the first line labels
-        if(int(row[3])<startTimeStep):
-            continue
-        if(row[0] not in outputDict):
-            outputDict[row[0]] = (row[1],[int(row[4])],[int(row[3])])
-        else:
-            outputDict[row[0]][1].append(int(row[4]))
-            outputDict[row[0]][2].append(int(row[3]))
+    # Remove everything that happened before the starting step
+    keep = timestamps >= startTimeStep
+    zoneCodes  = zoneCodes[keep]
+    timestamps = timestamps[keep]
+    durations  = durations[keep]
+
+    # Attribute each occurence to the time step in which it started
+    stepStarts = np.sort(animateTimestamps[animateTimestamps >= startTimeStep])
+    steps = np.searchsorted(stepStarts,timestamps,side='right') - 1
+
+    # Group rows by timer, the stable sort keeps the occurences of each timer in the file order
+    order = np.argsort(zoneCodes,kind='stable')
+    presentCodes, firstRows, counts = np.unique(zoneCodes,return_index=True,return_counts=True)
+    bounds = np.concatenate(([0],np.cumsum(counts)))
+
+    outputDict={}
+    for i in np.argsort(firstRows):
+        rows = order[bounds[i]:bounds[i+1]]
+        outputDict[zoneNames[presentCodes[i]]] = (zoneFiles[presentCodes[i]],durations[rows],timestamps[rows],steps[rows])
 
     return outputDict
 
@@ -65,87 +141,331 @@ def isFreeMotionAL(tracyData):
         return False
     return True
 
-def computeSingleData(rawData, applyDivisor = 1):
+def loadTrial(csvFileName,startingStep=1,cacheDir=None):
+    # Load one execution of a scene and return (simulationType, tracyData)
+    # tracyData is the output of loadCVSIntoDictionary
+    tracyData = loadCVSIntoDictionary(csvFileName,startingStep,cacheDir)
+
+    # WARNING : This test is weak and depends on what file the UpdateBBox timer is located 
+    # FMAL: FreeMotionAnimationLoop
+    # DAL: DefaultAnimationLoop
+    if isFreeMotionAL(tracyData):
+        simulationType = "FMAL"
+    else:
+        simulationType = "DAL"
+
+    return simulationType, tracyData
+
+def concatenateTrials(trialsValues):
+    # trialsValues is a list of outputs of evaluateTimers, one per execution of the same scene
+    # The values of the first execution are concatenated with the ones of the following executions
+    # Output looks like that : { "Timer1Name" : (np array of the values of all executions, [number of values of each execution]),... }
+    # The number of values of each execution is kept so that the executions can still be resampled independently (see bootstrapConfidenceIntervals)
+    timersValues = {}
+    for timer in trialsValues[0]:
+        values = [trialValues[timer] for trialValues in trialsValues if timer in trialValues]
+        timersValues[timer] = (np.concatenate(values), [len(trialValues) for trialValues in values])
+    return timersValues
+
+def processScene(trials,nbResamples=0,sampleQuantum=0):
+    # trials is a list of outputs of evaluateTrial, one per execution of the scene
+    # The values of the executions are concatenated with concatenateTrials to compute the statistics
+    # Output looks like that : ( { "Timer1Name" : computeSingleData output,... }, { "Timer1Name" : [encoded values of each execution],... })
+    # The raw values are only encoded for the sample archive if sampleQuantum > 0 (see sample_archive.py)
+    timersValues = concatenateTrials([trialValues for simulationType, trialValues in trials])
+
+    processedData = {}
+    samples = {}
+    for timer, (values, trialLengths) in timersValues.items():
+        processedData[timer] = computeSingleData(values,1000000,trialLengths,nbResamples) #Nano seconds
+        if(sampleQuantum > 0):
+            samples[timer] = [encodeSamples(trialValues,sampleQuantum) for trialValues in np.split(values,np.cumsum(trialLengths[:-1]))]
+
+    return processedData, samples
+
+class SerialExecutor(concurrent.futures.Executor):
+    # Executor running the tasks directly in the calling process, when submitted
+    def submit(self,fn,/,*args,**kwargs):
+        future = concurrent.futures.Future()
+        future.set_result(fn(*args,**kwargs))
+        return future
+
+def createExecutor(nbWorkers):
+    # Worker processes are forked so that they don't execute again the calling script
+    if(nbWorkers > 1):
+        return concurrent.futures.ProcessPoolExecutor(max_workers=nbWorkers,mp_context=multiprocessing.get_context("fork"))
+    return SerialExecutor()
+
+### IMPORTANT must be kept coherant with what is done in computeSingleData
+# Also used by the dashboard to read the statistics files (see dashboard/utils.py)
+STATISTICS_NAMES = ["min","max","mean","std","quartile1","quartile2","quartile3","cardinality"]
+# Confidence intervals added after STATISTICS_NAMES when bootstrap resampling is enabled
+BOOTSTRAP_STATISTICS_NAMES = ["meanCILow","meanCIHigh","medianCILow","medianCIHigh"]
+
+def bootstrapConfidenceIntervals(rawData, trialLengths=None, nbResamples=1000, confidence=0.95, seed=0):
+    # Return [mean low, mean high, median low, median high] bounds of the confidence intervals computed by bootstrap.
+    # rawData is the concatenation of the values of each execution, trialLengths gives the number of values of each of them.
+    # Each execution is resampled independently with a moving block bootstrap (blocks of n^(1/3) consecutive values)
+    # so that the serial correlation between consecutive time steps of an execution is kept in the resamples.
+    rawData = np.asarray(rawData,dtype=np.float64)
+    if(trialLengths is None):
+        trialLengths = [len(rawData)]
+    rng = np.random.default_rng(seed)
+
+    # Resamples are computed by chunks to bound the memory used by the (resamples x values) matrices
+    chunkSize = max(1,(1 << 22)//max(1,len(rawData)))
+    means = []
+    medians = []
+    for chunkStart in range(0,nbResamples,chunkSize):
+        nbChunkResamples = min(chunkSize,nbResamples - chunkStart)
+        indices = []
+        offset = 0
+        for length in trialLengths:
+            if(length == 0):
+                continue
+            blockLength = max(1,int(round(length ** (1/3))))
+            nbBlocks = -(-length//blockLength)
+            starts = rng.integers(0,length - blockLength + 1,(nbChunkResamples,nbBlocks))
+            trialIndices = (starts[:,:,None] + np.arange(blockLength)).reshape(nbChunkResamples,nbBlocks*blockLength)[:,:length]
+            indices.append(trialIndices + offset)
+            offset += length
+        resamples = rawData[np.concatenate(indices,axis=1)]
+        means.append(np.mean(resamples,axis=1))
+        medians.append(np.median(resamples,axis=1,overwrite_input=True))
+
+    tails = [50*(1 - confidence),50*(1 + confidence)]
+    return [*np.percentile(np.concatenate(means),tails),*np.percentile(np.concatenate(medians),tails)]
+
+def computeSingleData(rawData, applyDivisor = 1, trialLengths = None, nbResamples = 0):
     # rawData is a np array containing time values at each time step for each execution
     percentiles = np.percentile(rawData,[25,50,75])
     # Return vector is constituted this way : [min, max, mean, std, first quartile, second quartile, third quartile, number of samples]
-    return [np.min(rawData)/applyDivisor, np.max(rawData)/applyDivisor, np.mean(rawData)/applyDivisor, np.std(rawData)/applyDivisor, percentiles[0]/applyDivisor, percentiles[1]/applyDivisor, percentiles[2]/applyDivisor, len(rawData)]
+    singleData = [np.min(rawData)/applyDivisor, np.max(rawData)/applyDivisor, np.mean(rawData)/applyDivisor, np.std(rawData)/applyDivisor, percentiles[0]/applyDivisor, percentiles[1]/applyDivisor, percentiles[2]/applyDivisor, len(rawData)]
+    # If nbResamples > 0, it is followed by the 95% confidence intervals : [mean low, mean high, median low, median high]
+    # trialLengths is the number of values of each execution in rawData, see bootstrapConfidenceIntervals
+    if(nbResamples > 0):
+        singleData += [bound/applyDivisor for bound in bootstrapConfidenceIntervals(rawData,trialLengths,nbResamples)]
+    return singleData
+
+# Timers that might not be computable for some scenes, a warning is printed instead of stopping the process
+OPTIONAL_TIMERS = ["CollisionDetection"]
 
 def loadTimerFile(timersFile):
-    # Output file looks like that : 
-    # For a timer file with a line like this one : 
-    # "Timer1Name=subTimer1+subTimer2"
-    # { "Timer1Name" : ['+', subTimer1, subTimer2, ...],... }
-    #
-    # For a timer that is defined by two timepoints
-    # "Timer1Name=subTimer1-subTimer2"
-    # { "Timer1Name" : ['-', subTimer1, subTimer2 ],... }
-    #
-    # For a unique timer 
-    # "Timer1Name=subTimer1"
-    # { "Timer1Name" : [subTimer1 ],... }
-
-    rawtimers = open(timersFile)
+    # Output looks like that : { "Timer1Name" : TimerPlan, ... }
+    # Each line "Timer1Name=expression" of the timers file is compiled into a TimerPlan, see timer_expressions.py for the syntax
+    # All lines are checked before returning, any wrongly formed expression stops the process
     timers = {}
-    for line in rawtimers:
-        temp = line.strip().split('=') 
-        plusTimers = temp[1].split('+')
-        minusTimers = temp[1].split('-')
-
-        if(len(plusTimers) != 1 ):
-            if(len(minusTimers) !=1):
-                print("[ERROR] timer file is wrongly formed, an expression cannot contain a - and a +")
-                exit(1)
-            timers[temp[0]] = ['+', *plusTimers ]
-        elif(len(minusTimers) !=1):
-            timers[temp[0]] = ['-', *minusTimers ]
-        else:
-            timers[temp[0]] = plusTimers
+    errors = []
+    with open(timersFile) as rawtimers:
+        for lineNumber, line in enumerate(rawtimers, start=1):
+            line = line.strip()
+            if((len(line) == 0) or line.startswith('#')):
+                continue
+
+            name, separator, expression = line.partition('=')
+            name = name.strip()
+            try:
+                if((len(separator) == 0) or (len(name) == 0)):
+                    raise TimerExpressionError("a line should look like 'TimerName=expression'")
+                if(name in timers):
+                    raise TimerExpressionError(f"timer {name} is defined twice")
+                timers[name] = compileTimerExpression(name,expression)
+            except(TimerExpressionError) as e:
+                errors.append(f"{timersFile}:{lineNumber} : {line} : {e}")
+
+    if(len(errors) > 0):
+        for error in errors:
+            print("[ERROR] loadTimerFile : timer file is wrongly formed, " + error)
+        exit(1)
 
     return timers
 
-def processFile(tracyData,timers,sceneName="default"):
+def selectTimers(tracyZones,timers,sceneName="default"):
+    # Return the timers which can be computed with the Tracy timers tracyZones (e.g. the keys of the output of loadCVSIntoDictionary)
+    # A missing optional timer is skipped with a warning, any other missing timer stops the process
+    selectedTimers = {}
+    for timer in timers:
+        missingZones = [zone for zone in timers[timer].zones if zone not in tracyZones]
+        if(len(missingZones) > 0):
+            if(timer in OPTIONAL_TIMERS):
+                print("[WARNING] processFile : Expected timer name " + str(missingZones) + " isn't in the csv file of the scene "+ sceneName +". It means that it wasn't exported by Tracy. The timer might not exist in this version of SOFA. It is used to compute " + timer + " that might be missing if no collision pipeline is present in the scene." )
+                continue
+            else:
+                print("[ERROR] processFile : Expected timer name " + str(missingZones) + " isn't in the csv file of the scene "+ sceneName +". It means that it wasn't exported by Tracy. The timer might not exist in this version of SOFA.")
+                exit(1)
+        selectedTimers[timer] = timers[timer]
+
+    return selectedTimers
+
+def evaluateTimers(tracyData,timers,sceneName="default",perStep=None):
     # timers is the output of loadTimerFile
     # tracyData is the output of loadCVSIntoDictionary
-    processedData = {}
+    # perStep is an optional dictionary { "Timer1Name" : bool } forcing the aggregation of the timers per step or per call (see evaluateTimerPlan)
+    # Output looks like that : { "Timer1Name" : np array of the values of the timer (ns),... }
+    timersValues = {}
 
+    # Operands are shared between the timers of the scene, each Tracy timer is converted only once
+    operandCache = {}
 
     #For each output timer name 
-    for timer in timers:
+    for timer in selectTimers(tracyData,timers,sceneName):
         try:
-            if(len(timers[timer])==1):
-                temp = np.array(tracyData[timers[timer][0]][1])
-            else:
-                # We have a timer that need subtimer to be computed
-
-                if(timers[timer][0] == '+'):
-                    temp = np.array(tracyData[timers[timer][1]][1])
-                    # Now we add all other timers
-                    for subTimer in timers[timer][2:]:
-                        temp += np.array(tracyData[subTimer][1])
-                else:
-                    # We use timestamps 
-                    temp = np.array(tracyData[timers[timer][1]][2])
-                    # We substract the other timestamp
-                    temp -= np.array(tracyData[timers[timer][2]][2])
-                    # Because this is used for timers coming from events : SetBegin, StepEnd we don't want to take into account what is done by the users through the timers but what is done in between
-                    # So we remove the time execution of the first timer
-                    temp -= np.array(tracyData[timers[timer][1]][1])
-
-            processedData[timer] = computeSingleData(temp,1000000) #Nano seconds
-        except KeyError as e:
-            if(timer == "CollisionDetection"):
-                print("[WARNING] processFile : Expected timer name " + str(e) + " isn't in the csv file of the scene "+ sceneName +". It means that it wasn't exported by Tracy. The timer might not exist in this version of SOFA. It is used to compute " + timer + " that might be missing if no collision pipeline is present in the scene." )
-                continue
-            else:
-                print("[ERROR] processFile : Expected timer name " + str(e) + " isn't in the csv file of the scene "+ sceneName +". It means that it wasn't exported by Tracy. The timer might not exist in this version of SOFA.")
-                exit(1)
+            timersValues[timer] = evaluateTimerPlan(timers[timer],tracyData,operandCache,None if perStep is None else perStep[timer])
+        except(TimerExpressionError) as e:
+            print("[ERROR] processFile : while computing the timers of the scene " + sceneName + " : " + str(e))
+            exit(1)
+
+    return timersValues
+
+def processFile(tracyData,timers,sceneName="default"):
+    # timers is the output of loadTimerFile
+    # tracyData is the output of loadCVSIntoDictionary
+    processedData = {}
+    timersValues = evaluateTimers(tracyData,timers,sceneName)
+    for timer in timersValues:
+        processedData[timer] = computeSingleData(timersValues[timer],1000000) #Nano seconds
 
     return processedData
 
-def exportToCSV(processedData,outputfile,timersDicts):
-    ### IMPORTANT must be kept coherant with what is done in computeSingleData
-    dataOrder = ["min","max","mean","std","quartile1","quartile2","quartile3","cardinality"]
+def evaluateTrial(csvFileName,startingStep,cacheDir,defaultTimers,lagrangianTimers,sceneName="default"):
+    # Load one execution of a scene and evaluate its timers, with the timers of the type of simulation detected on it
+    # Output looks like that : ( "FMAL" or "DAL", { "Timer1Name" : np array of the values of the timer (ns),... })
+    # Only the values of the timers are returned, the Tracy data of the execution never leaves the process loading it
+    simulationType, tracyData = loadTrial(csvFileName,startingStep,cacheDir)
+    if(simulationType == "FMAL"):
+        timersValues = evaluateTimers(tracyData,lagrangianTimers,sceneName)
+    else:
+        timersValues = evaluateTimers(tracyData,defaultTimers,sceneName)
+    return simulationType, timersValues
+
+# Number of time steps of an execution evaluated at once by reduceTrial
+STREAMING_WINDOW_STEPS = 256
+
+def _groupZoneRows(zoneCodes,timestamps,chunkRows=TRACY_CHUNK_ROWS):
+    # Return { zone code : (first row, end row) } if the occurences of each timer are contiguous and in time order,
+    # as written by 'tracy-csvexport -u', None otherwise
+    # The columns are read by chunks so that memory-mapped columns are never loaded whole
+    runStarts = []
+    runCodes = []
+    for start in range(0,len(zoneCodes),chunkRows):
+        # The last row of the previous chunk is read again to compare it with the first row of this one
+        first = max(0,start - 1)
+        codes = np.asarray(zoneCodes[first:start + chunkRows])
+        stamps = np.asarray(timestamps[first:start + chunkRows])
+        sameRun = codes[1:] == codes[:-1]
+        if(np.any(stamps[1:][sameRun] < stamps[:-1][sameRun])):
+            return None
+        newRuns = np.flatnonzero(~sameRun) + 1
+        if(start == 0):
+            newRuns = np.concatenate(([0],newRuns))
+        runStarts += (newRuns + first).tolist()
+        runCodes += codes[newRuns].tolist()
+
+    if(len(set(runCodes)) != len(runCodes)):
+        return None
+    return {code : (first, end) for code, first, end in zip(runCodes, runStarts, runStarts[1:] + [len(zoneCodes)])}
+
+def _loadStepWindow(columns,zoneRows,stepStarts,stepBegin,stepEnd):
+    # Return the occurences of the time steps [stepBegin, stepEnd[ of the timers of zoneRows (see _groupZoneRows) in the same
+    # form as loadCVSIntoDictionary, time step indices starting at 0 for stepBegin
+    zoneNames, zoneFiles, zoneCodes, timestamps, durations = columns
+    windowStarts = stepStarts[stepBegin:stepEnd]
+    tracyData = {}
+    for code, (first, end) in zoneRows.items():
+        # Occurences of a timer are in time order, the bounds of the window are found by dichotomy
+        low = first + np.searchsorted(timestamps[first:end],stepStarts[stepBegin],side='left')
+        high = first + np.searchsorted(timestamps[first:end],stepStarts[stepEnd],side='left') if(stepEnd < len(stepStarts)) else end
+        windowTimestamps = np.array(timestamps[low:high])
+        tracyData[zoneNames[code]] = (zoneFiles[code],np.array(durations[low:high]),windowTimestamps,np.searchsorted(windowStarts,windowTimestamps,side='right') - 1)
+    return tracyData
+
+def reduceTrial(csvFileName,startingStep,cacheDir,defaultTimers,lagrangianTimers,sceneName="default",sampleQuantum=0,windowSteps=STREAMING_WINDOW_STEPS):
+    # Load one execution of a scene and reduce each of its timers to a StreamingStatistic
+    # Output looks like that : ( "FMAL" or "DAL", { "Timer1Name" : StreamingStatistic,... }, { "Timer1Name" : encoded values,... })
+    # The raw values are only encoded for the sample archive if sampleQuantum > 0 (see sample_archive.py)
+    # The csv file is converted by chunks into its trace cache (in a temporary folder if cacheDir is None), which is then read
+    # memory-mapped by windows of windowSteps time steps : memory doesn't depend on the number of steps, apart from the
+    # timestamps of the steps (8 bytes per step) and the raw values kept for the sample archive
+    if(cacheDir is None):
+        with tempfile.TemporaryDirectory() as tmpCacheDir:
+            return reduceTrial(csvFileName,startingStep,tmpCacheDir,defaultTimers,lagrangianTimers,sceneName,sampleQuantum,windowSteps)
+
+    columns = loadCachedTracyColumnsByChunks(csvFileName,cacheDir,loadTracyColumnsByChunks)
+    zoneNames, zoneFiles, zoneCodes, timestamps, durations = columns
+    zoneRows = _groupZoneRows(zoneCodes,timestamps)
+    if(zoneRows is None):
+        print("[WARNING] reduceTrial : the occurences of the timers of the file " + csvFileName + " are not grouped by timer in time order, it is loaded whole in memory.")
+        simulationType, timersValues = evaluateTrial(csvFileName,startingStep,cacheDir,defaultTimers,lagrangianTimers,sceneName)
+        samples = encodeTimersSamples(timersValues,sampleQuantum) if sampleQuantum > 0 else {}
+        return simulationType, {timer : StreamingStatistic(timersValues[timer]) for timer in timersValues}, samples
+
+    # Same time steps as loadCVSIntoDictionary, the occurences of "Simulation::animate" being in time order
+    if("Simulation::animate" in zoneNames) and (zoneNames.index("Simulation::animate") in zoneRows):
+        first, end = zoneRows[zoneNames.index("Simulation::animate")]
+        animateTimestamps = np.array(timestamps[first:end])
+    else:
+        animateTimestamps = []
+    if(len(animateTimestamps) < startingStep):
+        if(len(animateTimestamps) == 0):
+            print(f"[ERROR] reduceTrial, while reading the file " +csvFileName+ f" : the timer \"Simulation::animate\" was not exported, the timestamp of the {startingStep}th timestep cannot be found.")
+        else:
+            print(f"[ERROR] reduceTrial, while reading the file " +csvFileName+ f" : the starting step {startingStep} is certainly greater thant the number of steps.")
+        exit(1)
+    stepStarts = animateTimestamps[startingStep-1:]
+
+    # Timers having occurences from the starting step, the occurences of a timer being in time order its last one is enough
+    trialZones = {zoneNames[code] : (zoneFiles[code],) for code, (first, end) in zoneRows.items() if timestamps[end-1] >= stepStarts[0]}
+    simulationType = "FMAL" if isFreeMotionAL(trialZones) else "DAL"
+    timers = selectTimers(trialZones,lagrangianTimers if simulationType == "FMAL" else defaultTimers,sceneName)
+
+    # Only the Tracy timers used by the timers are read
+    usedZones = {"Simulation::animate",*[zone for timer in timers for zone in timers[timer].zones]}
+    zoneRows = {code : rows for code, rows in zoneRows.items() if zoneNames[code] in usedZones}
+    windows = [(stepBegin, min(stepBegin + windowSteps,len(stepStarts))) for stepBegin in range(0,len(stepStarts),windowSteps)]
+
+    # A timer must be aggregated the same way on all windows, it is aggregated per step if it is on any of them (see timer_expressions.py)
+    perStep = {timer : timers[timer].perStep for timer in timers}
+    for stepBegin, stepEnd in windows:
+        if(all(perStep.values())):
+            break
+        tracyData = _loadStepWindow(columns,zoneRows,stepStarts,stepBegin,stepEnd)
+        for timer in timers:
+            perStep[timer] = perStep[timer] or isEvaluatedPerStep(timers[timer],tracyData)
+
+    statistics = {timer : StreamingStatistic() for timer in timers}
+    values = {timer : [] for timer in timers}
+    for stepBegin, stepEnd in windows:
+        windowValues = evaluateTimers(_loadStepWindow(columns,zoneRows,stepStarts,stepBegin,stepEnd),timers,sceneName,perStep)
+        for timer in timers:
+            statistics[timer].add(windowValues[timer])
+            if(sampleQuantum > 0):
+                values[timer].append(windowValues[timer])
+
+    samples = encodeTimersSamples({timer : np.concatenate(values[timer]) for timer in timers},sampleQuantum) if sampleQuantum > 0 else {}
+    return simulationType, statistics, samples
+
+def mergeTrialStatistics(trials,nbResamples=0):
+    # trials is a list of outputs of reduceTrial, one per execution of the scene
+    # Returns the same output as processScene, timers are the ones of the first execution
+    # A timer missing in an execution (an optional timer, or another type of simulation detected) is merged without it
+    # Confidence intervals need all the values, they cannot be computed from the streaming statistics and are set to NaN
+    processedData = {}
+    samples = {}
+    for timer in trials[0][1]:
+        statistic = StreamingStatistic()
+        for simulationType, trialStatistics, trialSamples in trials:
+            if(timer in trialStatistics):
+                statistic.merge(trialStatistics[timer])
+        processedData[timer] = statistic.toSingleData(1000000) #Nano seconds
+        if(nbResamples > 0):
+            processedData[timer] += [np.nan for name in BOOTSTRAP_STATISTICS_NAMES]
+        if(timer in trials[0][2]):
+            samples[timer] = [trialSamples[timer] for simulationType, trialStatistics, trialSamples in trials if timer in trialSamples]
+
+    return processedData, samples
+
+def exportToCSV(processedData,outputfile,timersDicts,dataOrder=STATISTICS_NAMES):
+    # dataOrder is the name of each value of the lists computed by computeSingleData
 
     #Create a unique list of all timers labels for the columns names (merging labels from all simulations)
     uniqueLabels = []
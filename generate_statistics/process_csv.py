@@ -2,6 +2,7 @@ import csv
 import sys
 import os
 from methods import *
+from sample_archive import SAMPLE_ARCHIVE_EXTENSION, DEFAULT_SAMPLE_QUANTUM_NS, writeSampleArchive
 from github import Auth
 from github import Github
 
@@ -30,14 +31,35 @@ from github import Github
 #              | Timer1_mean | Timer1_std | Timer2_mean | Timer2_std
 #       Scene1 |
 #       Scene2 |
+# - One file '<statistics file name>.samples.npz' next to it containing the raw values of each timer of each execution,
+#   compressed (see sample_archive.py). Set the environment variable PR_SAMPLE_ARCHIVE=0 to disable it and
+#   PR_SAMPLE_QUANTUM_NS to change the precision of the archived values (100ns by default).
 #
 # details:
 # - Timer names are the list of unique timer names from both default.timer and freemotion.timer files.
 # - The statistic data are defined in the method 'computeSingleData' in the file 'methods.py'
 # - One strong assumption is made to define weather the scene currently being treated is using a DefaultAnimationLoop or
 #   a FreeMotionAnimationLoop. The assumption is that the timer 'UpdateBBox' is sent in the file "DefaultAnimationLoop.cpp"
-# - One hot fix was necessary : the timer "CollisionReset" is send one time before the scene starts, this is an issue of
-#   SOFA calling the method CollisionReset once before the simulation starts. This is manually solved.
+# - The csv files are cached in a binary format in the folder 'tracy.cache' next to csvdir (see trace_cache.py) so that
+#   running again this script on the same data doesn't parse the csv files again. Set the environment variable
+#   PR_TRACE_CACHE=0 to disable it.
+# - The executions and the scenes are processed by PR_PROCESS_CSV_WORKERS processes (1 by default, meaning everything
+#   is done serially in this process). The output is the same whatever the number of workers.
+# - With PR_STREAMING_STATISTICS=1, each execution is reduced independently into bounded memory accumulators that are
+#   merged afterwards (see streaming_statistics.py) instead of concatenating all executions of a scene. The csv file is
+#   converted by chunks into its trace cache (in a temporary folder with PR_TRACE_CACHE=0) and its timers are evaluated
+#   by windows of time steps, so memory doesn't grow with the number of steps (apart from 8 bytes per step). This bound
+#   only holds with PR_SAMPLE_ARCHIVE=0 : the sample archive keeps all the values of each execution. It also requires
+#   the occurences of each timer to be grouped in time order as written by tracy-csvexport, otherwise the execution is
+#   loaded whole with a warning. Min, max, mean, std and cardinality are the same, quartiles are approximated with a
+#   relative error lower than 0.1%.
+# - With PR_BOOTSTRAP_RESAMPLES=N (N > 0, e.g. 1000), 95% confidence intervals of the mean and the median are computed by
+#   bootstrap with N resamples and added as columns <timer>_meanCILow, _meanCIHigh, _medianCILow, _medianCIHigh.
+#   Each execution is resampled by blocks of consecutive steps to respect the serial correlation within a run.
+#   They are NaN in streaming mode.
+# - Each timer occurence is attributed to the time step ("Simulation::animate" interval) in which it started. Timers
+#   combined in a timers file expression are aligned per time step when they are not called the same number of times
+#   in each step (e.g. "CollisionReset" being called once by SOFA before the simulation starts), see timer_expressions.py.
 #
 #
 #####################
@@ -61,14 +83,40 @@ with open(perffile) as file:
     lines = [line.rstrip().split(' ') for line in file]
 
 # Read timer files to compute the timer values afterwards. 
-# File structure : { "Timer1Name" : [subTimer1, subTimer2 ],... }
-# Sub timers are added when cumputing Timer1
+# File structure : { "Timer1Name" : TimerPlan,... }
+# Each expression is compiled once here, any error in the timer files stops the process before loading the csv files
 defaultTimers = loadTimerFile(defaultTimersFile)
 lagrangianTimers = loadTimerFile(lagrangianTimersFile)
 
-processedData={}
+# Binary cache of the csv files, stored next to the csv directory
+if(os.environ.get("PR_TRACE_CACHE","1") != "0"):
+    traceCacheDir = os.path.join(os.path.dirname(os.path.normpath(csvdir)),"tracy.cache")
+else:
+    traceCacheDir = None
 
-# Now process each simulation from perf file
+# Number of processes used to load the executions and compute the statistics of the scenes
+nbWorkers = max(1,int(os.environ.get("PR_PROCESS_CSV_WORKERS","1")))
+
+# Reduce each execution to bounded memory statistics instead of concatenating them
+streamingStatistics = os.environ.get("PR_STREAMING_STATISTICS","0") == "1"
+
+# Number of bootstrap resamples used to compute the confidence intervals, 0 to disable them
+nbResamples = max(0,int(os.environ.get("PR_BOOTSTRAP_RESAMPLES","0")))
+if(nbResamples > 0):
+    statisticsNames = STATISTICS_NAMES + BOOTSTRAP_STATISTICS_NAMES
+    if(streamingStatistics):
+        print("[WARNING] Confidence intervals cannot be computed with PR_STREAMING_STATISTICS=1, they will be set to NaN")
+else:
+    statisticsNames = STATISTICS_NAMES
+
+# Precision of the values stored in the sample archive, 0 if it is disabled
+if(os.environ.get("PR_SAMPLE_ARCHIVE","1") != "0"):
+    sampleQuantum = max(1,int(os.environ.get("PR_SAMPLE_QUANTUM_NS",str(DEFAULT_SAMPLE_QUANTUM_NS))))
+else:
+    sampleQuantum = 0
+
+# Gather the scenes to process from perf file
+scenes = []
 for line in lines:
     if not os.path.isfile(sofaSourceDir + "/" + line[0]):
         print("[WARNING] Skipping scene " + line[0] + " because it doesn't exist")
@@ -79,59 +127,51 @@ for line in lines:
     cvsFile = line[0].split('/')[-1]
     cvsFile = cvsFile.split('.')[0] 
 
-    tracyData = None
-    simulationType = None
-
-    CPUData = []
-
-    # For each execution of this simulation (second value after the scene path in the perf file)
-    for i in range(int(line[3])):
-
-        cvsFileName = csvdir + "/" + cvsFile + "_" + str(i+1) + ".csv"
-
-        # Output look like that : { "TimerName" : list[int] (time spent in each occurence of this time in the simulation),...}
-        temp = loadCVSIntoDictionary(cvsFileName,int(line[1]))
-
-        # Small optim to test if it is a lagrangian based simulation only once for each execution
-        # WARNING : This test is weak and depends on what file the UpdateBBox timer is located 
-        # FMAL: FreeMotionAnimationLoop
-        # DAL: DefaultAnimationLoop
-        if(simulationType is None):
-            if isFreeMotionAL(temp):
-                simulationType = "FMAL"
-            else:
-                simulationType = "DAL"
-
-        ### WARNING HOT FIX ###
-        # We know CollisionReset is called at init so the vector of data will have more data point then the other one, we need to remove the first ones
-        if((simulationType == "FMAL") and ("CollisionReset" in temp)):
-            sizeDiff = len(temp["CollisionReset"][1]) - len(temp["CollisionDetection"][1])
-            for j in range(sizeDiff):
-                temp["CollisionReset"][1].pop(0)
-                temp["CollisionReset"][2].pop(0)
-        ##### HOT FIX END #####
-
-        # Append all timer data to global vector
-        if(tracyData is None):
-            tracyData = temp
+    # (scene name, first step to take into account, number of executions of this simulation)
+    scenes.append((cvsFile,int(line[1]),int(line[3])))
+
+processedData={}
+samplesData={}
+
+# Now process each simulation from perf file
+# Executions are loaded and their timers evaluated by the workers, once all executions of a scene are available its statistics are computed by a worker as well.
+# To bound the memory, executions are only loaded for the next nbWorkers-1 scenes ahead of the one being gathered.
+with createExecutor(nbWorkers) as executor:
+    trialTasks = [None for scene in scenes]
+    sceneTasks = []
+    for sceneId, (cvsFile, startingStep, nbTrials) in enumerate(scenes):
+        for aheadId in range(sceneId, min(sceneId + nbWorkers, len(scenes))):
+            if(trialTasks[aheadId] is None):
+                aheadFile, aheadStartingStep, aheadNbTrials = scenes[aheadId]
+                aheadFileNames = [csvdir + "/" + aheadFile + "_" + str(i+1) + ".csv" for i in range(aheadNbTrials)]
+                if(streamingStatistics):
+                    # Output look like that : ( "FMAL" or "DAL", { "TimerName" : StreamingStatistic,...}, { "TimerName" : encoded values,...})
+                    trialTasks[aheadId] = [executor.submit(reduceTrial, fileName, aheadStartingStep, traceCacheDir, defaultTimers, lagrangianTimers, aheadFile, sampleQuantum) for fileName in aheadFileNames]
+                else:
+                    # Output look like that : ( "FMAL" or "DAL", { "TimerName" : np array of the values,...})
+                    # The timers are evaluated by the worker loading the execution, only their values are sent back
+                    trialTasks[aheadId] = [executor.submit(evaluateTrial, fileName, aheadStartingStep, traceCacheDir, defaultTimers, lagrangianTimers, aheadFile) for fileName in aheadFileNames]
+
+        trials = [task.result() for task in trialTasks[sceneId]]
+        trialTasks[sceneId] = []
+
+        # Now that the timers of each execution of the current simulation are evaluated, we can compute their statistics
+        if(streamingStatistics):
+            sceneTasks.append(executor.submit(mergeTrialStatistics, trials, nbResamples))
         else:
-            for label in tracyData:
-                tracyData[label][1].extend(temp[label][1])
-                tracyData[label][2].extend(temp[label][2])
+            sceneTasks.append(executor.submit(processScene, trials, nbResamples, sampleQuantum))
 
-        #Add CPU usage for file
-        cpuUsageFile = outputdir + '/' + cvsFile + "_" + str(i+1) + "_total_CPU_usage.log"
-        with open(cpuUsageFile) as CPUFile:
-            CPUData.append(float(CPUFile.readline().replace(',','.')))
+    for (cvsFile, startingStep, nbTrials), task in zip(scenes, sceneTasks):
+        processedData[cvsFile], samplesData[cvsFile] = task.result()
 
-    # Now that the timers data from each execution of the current simulation have been concatenated into tracyData, we can process it
-    # This computes the statistics per timer by using the forumla given in the timers files
-    if(simulationType == "FMAL"):
-        processedData[cvsFile] = processFile(tracyData,lagrangianTimers,cvsFile)
-    else:
-        processedData[cvsFile] = processFile(tracyData,defaultTimers,cvsFile)
+        #Add CPU usage for each execution
+        CPUData = []
+        for i in range(nbTrials):
+            cpuUsageFile = outputdir + '/' + cvsFile + "_" + str(i+1) + "_total_CPU_usage.log"
+            with open(cpuUsageFile) as CPUFile:
+                CPUData.append(float(CPUFile.readline().replace(',','.')))
 
-    processedData[cvsFile]["CPUUsage"] = computeSingleData(CPUData)
+        processedData[cvsFile]["CPUUsage"] = computeSingleData(CPUData,1,None,nbResamples)
 
 
 ##Create csv name
@@ -147,4 +187,6 @@ else:
     dateString = f"{commit_date.year}-{commit_date.month:02.0f}-{commit_date.day:02.0f}_{commit_date.hour:02.0f}-{commit_date.minute:02.0f}-{commit_date.second:02.0f}"
     outputFileName = f"{full_hash}_{dateString}"
 
-exportToCSV(processedData,outputdir+"/" + outputFileName + ".csv",[defaultTimers,lagrangianTimers,{"CPUUsage":None}])
+exportToCSV(processedData,outputdir+"/" + outputFileName + ".csv",[defaultTimers,lagrangianTimers,{"CPUUsage":None}],statisticsNames)
+if(sampleQuantum > 0):
+    writeSampleArchive(outputdir+"/" + outputFileName + SAMPLE_ARCHIVE_EXTENSION,samplesData,sampleQuantum)
@@ -0,0 +1,72 @@
+import json
+import lzma
+import numpy as np
+
+
+#### Sample archive ####
+# brief: Compact archive of the raw values of each timer (one value per occurence or per time step, see
+#        timer_expressions.py) of each execution of each scene, written next to the statistics csv file so that the
+#        distributions can be displayed or the statistics recomputed afterwards.
+#
+# details:
+# - The archive is a non compressed npz file '<statistics file name>.samples.npz' containing :
+#   - '__meta__' : JSON header as uint8 array {"version", "quantumNs", "scenes" : {scene : {timer : [size of each encoded execution]}}}
+#   - '<scene>/<timer>' : uint8 array, concatenation of the encoded values of each execution
+# - The values of one execution are encoded this way :
+#   - rounded to the nearest multiple of quantumNs (100ns by default, the timers are in ns)
+#   - delta encoded (first value then differences between consecutive values). Deltas of independent values have a
+#     larger range than the values themselves, so the values are kept as is when it gives a smaller output.
+#   - stored with the smallest integer type holding all the values, after a 2 bytes header : size of the type, 1 if
+#     delta encoded else 0
+#   - compressed with lzma (raw LZMA2 stream, without container to save space on small executions)
+# - Each execution is compressed independently so that the archive can be built by the workers of process_csv.py and
+#   read lazily, the dashboard only decompresses the scene and timer being displayed with decodeSamples (see
+#   loadSceneSamples in dashboard/utils.py). It ignores the archives of another version.
+########################
+
+SAMPLE_ARCHIVE_VERSION = 1
+SAMPLE_ARCHIVE_EXTENSION = ".samples.npz"
+DEFAULT_SAMPLE_QUANTUM_NS = 100
+
+_INTEGER_TYPES = [np.int8, np.int16, np.int32, np.int64]
+_LZMA_FILTERS = [{"id" : lzma.FILTER_LZMA2, "preset" : 6}]
+
+
+def _packIntegers(integers, isDelta):
+    for dtype in _INTEGER_TYPES:
+        limits = np.iinfo(dtype)
+        if((len(integers) == 0) or ((integers.min() >= limits.min) and (integers.max() <= limits.max))):
+            break
+    rawData = bytes([np.dtype(dtype).itemsize, int(isDelta)]) + integers.astype(dtype).tobytes()
+    return lzma.compress(rawData, format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+
+def encodeSamples(values, quantumNs=DEFAULT_SAMPLE_QUANTUM_NS):
+    quantized = np.rint(np.asarray(values, dtype=np.float64)/quantumNs).astype(np.int64)
+    encoded = min(_packIntegers(np.diff(quantized, prepend=np.int64(0)), True), _packIntegers(quantized, False), key=len)
+    return np.frombuffer(encoded, dtype=np.uint8)
+
+def decodeSamples(encoded, quantumNs=DEFAULT_SAMPLE_QUANTUM_NS):
+    rawData = lzma.decompress(np.asarray(encoded, dtype=np.uint8).tobytes(), format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+    dtype = {np.dtype(dtype).itemsize : dtype for dtype in _INTEGER_TYPES}[rawData[0]]
+    integers = np.frombuffer(rawData, dtype=dtype, offset=2).astype(np.int64)
+    if(rawData[1] == 1):
+        integers = np.cumsum(integers)
+    return integers * float(quantumNs)
+
+def encodeTimersSamples(timersValues, quantumNs=DEFAULT_SAMPLE_QUANTUM_NS):
+    # timersValues is the output of evaluateTimers for one execution : { "TimerName" : values,... }
+    return {timer : encodeSamples(values, quantumNs) for timer, values in timersValues.items()}
+
+def writeSampleArchive(archivePath, scenesSamples, quantumNs=DEFAULT_SAMPLE_QUANTUM_NS):
+    # scenesSamples : { "SceneName" : { "TimerName" : [encoded values of each execution],... },... }
+    meta = {"version" : SAMPLE_ARCHIVE_VERSION,
+            "quantumNs" : quantumNs,
+            "scenes" : {scene : {timer : [len(encoded) for encoded in trials] for timer, trials in timers.items()} for scene, timers in scenesSamples.items()}}
+    arrays = {"__meta__" : np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)}
+    for scene, timers in scenesSamples.items():
+        for timer, trials in timers.items():
+            arrays[f"{scene}/{timer}"] = np.concatenate(trials) if len(trials) > 0 else np.zeros(0, dtype=np.uint8)
+
+    # np.savez adds the extension .npz if it is missing, write through a file object to keep the exact name
+    with open(archivePath, mode="wb") as file:
+        np.savez(file, **arrays)
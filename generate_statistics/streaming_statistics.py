@@ -0,0 +1,140 @@
+import math
+import numpy as np
+
+
+#### Streaming statistics ####
+# brief: Bounded memory accumulator of the statistics computed by computeSingleData (methods.py), used to reduce each
+#        execution of a scene independently and merge the results afterwards instead of concatenating all samples.
+#
+# details:
+# - min, max and cardinality are exact
+# - mean and std are computed with Welford's algorithm, batches and accumulators are merged with Chan's formula
+# - quartiles come from a DDSketch-like quantile sketch : values are counted in logarithmic buckets of ratio
+#   gamma = (1+alpha)/(1-alpha), each quantile is then known with a relative error lower than alpha.
+#   Positive and negative values have their own buckets, zeros are counted apart.
+#   The number of buckets is bounded by maxBuckets, if it is exceeded the lowest buckets (smallest magnitudes) are
+#   collapsed together, the guarantee then only holds for the quantiles above the collapsed buckets.
+#   Sketches with the same alpha can be merged without losing precision.
+##############################
+
+DEFAULT_RELATIVE_ACCURACY = 0.001
+DEFAULT_MAX_BUCKETS = 4096
+
+class QuantileSketch():
+    relativeAccuracy : float
+    maxBuckets : int
+    positiveBuckets : dict[int,int]  # bucket key -> number of values
+    negativeBuckets : dict[int,int]  # bucket key of the absolute value -> number of values
+    zeroCount : int
+
+    def __init__(self, relativeAccuracy:float=DEFAULT_RELATIVE_ACCURACY, maxBuckets:int=DEFAULT_MAX_BUCKETS):
+        self.relativeAccuracy = relativeAccuracy
+        self.maxBuckets       = maxBuckets
+        self.gamma            = (1 + relativeAccuracy)/(1 - relativeAccuracy)
+        self.logGamma         = math.log(self.gamma)
+        self.positiveBuckets  = {}
+        self.negativeBuckets  = {}
+        self.zeroCount        = 0
+
+    def _addToBuckets(self, buckets:dict, magnitudes:np.ndarray):
+        keys, counts = np.unique(np.ceil(np.log(magnitudes)/self.logGamma).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            buckets[key] = buckets.get(key, 0) + count
+
+    def _collapse(self, buckets:dict):
+        # Merge the lowest buckets into the first kept one until the maximal number of buckets is respected
+        if(len(buckets) <= self.maxBuckets):
+            return
+        keys = sorted(buckets)
+        nbCollapsed = len(keys) - self.maxBuckets + 1
+        collapsedCount = sum(buckets.pop(key) for key in keys[:nbCollapsed])
+        buckets[keys[nbCollapsed]] += collapsedCount
+
+    def add(self, values:np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        self.zeroCount += int(np.count_nonzero(values == 0))
+        self._addToBuckets(self.positiveBuckets, values[values > 0])
+        self._addToBuckets(self.negativeBuckets, -values[values < 0])
+        self._collapse(self.positiveBuckets)
+        self._collapse(self.negativeBuckets)
+
+    def merge(self, other:"QuantileSketch"):
+        if(other.relativeAccuracy != self.relativeAccuracy):
+            raise ValueError("QuantileSketch.merge : sketches don't have the same relative accuracy")
+        for buckets, otherBuckets in [(self.positiveBuckets, other.positiveBuckets), (self.negativeBuckets, other.negativeBuckets)]:
+            for key, count in otherBuckets.items():
+                buckets[key] = buckets.get(key, 0) + count
+        self.zeroCount += other.zeroCount
+        self._collapse(self.positiveBuckets)
+        self._collapse(self.negativeBuckets)
+
+    def quantiles(self, fractions:list[float]):
+        # Values of the buckets sorted by increasing value, with their counts
+        negativeKeys = np.array(sorted(self.negativeBuckets, reverse=True), dtype=np.int64)
+        positiveKeys = np.array(sorted(self.positiveBuckets), dtype=np.int64)
+        bucketValues = np.concatenate((-2*np.power(self.gamma, negativeKeys.astype(np.float64))/(self.gamma + 1),
+                                       [0.0],
+                                       2*np.power(self.gamma, positiveKeys.astype(np.float64))/(self.gamma + 1)))
+        bucketCounts = np.concatenate(([self.negativeBuckets[key] for key in negativeKeys.tolist()],
+                                       [self.zeroCount],
+                                       [self.positiveBuckets[key] for key in positiveKeys.tolist()])).astype(np.int64)
+        cumulatedCounts = np.cumsum(bucketCounts)
+        if(cumulatedCounts[-1] == 0):
+            return [np.nan for fraction in fractions]
+
+        # Same definition as np.percentile (linear method) : interpolation at rank q*(n-1) in the sorted values
+        ranks = np.asarray(fractions, dtype=np.float64)*(cumulatedCounts[-1] - 1)
+        lowerValues = bucketValues[np.searchsorted(cumulatedCounts, np.floor(ranks), side='right')]
+        upperValues = bucketValues[np.searchsorted(cumulatedCounts, np.ceil(ranks), side='right')]
+        return (lowerValues + (ranks - np.floor(ranks))*(upperValues - lowerValues)).tolist()
+
+
+class StreamingStatistic():
+    count : int
+    minimum : float
+    maximum : float
+    mean : float
+    m2 : float             # Sum of the squared differences to the mean
+    sketch : QuantileSketch
+
+    def __init__(self, values:np.ndarray=None, relativeAccuracy:float=DEFAULT_RELATIVE_ACCURACY, maxBuckets:int=DEFAULT_MAX_BUCKETS):
+        self.count   = 0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.mean    = 0.0
+        self.m2      = 0.0
+        self.sketch  = QuantileSketch(relativeAccuracy, maxBuckets)
+        if(values is not None):
+            self.add(values)
+
+    def _mergeMoments(self, count:int, mean:float, m2:float):
+        totalCount = self.count + count
+        delta = mean - self.mean
+        self.mean += delta*count/totalCount
+        self.m2   += m2 + delta*delta*self.count*count/totalCount
+        self.count = totalCount
+
+    def add(self, values:np.ndarray):
+        values = np.asarray(values)
+        if(len(values) == 0):
+            return
+        self.minimum = min(self.minimum, float(np.min(values)))
+        self.maximum = max(self.maximum, float(np.max(values)))
+        batchMean = float(np.mean(values))
+        self._mergeMoments(len(values), batchMean, float(np.sum(np.square(values - batchMean))))
+        self.sketch.add(values)
+
+    def merge(self, other:"StreamingStatistic"):
+        if(other.count == 0):
+            return
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        self._mergeMoments(other.count, other.mean, other.m2)
+        self.sketch.merge(other.sketch)
+
+    def toSingleData(self, applyDivisor = 1):
+        # Same layout as computeSingleData : [min, max, mean, std, first quartile, second quartile, third quartile, number of samples]
+        # The quartiles are bounded by the exact min and max
+        quartiles = [min(max(value, self.minimum), self.maximum) for value in self.sketch.quantiles([0.25, 0.5, 0.75])]
+        return [self.minimum/applyDivisor, self.maximum/applyDivisor, self.mean/applyDivisor, math.sqrt(self.m2/self.count)/applyDivisor,
+                quartiles[0]/applyDivisor, quartiles[1]/applyDivisor, quartiles[2]/applyDivisor, self.count]
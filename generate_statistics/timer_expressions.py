@@ -0,0 +1,280 @@
+import re
+import numpy as np
+
+
+#### Timer expressions ####
+# brief: Small expression language used in the timers files (default.timers, freemotion.timers) to define the timers
+#        written in the statistics from the timers exported by Tracy.
+#
+# syntax: one timer per line "TimerNameInStats=expression", empty lines and lines starting with '#' are ignored.
+#   expression := term (('+'|'-') term)*
+#   term       := unary (('*'|'/') unary)*
+#   unary      := '-' unary | primary
+#   primary    := number | zone | 'dur(' zone ')' | 'ts(' zone ')' | '(' expression ')'
+#   zone       := name of the timer in SOFA, e.g. Simulation::animate, or "any name" between double quotes
+#
+# - dur(zone) is the time spent in each occurence of the timer, ts(zone) the timestamp of each occurence
+# - A zone alone means dur(zone)
+# - For compatibility, an expression being exactly "zone1-zone2" means ts(zone1)-ts(zone2)-dur(zone1). This is used for
+#   timers coming from events (e.g. CollisionEndEvent-CollisionBeginEvent) where we want the time spent in between and
+#   not the time spent in the event itself.
+# - Constants can only scale (*, /) or offset (+, -) a timer, e.g. "0.5*(dur(A)+dur(B))" or "dur(A)/4". Constant
+#   subexpressions are computed when the expression is compiled, a division by a constant equal to zero is an error.
+# - A timestamp alone (possibly scaled or offset) is not a timer, ts() must be used in a difference, e.g. ts(A)-ts(B)
+# - "perstep(expression)", only around the whole expression, computes one value per time step : dur(zone) is then the
+#   total time spent in the timer during the step and ts(zone) the timestamp of its first occurence in the step.
+#   Steps in which a ts() operand has no occurence are ignored.
+# - Otherwise the values are per call when all the timers of the expression are called the same number of times in
+#   every time step (e.g. a single timer), and automatically per step when they are not, so that the operands are
+#   always aligned on the same time steps.
+#
+# Each expression is compiled once into a TimerPlan : a list of operations in reverse polish notation, evaluated with
+# NumPy on the arrays of each scene.
+###########################
+
+class TimerExpressionError(ValueError):
+    pass
+
+
+class TimerPlan():
+    name : str               # Name of the timer in the statistics
+    expression : str         # Expression as written in the timers file
+    operations : list[tuple] # Operations in reverse polish notation
+    zones : list[str]        # Unique list of the Tracy timers needed to evaluate the plan
+    perStep : bool           # If True values are always aggregated per time step
+
+    def __init__(self, name:str, expression:str, operations:list[tuple], perStep:bool=False):
+        self.name       = name
+        self.expression = expression
+        self.operations = operations
+        self.perStep    = perStep
+        self.zones      = []
+        for operation in operations:
+            if((operation[0] == 'load') and (operation[2] not in self.zones)):
+                self.zones.append(operation[2])
+
+    def __repr__(self):
+        return f"TimerPlan({self.name}={self.expression})"
+
+
+_TOKEN_REGEX = re.compile(r'(?P<number>\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)'
+                          r'|(?P<name>[A-Za-z_][A-Za-z0-9_:.<>]*)'
+                          r'|"(?P<quoted>[^"]*)"'
+                          r'|(?P<operator>[-+*/()])')
+
+def tokenizeExpression(expression:str):
+    # Return a list of (kind, value, position) with kind in 'number', 'name', 'operator'
+    tokens = []
+    position = 0
+    while position < len(expression):
+        if(expression[position].isspace()):
+            position += 1
+            continue
+        match = _TOKEN_REGEX.match(expression, position)
+        if(match is None):
+            raise TimerExpressionError(f"unexpected character '{expression[position]}' at position {position}")
+        kind = match.lastgroup
+        tokens.append(('name' if kind == 'quoted' else kind, match.group(kind), position))
+        position = match.end()
+    return tokens
+
+
+class _Parser():
+    # Recursive descent parser producing the operations of a TimerPlan.
+    # Each parse method returns the kind of the parsed value : 'series' (array) or 'const' (scalar). The constant
+    # subexpressions are folded while parsing : a 'const' value is always a single ('const', value) operation.
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+        self.operations = []
+
+    def peek(self):
+        if(self.position < len(self.tokens)):
+            return self.tokens[self.position]
+        return (None, None, None)
+
+    def next(self):
+        token = self.peek()
+        if(token[0] is None):
+            raise TimerExpressionError("unexpected end of expression")
+        self.position += 1
+        return token
+
+    def appendOperation(self, operation, kind):
+        # Append the operation, computed at once if its operands are constants
+        if(kind == 'const'):
+            if(operation[0] == 'neg'):
+                self.operations[-1] = ('const', -self.operations[-1][1])
+                return
+            right = self.operations.pop()[1]
+            left = self.operations.pop()[1]
+            value = {'add' : lambda : left + right, 'sub' : lambda : left - right,
+                     'mul' : lambda : left * right, 'div' : lambda : left / right}[operation[0]]()
+            self.operations.append(('const', value))
+            return
+        self.operations.append(operation)
+
+    def expect(self, operator):
+        kind, value, position = self.next()
+        if((kind != 'operator') or (value != operator)):
+            raise TimerExpressionError(f"expected '{operator}' at position {position}, got '{value}'")
+
+    def parseExpression(self):
+        kind = self.parseTerm()
+        while((self.peek()[0] == 'operator') and (self.peek()[1] in "+-")):
+            operator = self.next()[1]
+            rightKind = self.parseTerm()
+            kind = 'const' if (kind == 'const' and rightKind == 'const') else 'series'
+            self.appendOperation(('add',) if operator == '+' else ('sub',), kind)
+        return kind
+
+    def parseTerm(self):
+        kind = self.parseUnary()
+        while((self.peek()[0] == 'operator') and (self.peek()[1] in "*/")):
+            operator, position = self.next()[1:]
+            rightKind = self.parseUnary()
+            if(operator == '*'):
+                if((kind == 'series') and (rightKind == 'series')):
+                    raise TimerExpressionError(f"two timers cannot be multiplied (position {position}), only scaling by a constant is allowed")
+            else:
+                if(rightKind == 'series'):
+                    raise TimerExpressionError(f"cannot divide by a timer (position {position}), only scaling by a constant is allowed")
+                # The divisor is a folded constant, e.g. 0 for "A/(2-2)"
+                if(self.operations[-1][1] == 0):
+                    raise TimerExpressionError(f"division by zero (position {position})")
+            kind = 'const' if (kind == 'const' and rightKind == 'const') else 'series'
+            self.appendOperation(('mul',) if operator == '*' else ('div',), kind)
+        return kind
+
+    def parseUnary(self):
+        if(self.peek()[:2] == ('operator', '-')):
+            self.next()
+            kind = self.parseUnary()
+            self.appendOperation(('neg',), kind)
+            return kind
+        return self.parsePrimary()
+
+    def parsePrimary(self):
+        kind, value, position = self.next()
+        if(kind == 'number'):
+            self.operations.append(('const', int(value) if value.isdigit() else float(value)))
+            return 'const'
+        if(kind == 'name'):
+            if((value == 'perstep') and (self.peek()[:2] == ('operator', '('))):
+                raise TimerExpressionError(f"perstep() at position {position} can only be used around the whole expression")
+            if((value in ('dur', 'ts')) and (self.peek()[:2] == ('operator', '('))):
+                self.next()
+                zoneKind, zone, zonePosition = self.next()
+                if(zoneKind != 'name'):
+                    raise TimerExpressionError(f"expected a timer name in {value}() at position {zonePosition}, got '{zone}'")
+                self.expect(')')
+                self.operations.append(('load', value, zone))
+            else:
+                self.operations.append(('load', 'dur', value))
+            return 'series'
+        if((kind == 'operator') and (value == '(')):
+            innerKind = self.parseExpression()
+            self.expect(')')
+            return innerKind
+        raise TimerExpressionError(f"unexpected '{value}' at position {position}")
+
+
+def compileTimerExpression(name:str, expression:str):
+    # Return the TimerPlan of the expression, raise TimerExpressionError if the expression is wrongly formed
+    tokens = tokenizeExpression(expression)
+    if(len(tokens) == 0):
+        raise TimerExpressionError("empty expression")
+
+    # Legacy notation "zone1-zone2" : difference of timestamps minus the time spent in zone1
+    if([token[0] for token in tokens] == ['name', 'operator', 'name'] and (tokens[1][1] == '-')
+       and (tokens[0][1] not in ('dur', 'ts')) and (tokens[2][1] not in ('dur', 'ts'))):
+        return TimerPlan(name, expression, [('load', 'ts', tokens[0][1]), ('load', 'ts', tokens[2][1]), ('sub',),
+                                            ('load', 'dur', tokens[0][1]), ('sub',)])
+
+    parser = _Parser(tokens)
+    perStep = (tokens[0][:2] == ('name', 'perstep')) and (tokens[1:2] != []) and (tokens[1][:2] == ('operator', '('))
+    if(perStep):
+        parser.position = 2
+    kind = parser.parseExpression()
+    if(perStep):
+        parser.expect(')')
+    if(parser.peek()[0] is not None):
+        raise TimerExpressionError(f"unexpected '{parser.peek()[1]}' at position {parser.peek()[2]}")
+    if(kind == 'const'):
+        raise TimerExpressionError("the expression doesn't use any timer")
+    # A single timestamp, even offset by constants or durations, is a date and not a duration
+    timestamps = [operation[2] for operation in parser.operations if operation[:2] == ('load', 'ts')]
+    if(len(timestamps) == 1):
+        raise TimerExpressionError(f"the expression is the timestamp ts({timestamps[0]}), not a duration : use dur({timestamps[0]}) or a difference of timestamps")
+
+    return TimerPlan(name, expression, parser.operations, perStep)
+
+
+def _isAlignedPerCall(plan:TimerPlan, tracyData:dict):
+    # True if all the timers of the plan have the same time step index for each occurence
+    steps = tracyData[plan.zones[0]][3]
+    return all(np.array_equal(steps, tracyData[zone][3]) for zone in plan.zones[1:])
+
+def isEvaluatedPerStep(plan:TimerPlan, tracyData:dict):
+    # True if the values of the plan are aggregated per time step when it is evaluated on tracyData
+    return plan.perStep or not _isAlignedPerCall(plan, tracyData)
+
+def _loadOperand(tracyData:dict, selector:str, zone:str, perStep:bool):
+    if(not perStep):
+        return np.asarray(tracyData[zone][1 if selector == 'dur' else 2])
+
+    nbSteps = len(tracyData["Simulation::animate"][1])
+    steps = tracyData[zone][3]
+    if(selector == 'dur'):
+        # Total time spent in the timer during each step, exact in float64 for any realistic duration in ns
+        return np.rint(np.bincount(steps, weights=tracyData[zone][1], minlength=nbSteps)).astype(np.int64)
+
+    # Timestamp of the first occurence in each step, NaN if the timer isn't called during the step
+    firstTimestamps = np.full(nbSteps, np.inf)
+    np.minimum.at(firstTimestamps, steps, tracyData[zone][2])
+    firstTimestamps[np.isinf(firstTimestamps)] = np.nan
+    return firstTimestamps
+
+
+def evaluateTimerPlan(plan:TimerPlan, tracyData:dict, operandCache:dict=None, perStep:bool=None):
+    # tracyData is the output of loadCVSIntoDictionary, all zones of the plan must be in it
+    # operandCache can be shared between the plans evaluated on the same tracyData to convert each operand only once
+    # perStep forces the aggregation per step (True) or per call (False), by default it is chosen with isEvaluatedPerStep
+    if(operandCache is None):
+        operandCache = {}
+
+    if(perStep is None):
+        perStep = isEvaluatedPerStep(plan, tracyData)
+
+    stack = []
+    for operation in plan.operations:
+        code = operation[0]
+        if(code == 'load'):
+            key = (*operation[1:], perStep)
+            if(key not in operandCache):
+                operandCache[key] = _loadOperand(tracyData, operation[1], operation[2], perStep)
+            stack.append(operandCache[key])
+        elif(code == 'const'):
+            stack.append(operation[1])
+        elif(code == 'neg'):
+            stack.append(-stack.pop())
+        else:
+            right = stack.pop()
+            left = stack.pop()
+            if((np.ndim(left) == 1) and (np.ndim(right) == 1) and (len(left) != len(right))):
+                raise TimerExpressionError(f"operands of {plan.name}={plan.expression} don't have the same number of occurences ({len(left)} and {len(right)})")
+            if(code == 'add'):
+                stack.append(left + right)
+            elif(code == 'sub'):
+                stack.append(left - right)
+            elif(code == 'mul'):
+                stack.append(left * right)
+            else:
+                stack.append(left / right)
+
+    values = stack.pop()
+    if(perStep and (values.dtype.kind == 'f')):
+        # Remove the steps in which a ts() operand wasn't called
+        values = values[~np.isnan(values)]
+    return values
@@ -0,0 +1,182 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+
+#### Trace cache ####
+# brief: Binary columnar cache of the Tracy csv files, to avoid parsing again the text output of tracy-csvexport
+#        each time process_csv.py is launched on the same run (e.g. to test a new timer definition).
+#
+# details:
+# - One cache file is written per csv file, e.g. tracy.csv/SceneName_1.csv -> tracy.cache/SceneName_1.trace
+# - A cache file is laid out this way :
+#   | magic (8 bytes) | header length (8 bytes) | JSON header | padding | zoneCodes (int32) | padding | timestamps (int64) | durations (int64) |
+#   The JSON header contains the key of the source file (size, mtime and content hash), the dictionary of timer
+#   names with their CPP file and the number of rows. Arrays are 8 bytes aligned so they can be memory-mapped.
+# - A cache file is valid if the size of the source is the same and either its mtime or its content hash is the same.
+#   Otherwise it is rebuilt from the csv file.
+# - With loadCachedTracyColumnsByChunks the cache is built from the csv file parsed by chunks and returned memory-mapped,
+#   so that a csv file is converted and read without being loaded whole in memory.
+#####################
+
+TRACE_CACHE_MAGIC = b"PRTRACE1"
+TRACE_CACHE_VERSION = 1
+TRACE_CACHE_EXTENSION = ".trace"
+# Number of rows copied at once when writing a cache file
+TRACE_CACHE_CHUNK_ROWS = 1 << 20
+
+
+def getTraceCachePath(cacheDir, csvFileName):
+    return os.path.join(cacheDir, os.path.splitext(os.path.basename(csvFileName))[0] + TRACE_CACHE_EXTENSION)
+
+def hashSourceFile(fileName):
+    with open(fileName, mode="rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+def _alignedOffset(offset):
+    return (offset + 7) & ~7
+
+def readTraceCache(cachePath):
+    # Return (header, zoneCodes, timestamps, durations) with arrays memory-mapped on the cache file,
+    # or None if the file doesn't exist or isn't a valid cache file
+    try:
+        with open(cachePath, mode="rb") as file:
+            if(file.read(len(TRACE_CACHE_MAGIC)) != TRACE_CACHE_MAGIC):
+                return None
+            headerLength = int.from_bytes(file.read(8), "little")
+            header = json.loads(file.read(headerLength).decode("utf-8"))
+        if(header.get("version") != TRACE_CACHE_VERSION):
+            return None
+
+        nbRows = header["rows"]
+        codesOffset = _alignedOffset(len(TRACE_CACHE_MAGIC) + 8 + headerLength)
+        timestampsOffset = _alignedOffset(codesOffset + 4*nbRows)
+        durationsOffset = timestampsOffset + 8*nbRows
+        if(os.path.getsize(cachePath) != durationsOffset + 8*nbRows):
+            return None
+
+        if(nbRows == 0):
+            return header, np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        zoneCodes  = np.memmap(cachePath, dtype=np.int32, mode="r", offset=codesOffset, shape=(nbRows,))
+        timestamps = np.memmap(cachePath, dtype=np.int64, mode="r", offset=timestampsOffset, shape=(nbRows,))
+        durations  = np.memmap(cachePath, dtype=np.int64, mode="r", offset=durationsOffset, shape=(nbRows,))
+    except(OSError, ValueError, KeyError):
+        return None
+
+    return header, zoneCodes, timestamps, durations
+
+def _writeHeader(file, sourceKey, zoneNames, zoneFiles, nbRows):
+    header = {"version" : TRACE_CACHE_VERSION,
+              "source" : sourceKey,
+              "zoneNames" : list(zoneNames),
+              "zoneFiles" : list(zoneFiles),
+              "rows" : nbRows}
+    rawHeader = json.dumps(header).encode("utf-8")
+    file.write(TRACE_CACHE_MAGIC)
+    file.write(len(rawHeader).to_bytes(8, "little"))
+    file.write(rawHeader)
+
+def _writePadding(file):
+    file.write(b"\0" * (_alignedOffset(file.tell()) - file.tell()))
+
+def writeTraceCache(cachePath, sourceKey, zoneNames, zoneFiles, zoneCodes, timestamps, durations):
+    # Write in a temporary file then rename it so that a concurrent reader never sees a partial file
+    # Arrays are written by chunks, memory-mapped arrays are then never loaded whole
+    tmpPath = f"{cachePath}.{os.getpid()}.tmp"
+    with open(tmpPath, mode="wb") as file:
+        _writeHeader(file, sourceKey, zoneNames, zoneFiles, len(zoneCodes))
+        for array, dtype in [(zoneCodes, np.int32), (timestamps, np.int64), (durations, np.int64)]:
+            _writePadding(file)
+            for start in range(0, len(array), TRACE_CACHE_CHUNK_ROWS):
+                file.write(np.ascontiguousarray(array[start:start + TRACE_CACHE_CHUNK_ROWS], dtype=dtype).tobytes())
+    os.replace(tmpPath, cachePath)
+
+def writeTraceCacheFromChunks(cachePath, sourceKey, chunks):
+    # chunks yields (zoneNames, zoneFiles, zoneCodes, timestamps, durations) for consecutive rows of the csv file,
+    # zoneNames and zoneFiles being the timers found so far (see loadTracyColumnsByChunks in methods.py)
+    # The columns are first written in their own temporary files, then copied after the header once the number of rows is known
+    tmpPath = f"{cachePath}.{os.getpid()}.tmp"
+    columnPaths = [f"{tmpPath}.{column}" for column in ("codes", "timestamps", "durations")]
+    zoneNames, zoneFiles, nbRows = [], [], 0
+    columnFiles = []
+    try:
+        try:
+            for columnPath in columnPaths:
+                columnFiles.append(open(columnPath, mode="w+b"))
+            for zoneNames, zoneFiles, *columns in chunks:
+                for columnFile, array, dtype in zip(columnFiles, columns, (np.int32, np.int64, np.int64)):
+                    columnFile.write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+                nbRows += len(columns[0])
+
+            with open(tmpPath, mode="wb") as file:
+                _writeHeader(file, sourceKey, zoneNames, zoneFiles, nbRows)
+                for columnFile in columnFiles:
+                    _writePadding(file)
+                    columnFile.seek(0)
+                    shutil.copyfileobj(columnFile, file)
+        finally:
+            for columnFile in columnFiles:
+                columnFile.close()
+        os.replace(tmpPath, cachePath)
+    finally:
+        for path in [tmpPath, *columnPaths]:
+            if(os.path.exists(path)):
+                os.remove(path)
+
+def _loadValidTraceCache(csvFileName, cachePath, sourceStat, copyColumns):
+    # Return (zoneNames, zoneFiles, zoneCodes, timestamps, durations) read from the cache file if it is valid for the csv file, None otherwise
+    cached = readTraceCache(cachePath)
+    if(cached is None):
+        return None
+    header, zoneCodes, timestamps, durations = cached
+    source = header.get("source", {})
+    if(source.get("size") != sourceStat.st_size):
+        return None
+    if(source.get("mtime") == sourceStat.st_mtime_ns):
+        return header["zoneNames"], header["zoneFiles"], zoneCodes, timestamps, durations
+
+    # The file has been touched or copied, only trust its content
+    sourceHash = hashSourceFile(csvFileName)
+    if(source.get("hash") != sourceHash):
+        return None
+    if(copyColumns):
+        zoneCodes, timestamps, durations = np.array(zoneCodes), np.array(timestamps), np.array(durations)
+    writeTraceCache(cachePath, {"size" : sourceStat.st_size, "mtime" : sourceStat.st_mtime_ns, "hash" : sourceHash},
+                    header["zoneNames"], header["zoneFiles"], zoneCodes, timestamps, durations)
+    return header["zoneNames"], header["zoneFiles"], zoneCodes, timestamps, durations
+
+def loadCachedTracyColumns(csvFileName, cacheDir, parseColumns):
+    # Same output as parseColumns(csvFileName) : (zoneNames, zoneFiles, zoneCodes, timestamps, durations)
+    # parseColumns is only called if the cache is missing or outdated, the cache is then (re)built.
+    os.makedirs(cacheDir, exist_ok=True)
+    cachePath = getTraceCachePath(cacheDir, csvFileName)
+    sourceStat = os.stat(csvFileName)
+
+    cached = _loadValidTraceCache(csvFileName, cachePath, sourceStat, True)
+    if(cached is not None):
+        return cached
+
+    zoneNames, zoneFiles, zoneCodes, timestamps, durations = parseColumns(csvFileName)
+    sourceKey = {"size" : sourceStat.st_size, "mtime" : sourceStat.st_mtime_ns, "hash" : hashSourceFile(csvFileName)}
+    writeTraceCache(cachePath, sourceKey, zoneNames, zoneFiles, zoneCodes, timestamps, durations)
+
+    return zoneNames, zoneFiles, zoneCodes, timestamps, durations
+
+def loadCachedTracyColumnsByChunks(csvFileName, cacheDir, parseChunks):
+    # Same output as loadCachedTracyColumns, the arrays being always memory-mapped on the cache file
+    # parseChunks(csvFileName) yields the columns by chunks of rows, it is only called if the cache is missing or outdated
+    os.makedirs(cacheDir, exist_ok=True)
+    cachePath = getTraceCachePath(cacheDir, csvFileName)
+    sourceStat = os.stat(csvFileName)
+
+    cached = _loadValidTraceCache(csvFileName, cachePath, sourceStat, False)
+    if(cached is not None):
+        return cached
+
+    sourceKey = {"size" : sourceStat.st_size, "mtime" : sourceStat.st_mtime_ns, "hash" : hashSourceFile(csvFileName)}
+    writeTraceCacheFromChunks(cachePath, sourceKey, parseChunks(csvFileName))
+    header, zoneCodes, timestamps, durations = readTraceCache(cachePath)
+
+    return header["zoneNames"], header["zoneFiles"], zoneCodes, timestamps, durations
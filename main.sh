@@ -18,13 +18,14 @@ set -o errexit # Exit on error
 #### Main script ####
 # brief: This script is used to launch the full pipeline of performance testing for one specific commit or branch.
 #        It is parametrized by three files :
-#        - perf.scenes : List of  "${scene name} ${starting time step to record} ${nax time step} ${number of scene launch}
+#        - perf.scenes : List of  "${scene name} ${starting time step to record} ${nax time step} ${number of scene launch} [${timeout in seconds}]
 #        - default.timers : timers to be used for statistics for scenes that uses a DefaultAnimationLoop. It allows to
 #                           redefine the timer name using the syntax TimeNameInStats=TimerNameInSOFA. You can also use
-#                           simple addition and subtraction of timer names on the right-hand side
-#                           e.g : "CollisionDetection=CollisionEndEvent-CollisionBeginEvent"
+#                           expressions of timer names on the right-hand side (+, -, parentheses, constant scaling and
+#                           the selectors dur() and ts(), see generate_statistics/timer_expressions.py)
+#                           e.g : "CollisionDetection=ts(CollisionEndEvent)-ts(CollisionBeginEvent)-dur(CollisionEndEvent)"
 #                           or "ProjectAndMechaMap=ProjectAndPropagateDx+ProjectAndPropagateXAndV".
-#                           Subtraction uses timestamp and addition time spawn. This has been added to be able to have
+#                           dur() is the time spawn of each occurence (default) and ts() its timestamp. This has been added to be able to have
 #                           a unified notation between those timers an the ones from FreeMotionAnimaitonLoop scenes
 #        - freemotion.timers : Same than the last one but for scenes with FreeMotionAnimationLoop
 #
@@ -35,6 +36,11 @@ set -o errexit # Exit on error
 #
 # env:
 # - RO_GITHUB_TOKEN: a read only github token
+# - PR_RUN_SCENES_SLOTS (optional): number of scene executions run at once, each one pinned to its own CPUs (1 by default).
+#   With more than 1, the executions share the memory bandwidth, L3 and turbo and the CPU usage includes the other
+#   slots : the results are not comparable with the previous results (see run_scenes.py)
+# - PR_RUN_SCENES_EXPORT_WORKERS (optional): number of processes exporting the captures while the next scenes are running (0 by default, see run_scenes.py)
+# - PR_RUN_SCENES_CPUS_PER_SLOT, PR_RUN_SCENES_CPUS, PR_RUN_SCENES_TIMEOUT, PR_RUN_SCENES_TRACY_PORT ... : see generate_results/run_scenes.py
 #
 # outputs:
 # - log files in the folder $WORK_DIR/logs
@@ -88,13 +94,15 @@ echo "Calling '$SCRIPT_DIR/generate_results/run-scenes.sh $WORK_DIR $PR_SETUP_SO
 . $SCRIPT_DIR/generate_results/run-scenes.sh "$WORK_DIR" "$PR_SETUP_SOFA_BUILD" "$PR_SETUP_SOFA_SOURCES" "$SCRIPT_DIR/perf.scenes"
 echo ""
 
-# Exctract tracy datas into csv files
+# Exctract tracy datas into csv files (only the ones which have not been exported during the run by run_scenes.py)
 echo "Calling '$SCRIPT_DIR/generate_results/extract-results.sh $WORK_DIR $PR_RUN_SCENES_OUTPUT_DIR $PR_RUN_SCENES_TRACY_OUTPUT_DIR $SCRIPT_DIR/perf.scenes'"
 . $SCRIPT_DIR/generate_results/extract-results.sh "$WORK_DIR" "$PR_RUN_SCENES_OUTPUT_DIR" "$PR_RUN_SCENES_TRACY_OUTPUT_DIR" "$SCRIPT_DIR/perf.scenes"
 echo ""
 
 ##### GENERATE STATISTICS #####
 echo "Processing CSV files to compute statistics..."
+# Scenes and their executions are processed in parallel, one worker per core
+export PR_PROCESS_CSV_WORKERS=$(nproc)
 echo "Calling 'python3 $SCRIPT_DIR/generate_statistics/process_csv.py $WORK_DIR $PR_SETUP_SOFA_SOURCES $SCRIPT_DIR/perf.scenes $SCRIPT_DIR/default.timers $SCRIPT_DIR/freemotion.timers $PR_RUN_SCENES_OUTPUT_DIR $PR_EXTRACT_RESULTS_OUTPUT_DIR $PR_SETUP_FULL_HASH $BRANCH HIDDEN_RO_GITHUB_TOKEN  > process_csv.log 2>&1 '"
 python3 $SCRIPT_DIR/generate_statistics/process_csv.py "$WORK_DIR" "$PR_SETUP_SOFA_SOURCES" "$SCRIPT_DIR/perf.scenes" "$SCRIPT_DIR/default.timers" "$SCRIPT_DIR/freemotion.timers" "$PR_RUN_SCENES_OUTPUT_DIR" "$PR_EXTRACT_RESULTS_OUTPUT_DIR" "$PR_SETUP_FULL_HASH" "$BRANCH" "$RO_GITHUB_TOKEN" > $WORK_DIR/process_csv.log 2>&1
 echo "CSV files processed ! Stats are saved in file $PR_RUN_SCENES_OUTPUT_DIR/$PR_SETUP_FULL_HASH.csv"